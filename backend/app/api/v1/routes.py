@@ -1,28 +1,50 @@
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+import asyncio
+import json
+import os
+import time
+import uuid
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, Query
+from fastapi.responses import StreamingResponse
+from app.config import RENDER_PROGRESS_INTERVAL, PROJECTS_PAGE_SIZE, PROJECTS_MAX_PAGE_SIZE
 from app.service.gemini_script import generate_script
-from app.service.image_script import generate_image
-from app.service.audio_service import generate_voiceover, generate_subtitles, generate_subtitles_from_audio, upload_subtitles
-from app.service.video_service import create_slideshow_video, download_from_supabase_or_url
-from .shemas import ScriptRequest, SceneListResponse, SceneUpdateRequest
+from app.service.image_script import generate_image, generate_scene_images, provider_router
+from app.service.image_cache import get_image_cache_stats
+from app.service.asset_cache import get_asset_cache_stats
+from app.service.media_probe import get_probe_stats
+from app.service.audio_service import generate_scene_voiceovers, generate_subtitles, generate_subtitles_from_audio, upload_subtitles
+from app.service.job_queue import (
+    JOB_RENDER_VIDEO,
+    JOB_GENERATE_IMAGES,
+    enqueue_job,
+    get_latest_project_job,
+    get_queue_depth,
+    get_queue_position,
+)
+from .shemas import ScriptRequest, SceneListResponse, SceneUpdateRequest, SceneReorderRequest, SceneInsertRequest
 from app.db.supa_request import (
     create_project_with_scenes,
-    get_project,
-    get_project_scenes,
-    get_all_projects,
+    get_project_bundle,
+    get_projects_page,
+    count_projects,
     get_visual_promt_by_project,
     update_scene_image_url,
-    update_scene,
+    update_scenes_batch,
+    renumber_scenes,
+    reorder_scenes,
+    insert_scene,
     get_scenes_by_project,
     delete_project_by_id,
     update_voiceover_url,
     update_subtitle_url,
+    update_scene_audio,
     update_project_time,
-    update_final_video_url,
     update_render_status,
-    get_project_render_data,
-    supabase
+    get_db
 )
-from app.db.auth import get_current_user
+from app.service.storage_io import upload_file
+from app.service.project_events import get_event_bus, publish_project_event
+from app.db.auth import get_current_user, get_auth_stats
+from app.db.read_cache import get_read_cache_stats, invalidate
 
 router = APIRouter()
 
@@ -37,7 +59,7 @@ async def generate_script_endpoint(request: ScriptRequest,
         raise HTTPException(status_code=500, detail="Script generation failed")
 
     try:
-        project_id = create_project_with_scenes(
+        project_id = await create_project_with_scenes(
             script=result, 
             user_prompt=request.prompt,
             time=request.time, 
@@ -56,13 +78,38 @@ async def generate_script_endpoint(request: ScriptRequest,
 
 #ПОЛУЧЕНИЕ ПРОЕКТОВ
 @router.get("/projects")
-async def get_all_projects_endpoint(user_id: str = Depends(get_current_user)):
+async def get_all_projects_endpoint(
+    response: Response,
+    limit: int = Query(PROJECTS_PAGE_SIZE, ge=1, le=PROJECTS_MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    fields: str | None = None,
+    user_id: str = Depends(get_current_user)
+):
+    """
+    Страница проектов пользователя (новые первыми). Ответ - список, как и раньше;
+    курсор следующей страницы - в заголовке X-Next-Cursor (нет заголовка - страница последняя).
+    fields=id,title - только нужные колонки
+    """
     try:
-        projects = get_all_projects(user_id) 
-        return projects
+        requested = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+        projects, next_cursor = await get_projects_page(user_id, limit, cursor, requested)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to load projects: {str(e)}")
 
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return projects
+
+
+@router.get("/projects/count")
+async def count_projects_endpoint(user_id: str = Depends(get_current_user)):
+    try:
+        return {"count": await count_projects(user_id)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to count projects: {str(e)}")
+
 
 #ПОЛУЧЕНИЕ ПРОЕКТА
 @router.get("/projects/{project_id}")
@@ -70,11 +117,12 @@ async def get_project_endpoint(project_id: str, user_id: str = Depends(get_curre
     """
     ИЗМЕНЕНИЕ: Возвращает scenes на верхнем уровне с id и generated_image_url
     """
-    project = get_project(project_id)
+    #Проект и сцены - один запрос (сцены встроены через PostgREST)
+    project = await get_project_bundle(project_id, "detail")
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
-    scenes = get_project_scenes(project_id) or []
+    scenes = project.get("scenes") or []
 
     return {
         "id": project_id,
@@ -86,6 +134,7 @@ async def get_project_endpoint(project_id: str, user_id: str = Depends(get_curre
             "style": project.get("style") or "",   
             "duration": project.get("project_time") or 30 
         },
+        "image_generation": await _image_generation_status(project_id),
         "scenes": [
             {
                 "id": s.get("id"),
@@ -101,66 +150,83 @@ async def get_project_endpoint(project_id: str, user_id: str = Depends(get_curre
 
 
 #ГЕНЕРАЦИЯ ВСЕХ ИЗОБРАЖЕНИЙ
-async def _generate_images_background(project_id: str, scenes: list):
-    """Фоновая задача для генерации изображений"""
-    print(f"\n[BG_GENERATE_IMAGES] Starting background image generation for project: {project_id}")
-    print(f"[BG_GENERATE_IMAGES] Scenes to process: {len(scenes)}")
-
-    for idx, scene in enumerate(scenes):
-        scene_id = scene["id"]
-        promt = scene.get("visual_prompt")
-
-        print(f"\n[BG_GENERATE_IMAGES] === Scene {idx + 1}/{len(scenes)} ===")
-        print(f"[BG_GENERATE_IMAGES] Scene ID: {scene_id}")
-        print(f"[BG_GENERATE_IMAGES] Prompt: {promt[:100]}...")
-
-        try:
-            image_url = await generate_image(promt)
-            print(f"[BG_GENERATE_IMAGES] Generated URL: {image_url}")
-
-            update_scene_image_url(scene_id, image_url)
-            print(f"[BG_GENERATE_IMAGES] ✓ Scene {scene_id} updated in DB")
-
-        except Exception as e:
-            print(f"[BG_GENERATE_IMAGES] ✗ Error for scene {scene_id}: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            # Продолжаем со следующей сценой
-
-    print(f"\n[BG_GENERATE_IMAGES] ✓ Background generation completed for project {project_id}")
+async def _image_generation_status(project_id: str) -> dict | None:
+    """Прогресс последней задачи генерации изображений проекта (done/failed/pending)"""
+    #Очередь - SQLite с блокирующими вызовами, поэтому в отдельном потоке
+    job = await asyncio.to_thread(get_latest_project_job, project_id, JOB_GENERATE_IMAGES)
+    if not job:
+        return None
+
+    progress = job.get("progress") or {}
+    return {
+        "job_id": job["id"],
+        "job_status": job["status"],
+        "position": await asyncio.to_thread(get_queue_position, job),
+        "total": progress.get("total"),
+        "done": progress.get("done", 0),
+        "failed": progress.get("failed", 0),
+        "pending": progress.get("pending"),
+        #Клиент может прекращать polling, как только completed = True
+        "completed": job["status"] in ("completed", "error")
+    }
 
 
 @router.post("/generate-image/{project_id}")
 async def generate_images(
     project_id: str,
-    background_tasks: BackgroundTasks,
     user_id: str = Depends(get_current_user)
 ):
     """
-    Запускает генерацию изображений в фоне и сразу возвращает ответ.
+    Ставит генерацию изображений в очередь воркера и сразу возвращает ответ.
     Клиент должен использовать polling для получения обновлений.
     """
     print(f"\n[GENERATE_IMAGES] Received request for project: {project_id}")
 
-    scenes = get_visual_promt_by_project(project_id)
+    scenes = await get_visual_promt_by_project(project_id)
     print(f"[GENERATE_IMAGES] Found {len(scenes) if scenes else 0} scenes")
 
     if not scenes:
         raise HTTPException(status_code=404, detail="No scenes found for this project")
 
-    #Запускаем генерацию в фоне
-    background_tasks.add_task(_generate_images_background, project_id, scenes)
+    #Ставим генерацию в очередь воркера
+    job = await asyncio.to_thread(enqueue_job, JOB_GENERATE_IMAGES, project_id)
 
-    print(f"[GENERATE_IMAGES] Background task started, returning immediately")
+    print(f"[GENERATE_IMAGES] Job {job['id']} queued, returning immediately")
 
     return {
         "project_id": project_id,
+        "job_id": job["id"],
         "status": "started",
         "message": f"Image generation started for {len(scenes)} scenes",
         "total_scenes": len(scenes)
     }
 
 
+@router.get("/image-status/{project_id}")
+async def get_image_status_endpoint(project_id: str, user_id: str = Depends(get_current_user)):
+    """
+    Прогресс генерации изображений проекта: сколько сцен готово, упало и ожидает
+    """
+    status = await _image_generation_status(project_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="No image generation jobs for this project")
+
+    return {"project_id": project_id, **status}
+
+
+#МЕТРИКИ (в пределах процесса API)
+@router.get("/metrics")
+async def get_metrics_endpoint(user_id: str = Depends(get_current_user)):
+    return {
+        "image_cache": get_image_cache_stats(),
+        "image_providers": provider_router.stats(),
+        "auth": get_auth_stats(),
+        "read_cache": get_read_cache_stats(),
+        "asset_cache": get_asset_cache_stats(),
+        "media_probe": get_probe_stats()
+    }
+
+
 #ОБНОВЛЕНИЕ ОДНОЙ СЦЕНЫ
 @router.put("/scenes/{scene_id}")
 async def update_scene_endpoint(
@@ -179,7 +245,9 @@ async def update_scene_endpoint(
         if not filtered_updates:
             raise HTTPException(status_code=400, detail="No valid fields to update")
         
-        res = supabase.table("scenes").update(filtered_updates).eq("id", scene_id).execute()
+        db = await get_db()
+        res = await db.table("scenes").update(filtered_updates).eq("id", scene_id).execute()
+        await invalidate(f"scene:{scene_id}")
         
         if not res.data:
             raise HTTPException(status_code=404, detail="Scene not found")
@@ -201,21 +269,27 @@ async def regenerate_scene_endpoint(
 ):
     """
     НОВЫЙ РОУТ для перегенерации одной сцены.
-    Опционально: {"style": "pixel art"} для изменения стиля
+    Опционально: {"style": "pixel art"} для изменения стиля.
+    Перегенерация по умолчанию минует кэш по промпту (иначе вернулось бы то же изображение);
+    {"force": false} - разрешить взять изображение из кэша
     """
     try:
-        scene = supabase.table("scenes").select("visual_prompt").eq("id", scene_id).single().execute()
+        db = await get_db()
+        scene = await db.table("scenes").select("visual_prompt, project_id").eq("id", scene_id).single().execute()
         if not scene.data:
             raise HTTPException(status_code=404, detail="Scene not found")
         
         visual_prompt = scene.data.get("visual_prompt", "")
-        
-        #Если передан модификатор стиля
-        if request and request.get("style"):
-            visual_prompt = f"{request['style']}, {visual_prompt}"
-        
-        image_url = await generate_image(visual_prompt)
-        update_scene_image_url(scene_id, image_url)
+        request = request or {}
+
+        #Модификатор стиля (если передан) учитывается и в ключе кэша
+        image_url = await generate_image(
+            visual_prompt,
+            style=request.get("style"),
+            use_cache=not request.get("force", True)
+        )
+        await update_scene_image_url(scene_id, image_url)
+        await publish_project_event(scene.data["project_id"], "scene_image", {"scene_id": scene_id, "generated_image_url": image_url})
         
         return {
             "success": True,
@@ -246,7 +320,9 @@ async def update_project_metadata(
         if not filtered:
             raise HTTPException(status_code=400, detail="No valid fields to update")
         
-        res = supabase.table("projects").update(filtered).eq("id", project_id).eq("user_id", user_id).execute()
+        db = await get_db()
+        res = await db.table("projects").update(filtered).eq("id", project_id).eq("user_id", user_id).execute()
+        await invalidate(f"project:{project_id}")
         
         if not res.data:
             raise HTTPException(status_code=404, detail="Project not found or access denied")
@@ -265,7 +341,7 @@ async def update_project_metadata(
 async def get_project_scenes_legacy(project_id: str):
     """[DEPRECATED] Используйте GET /projects/{project_id}"""
     try:
-        scenes = get_scenes_by_project(str(project_id))
+        scenes = await get_scenes_by_project(str(project_id))
         if not scenes:
             raise HTTPException(status_code=404, detail="Scenes not found")
         return {"project_id": project_id, "scenes": scenes}
@@ -279,12 +355,12 @@ async def get_project_scenes_legacy(project_id: str):
 async def update_project_scenes(project_id: str, request: SceneUpdateRequest):
     """[DEPRECATED] Используйте PUT /scenes/{scene_id}"""
     try:
-        updated_scenes = []
-        for scene in request.scenes:
-            update_data = scene.dict(exclude_unset=True)
-            updated = update_scene(project_id, scene.scene_number, update_data)
-            updated_scenes.append(updated)
+        #Все сцены одним upsert, а не запрос на каждую
+        updates = [{**scene.dict(exclude_unset=True), "scene_number": scene.scene_number} for scene in request.scenes]
+        updated_scenes = await update_scenes_batch(project_id, updates)
         return {"message": "Scenes updated successfully", "updated_scenes": updated_scenes}
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update scenes: {str(e)}")
 
@@ -293,21 +369,25 @@ async def update_project_scenes(project_id: str, request: SceneUpdateRequest):
 async def regenerate_images(project_id: str, user_id: str = Depends(get_current_user)):
     """[DEPRECATED] Используйте POST /regenerate-scene/{scene_id}"""
     try:
-        scenes = get_visual_promt_by_project(project_id)
+        scenes = await get_visual_promt_by_project(project_id)
         if not scenes:
             raise HTTPException(status_code=404, detail="No scenes found")
         
-        result = []
-        for scene in scenes:
-            promt = scene.get("visual_prompt")
-            image_url = await generate_image(promt)
-            update_scene_image_url(scene["id"], image_url)
-            result.append({
+        #Генерируем все сцены параллельно, каждую сразу сохраняем в БД
+        async def on_scene_done(scene: dict, image_url: str):
+            await update_scene_image_url(scene["id"], image_url)
+            await publish_project_event(project_id, "scene_image", {"scene_id": scene["id"], "generated_image_url": image_url})
+
+        progress = await generate_scene_images(scenes, on_scene_done=on_scene_done)
+
+        result = [
+            {
                 "scene_id": scene["id"],
-                "promt": promt,
-                "generated_image_url": image_url
-            })
-        
+                "promt": scene.get("visual_prompt"),
+                "generated_image_url": progress["results"].get(scene["id"])
+            } for scene in scenes
+        ]
+
         return {"project_id": project_id, "scenes": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to regenerate images: {str(e)}")
@@ -321,7 +401,8 @@ async def delete_scene_endpoint(scene_id: str, user_id: str = Depends(get_curren
     """
     try:
         #Получаем сцену которую удаляем
-        scene_to_delete = supabase.table("scenes").select("*").eq("id", scene_id).execute()
+        db = await get_db()
+        scene_to_delete = await db.table("scenes").select("*").eq("id", scene_id).execute()
 
         if not scene_to_delete.data:
             raise HTTPException(status_code=404, detail="Scene not found")
@@ -330,17 +411,13 @@ async def delete_scene_endpoint(scene_id: str, user_id: str = Depends(get_curren
         project_id = scene_to_delete.data[0]["project_id"]
 
         #Удаляем сцену
-        supabase.table("scenes").delete().eq("id", scene_id).execute()
-
-        #Перенумеровываем все сцены с номером больше удалённой
-        remaining_scenes = supabase.table("scenes").select("*").eq("project_id", project_id).gt("scene_number", deleted_scene_number).execute()
+        await db.table("scenes").delete().eq("id", scene_id).execute()
 
-        for scene in remaining_scenes.data:
-            new_number = scene["scene_number"] - 1
-            supabase.table("scenes").update({"scene_number": new_number}).eq("id", scene["id"]).execute()
-            print(f"[DELETE_SCENE] Renumbered scene {scene['id']}: {scene['scene_number']} -> {new_number}")
+        #Перенумеровываем сцены после удалённой (один upsert на все)
+        renumbered = await renumber_scenes(project_id)
 
-        print(f"[DELETE_SCENE] Deleted scene {scene_id} and renumbered {len(remaining_scenes.data)} scenes")
+        await invalidate(f"scenes:{project_id}")
+        print(f"[DELETE_SCENE] Deleted scene {scene_id} (was #{deleted_scene_number}) and renumbered {renumbered} scenes")
 
         return {"success": True, "message": "Scene deleted successfully", "scene_id": scene_id}
 
@@ -350,11 +427,49 @@ async def delete_scene_endpoint(scene_id: str, user_id: str = Depends(get_curren
         raise HTTPException(status_code=500, detail=f"Failed to delete scene: {str(e)}")
 
 
+#ПОРЯДОК СЦЕН
+@router.put("/projects/{project_id}/scenes/order")
+async def reorder_scenes_endpoint(
+    project_id: str,
+    request: SceneReorderRequest,
+    user_id: str = Depends(get_current_user)
+):
+    """
+    Меняет порядок сцен. Принимает: {"scene_ids": [...]} - все сцены проекта в новом порядке
+    """
+    try:
+        scenes = await reorder_scenes(project_id, request.scene_ids)
+        return {"success": True, "project_id": project_id, "scenes": scenes}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to reorder scenes: {str(e)}")
+
+
+#ДОБАВЛЕНИЕ СЦЕНЫ
+@router.post("/projects/{project_id}/scenes")
+async def insert_scene_endpoint(
+    project_id: str,
+    request: SceneInsertRequest,
+    user_id: str = Depends(get_current_user)
+):
+    """
+    Вставляет сцену на место position, следующие сцены сдвигаются.
+    Принимает: {"position": 3, "action": "...", "dialogue": "...", "voice_over": "...", "visual_prompt": "..."}
+    """
+    try:
+        scene_data = request.dict(exclude_unset=True, exclude={"position"})
+        scene = await insert_scene(project_id, request.position, scene_data)
+        return {"success": True, "project_id": project_id, "scene": scene}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to insert scene: {str(e)}")
+
+
 ##Delete project by project_id
 @router.delete("/projects/{project_id}")
 async def delete_project_endpoint(project_id: str, user_id: str = Depends(get_current_user)):
 
-    res = delete_project_by_id(project_id)
+    res = await delete_project_by_id(project_id)
 
     if not res:
         raise HTTPException(status_code=404, detail="Project not found or already deleted")
@@ -373,164 +488,107 @@ async def generate_voiceover_endpoint(
     Генерирует озвучку для проекта на основе voice_over полей сцен
     """
     try:
-        #Получаем все сцены проекта
-        scenes = get_project_scenes(project_id)
+        #Получаем все сцены проекта (вместе с проектом, одним запросом)
+        project = await get_project_bundle(project_id, "render")
+        scenes = project.get("scenes") if project else None
 
         if not scenes:
             raise HTTPException(status_code=404, detail="No scenes found for this project")
 
         #Обновляем статус
-        update_render_status(project_id, "generating_audio")
-
-        #Собираем текст для озвучки из voice_over И dialogue полей
-        #Порядок: сначала voice_over (закадровый голос), потом dialogue (реплики персонажей)
-        #Между ними добавляем паузу
-        voiceover_parts = []
-
-        for scene in sorted(scenes, key=lambda x: x.get("scene_number", 0)):
-            scene_text = []
-
-            #Закадровый голос
-            voice_over = scene.get("voice_over", "").strip()
-            if voice_over:
-                scene_text.append(voice_over)
-
-            #Диалоги персонажей (после паузы)
-            dialogue = scene.get("dialogue", "").strip()
-            if dialogue:
-                #Добавляем небольшую паузу перед диалогом если есть закадровый текст
-                if voice_over:
-                    scene_text.append("...")  # Пауза ~0.5 сек в TTS
-                scene_text.append(dialogue)
-
-            #Объединяем текст сцены
-            if scene_text:
-                voiceover_parts.append(" ".join(scene_text))
-
-        if not voiceover_parts:
-            raise HTTPException(status_code=400, detail="No voice_over or dialogue text found in scenes")
+        await update_render_status(project_id, "generating_audio")
+        await publish_project_event(project_id, "render_status", {"render_status": "generating_audio"})
 
-        #Объединяем весь текст с паузами между сценами
-        full_text = ". ".join(voiceover_parts)
-
-        #Генерируем озвучку
-        voiceover_url = await generate_voiceover(full_text, lang="ru")
-
-        #Сохраняем URL в БД
-        update_voiceover_url(project_id, voiceover_url)
-
-        #Получаем реальную длительность аудио для точных субтитров
-        #Скачиваем аудио и определяем длительность
-        print(f"[VOICEOVER] Getting audio duration for subtitles...")
-        from app.service.video_service import download_from_supabase_or_url, get_audio_duration
-        import tempfile
-        import os
+        #Озвучка по сценам: клипы синтезируются параллельно, неизменённые сцены берутся из storage,
+        #затем склеиваются без перекодирования
+        try:
+            voiceover = await generate_scene_voiceovers(project_id, scenes, lang="ru")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        full_text = voiceover["text"]
+        artifact = voiceover["artifact"]
+        audio_path = artifact["path"]
+        actual_duration = artifact["duration"]
+
+        #Загрузка дорожки и выравнивание субтитров (Whisper) идут одновременно по одному локальному файлу
+        upload_task = asyncio.create_task(
+            upload_file(audio_path, f"voiceover_{project_id}_{uuid.uuid4()}.m4a", "audio/mp4")
+        )
+        #ИСПОЛЬЗУЕМ WHISPER для точных таймкодов + исходный текст (БЕЗ ошибок распознавания!)
+        #Whisper работает в выделенном потоке модели (event loop не блокируется)
+        print(f"[VOICEOVER] Generating subtitles with Whisper timing + original text...")
+        subtitles_task = asyncio.create_task(generate_subtitles_from_audio(audio_path, original_text=full_text))
 
         try:
-            audio_content = download_from_supabase_or_url(voiceover_url)
-            audio_temp = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
-            audio_temp.write(audio_content)
-            audio_temp.close()
+            #Сохраняем точные offset/длительность каждой сцены для таймингов слайдов
+            timings = {timing["scene_id"]: timing for timing in voiceover["scenes"]}
+            updates = []
+            for scene in scenes:
+                timing = timings.get(scene["id"])
+                if timing:
+                    updates.append(update_scene_audio(scene["id"], {k: v for k, v in timing.items() if k != "scene_id"}))
+                elif scene.get("audio_offset") is not None:
+                    #Сцена без текста - в общей дорожке её нет
+                    updates.append(update_scene_audio(scene["id"], {"audio_offset": None, "audio_duration": None}))
 
-            #Получаем длительность
-            actual_duration = get_audio_duration(audio_temp.name)
+            #Обновляем project_time в базе
             print(f"[VOICEOVER] Audio duration: {actual_duration}s")
+            await asyncio.gather(*updates, update_project_time(project_id, actual_duration))
 
-            #Обновляем project_time в базе
-            update_project_time(project_id, actual_duration)
+            voiceover_url = await upload_task
+            await update_voiceover_url(project_id, voiceover_url)
+            await publish_project_event(project_id, "voiceover", {"voiceover_url": voiceover_url, "duration": actual_duration})
 
-            #ИСПОЛЬЗУЕМ WHISPER для точных таймкодов + исходный текст (БЕЗ ошибок распознавания!)
-            print(f"[VOICEOVER] Generating subtitles with Whisper timing + original text...")
-            srt_content = generate_subtitles_from_audio(audio_temp.name, original_text=full_text)
+            srt_content = await subtitles_task
 
             #Если Whisper не сработал - используем fallback
             if not srt_content:
                 print(f"[VOICEOVER] Whisper failed, using fallback subtitle generation")
                 srt_content = generate_subtitles(full_text, actual_duration)
-
-            #Теперь удаляем временный файл
-            os.unlink(audio_temp.name)
-
-        except Exception as e:
-            print(f"[VOICEOVER] Warning: Could not get audio duration: {str(e)}, using default")
-            actual_duration = 30.0
-            #Fallback - простая генерация субтитров
-            srt_content = generate_subtitles(full_text, actual_duration)
+        finally:
+            #Файл удаляется только после того, как обе задачи его отпустили
+            for task in (upload_task, subtitles_task):
+                task.cancel()
+            await asyncio.gather(upload_task, subtitles_task, return_exceptions=True)
+            if os.path.exists(audio_path):
+                os.unlink(audio_path)
 
         #Загружаем субтитры
         subtitle_url = await upload_subtitles(srt_content, project_id)
-        update_subtitle_url(project_id, subtitle_url)
+        await update_subtitle_url(project_id, subtitle_url)
+        await publish_project_event(project_id, "subtitles", {"subtitle_url": subtitle_url})
 
         return {
             "success": True,
             "project_id": project_id,
             "voiceover_url": voiceover_url,
-            "subtitle_url": subtitle_url
+            "subtitle_url": subtitle_url,
+            "duration": actual_duration,
+            "synthesized_scenes": voiceover["synthesized"]
         }
 
     except HTTPException:
         raise
     except Exception as e:
-        update_render_status(project_id, "error")
+        await update_render_status(project_id, "error")
+        await publish_project_event(project_id, "render_status", {"render_status": "error", "error": str(e)})
         raise HTTPException(status_code=500, detail=f"Failed to generate voiceover: {str(e)}")
 
 
-async def _render_video_background(
-    project_id: str,
-    scenes_with_images: list,
-    voiceover_url: str,
-    subtitle_content: str,
-    duration: float,
-    background_style: str
-):
-    """
-    Фоновая задача для рендеринга видео
-    """
-    print(f"[RENDER_BG] Starting background render for project: {project_id}")
-    print(f"[RENDER_BG] Scenes count: {len(scenes_with_images)}")
-    print(f"[RENDER_BG] Voiceover URL: {voiceover_url}")
-    print(f"[RENDER_BG] Background style: {background_style}")
-    print(f"[RENDER_BG] Duration: {duration}")
-
-    try:
-        #Создаем видео
-        print(f"[RENDER_BG] Calling create_slideshow_video...")
-        video_url = await create_slideshow_video(
-            scenes=scenes_with_images,
-            voiceover_url=voiceover_url,
-            subtitle_content=subtitle_content,
-            total_duration=duration,
-            background_style=background_style
-        )
-
-        print(f"[RENDER_BG] Video created successfully: {video_url}")
-
-        #Сохраняем URL видео
-        update_final_video_url(project_id, video_url)
-        update_render_status(project_id, "completed")
-        print(f"[RENDER_BG] Render completed!")
-
-    except Exception as e:
-        print(f"[RENDER_BG] Background render error: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        update_render_status(project_id, "error")
-
-
 @router.post("/render-video/{project_id}")
 async def render_video_endpoint(
     project_id: str,
-    background_tasks: BackgroundTasks,
     settings: dict = {},
     user_id: str = Depends(get_current_user)
 ):
     """
-    Запускает рендеринг видео в фоновой задаче и сразу возвращает ответ
+    Ставит рендеринг видео в очередь воркера и сразу возвращает ответ
     """
     try:
-        #Получаем проект и сцены
-        project = get_project(project_id)
-        scenes = get_project_scenes(project_id)
+        #Получаем сцены
+        project = await get_project_bundle(project_id, "render")
+        scenes = project.get("scenes") if project else None
 
         if not scenes:
             raise HTTPException(status_code=404, detail="No scenes found")
@@ -541,49 +599,34 @@ async def render_video_endpoint(
         if not scenes_with_images:
             raise HTTPException(status_code=400, detail="No generated images found. Please generate images first.")
 
-        #Обновляем статус
-        update_render_status(project_id, "rendering_video")
-
-        #Получаем данные рендера
-        render_data = get_project_render_data(project_id)
-        voiceover_url = render_data.get("voiceover_url")
-        subtitle_url = render_data.get("subtitle_url")
-        duration = render_data.get("project_time", 30.0)
-
         #Получаем background из настроек
         background_style = settings.get("background", "minecraft")
 
-        #Загружаем субтитры если есть
-        subtitle_content = None
-        if subtitle_url:
-            try:
-                subtitle_bytes = download_from_supabase_or_url(subtitle_url)
-                subtitle_content = subtitle_bytes.decode('utf-8')
-            except Exception as e:
-                print(f"Warning: Could not download subtitles: {str(e)}")
-
-        #Запускаем рендеринг в фоне
-        background_tasks.add_task(
-            _render_video_background,
-            project_id=project_id,
-            scenes_with_images=scenes_with_images,
-            voiceover_url=voiceover_url,
-            subtitle_content=subtitle_content,
-            duration=duration,
-            background_style=background_style
-        )
+        #Ставим рендеринг в очередь (данные проекта воркер прочитает сам)
+        job = await asyncio.to_thread(enqueue_job, JOB_RENDER_VIDEO, project_id, {"background": background_style})
+        queue_position = await asyncio.to_thread(get_queue_position, job)
+
+        #Обновляем статус
+        await update_render_status(project_id, "rendering_video")
+        await publish_project_event(project_id, "render_status", {
+            "render_status": "rendering_video",
+            "job_id": job["id"],
+            "queue_position": queue_position
+        })
 
         #Сразу возвращаем ответ
         return {
             "success": True,
             "project_id": project_id,
+            "job_id": job["id"],
+            "queue_position": queue_position,
             "message": "Rendering started. Check status at /render-status/{project_id}"
         }
 
     except HTTPException:
         raise
     except Exception as e:
-        update_render_status(project_id, "error")
+        await update_render_status(project_id, "error")
         raise HTTPException(status_code=500, detail=f"Failed to start rendering: {str(e)}")
 
 
@@ -596,16 +639,137 @@ async def get_render_status_endpoint(
     Получает статус рендеринга проекта
     """
     try:
-        render_data = get_project_render_data(project_id)
+        render_data = await get_project_bundle(project_id, "status") or {}
+
+        #Состояние задачи рендера в очереди
+        job = await asyncio.to_thread(get_latest_project_job, project_id, JOB_RENDER_VIDEO)
+        queue = {
+            "job_id": job["id"] if job else None,
+            "job_status": job["status"] if job else None,
+            "position": await asyncio.to_thread(get_queue_position, job),
+            "queue_depth": await asyncio.to_thread(get_queue_depth, JOB_RENDER_VIDEO),
+            "error": job.get("error") if job else None,
+            #Стадия, процент, скорость кодирования (fps) и ETA из вывода ffmpeg
+            "progress": job.get("progress") if job else None
+        }
 
         return {
             "project_id": project_id,
             "render_status": render_data.get("render_status"),
             "voiceover_url": render_data.get("voiceover_url"),
             "subtitle_url": render_data.get("subtitle_url"),
-            "final_video_url": render_data.get("final_video_url")
+            "final_video_url": render_data.get("final_video_url"),
+            "queue": queue
         }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get render status: {str(e)}")
 
+
+
+#ПРОГРЕСС РЕНДЕРА (Server-Sent Events вместо polling /render-status)
+SSE_KEEPALIVE_SECONDS = 15
+
+
+def _sse(event: str, data: dict, event_id: int = None) -> str:
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.get("/render-progress/{project_id}")
+async def render_progress_stream(
+    project_id: str,
+    request: Request,
+    user_id: str = Depends(get_current_user)
+):
+    """
+    Поток событий рендера проекта (text/event-stream)
+
+    event: progress - состояние задачи и прогресс кодирования при каждом изменении
+    event: done - итог (render_status, final_video_url, error), после него поток закрывается
+    """
+    async def events():
+        last_state = None
+        last_sent = time.monotonic()
+
+        while not await request.is_disconnected():
+            job = await asyncio.to_thread(get_latest_project_job, project_id, JOB_RENDER_VIDEO)
+            state = {
+                "job_id": job["id"] if job else None,
+                "job_status": job["status"] if job else None,
+                "position": await asyncio.to_thread(get_queue_position, job),
+                "progress": job.get("progress") if job else None,
+            }
+            if state != last_state:
+                yield _sse("progress", state)
+                last_state, last_sent = state, time.monotonic()
+            elif time.monotonic() - last_sent > SSE_KEEPALIVE_SECONDS:
+                #Комментарий SSE, чтобы прокси не закрывали "молчащее" соединение
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+
+            if not job or job["status"] in ("completed", "error"):
+                render_data = await get_project_bundle(project_id, "status") or {}
+                yield _sse("done", {
+                    "render_status": render_data.get("render_status"),
+                    "final_video_url": render_data.get("final_video_url"),
+                    "error": job.get("error") if job else None
+                })
+                return
+
+            await asyncio.sleep(RENDER_PROGRESS_INTERVAL)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+#СОБЫТИЯ ПРОЕКТА (Server-Sent Events): изображения сцен, озвучка/субтитры, статусы и прогресс рендера
+@router.get("/projects/{project_id}/events")
+async def project_events_stream(
+    project_id: str,
+    request: Request,
+    user_id: str = Depends(get_current_user)
+):
+    """
+    Поток событий проекта (text/event-stream) вместо polling /projects/{id} и /render-status
+
+    События: scene_image, image_progress, images_completed, voiceover, subtitles,
+    render_status, render_progress. При переподключении браузер присылает Last-Event-ID -
+    пропущенные события отдаются из хранилища событий
+    """
+    last_event_id = request.headers.get("last-event-id")
+    last_event_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+
+    async def events():
+        subscription = get_event_bus().subscribe(project_id, last_event_id=last_event_id)
+        next_event = None
+        try:
+            yield ": connected\n\n"
+            while not await request.is_disconnected():
+                if next_event is None:
+                    next_event = asyncio.ensure_future(subscription.__anext__())
+                done, _ = await asyncio.wait({next_event}, timeout=SSE_KEEPALIVE_SECONDS)
+                if not done:
+                    #Комментарий SSE, чтобы прокси не закрывали "молчащее" соединение
+                    yield ": keep-alive\n\n"
+                    continue
+                event = next_event.result()
+                next_event = None
+                yield _sse(event["type"], event["data"], event_id=event["id"])
+        finally:
+            if next_event is not None:
+                next_event.cancel()
+                try:
+                    await next_event
+                except (asyncio.CancelledError, StopAsyncIteration):
+                    pass
+            await subscription.aclose()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -35,4 +35,14 @@ class SceneListResponse(BaseModel):
 class SceneUpdateRequest(BaseModel):
     project_id: str
     scenes: List[SceneUpdate]
+
+class SceneReorderRequest(BaseModel):
+    scene_ids: List[str] = Field(..., min_length=1, description="Все сцены проекта в новом порядке")
+
+class SceneInsertRequest(BaseModel):
+    position: int = Field(ge = 1, description="Номер, который получит новая сцена (следующие сдвигаются)")
+    action: Optional[str] = None
+    dialogue: Optional[str] = None
+    voice_over: Optional[str] = None
+    visual_prompt: Optional[str] = None
     
\ No newline at end of file
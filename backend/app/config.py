@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -6,3 +7,104 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 HUGGING_FACE_API_KEY = os.getenv("HUGGING_FACE_API_KEY")
+
+# Локальная проверка access token Supabase: JWKS проекта (RS256/ES256) или секрет (HS256, legacy)
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+AUTH_JWKS_CACHE_SECONDS = int(os.getenv("AUTH_JWKS_CACHE_SECONDS", "600"))
+# Сколько секунд проверенный токен не проверяется повторно (не дольше его exp)
+AUTH_TOKEN_CACHE_SECONDS = int(os.getenv("AUTH_TOKEN_CACHE_SECONDS", "60"))
+AUTH_TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_TOKEN_CACHE_MAX_ENTRIES", "10000"))
+
+# Локальная директория для служебных данных (очередь задач и т.п.)
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(tempfile.gettempdir(), "storyteller"))
+os.makedirs(DATA_DIR, exist_ok=True)
+
+# Очередь фоновых задач (SQLite файл, переживает перезапуск)
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", os.path.join(DATA_DIR, "jobs.sqlite3"))
+# Сколько секунд задача может не присылать heartbeat, прежде чем её вернут в очередь
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+# Количество процессов воркера: рендер (ffmpeg) ограничиваем бюджетом CPU
+# 0 = автоматически по ядрам и памяти (render_scheduler.max_concurrent_renders)
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "0"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "1"))
+
+# Параллельная генерация изображений: сколько сцен обрабатывается одновременно
+# и сколько одновременных запросов допускается к одному провайдеру
+IMAGE_SCENE_CONCURRENCY = int(os.getenv("IMAGE_SCENE_CONCURRENCY", "4"))
+IMAGE_PROVIDER_CONCURRENCY = int(os.getenv("IMAGE_PROVIDER_CONCURRENCY", "2"))
+
+# Маршрутизатор провайдеров изображений (circuit breaker)
+PROVIDER_STATS_WINDOW = int(os.getenv("PROVIDER_STATS_WINDOW", "20"))
+PROVIDER_FAILURE_THRESHOLD = int(os.getenv("PROVIDER_FAILURE_THRESHOLD", "3"))
+PROVIDER_OPEN_SECONDS = float(os.getenv("PROVIDER_OPEN_SECONDS", "30"))
+PROVIDER_MAX_OPEN_SECONDS = float(os.getenv("PROVIDER_MAX_OPEN_SECONDS", "900"))
+
+# Кэш сгенерированных изображений по хэшу промпта
+IMAGE_CACHE_ENABLED = os.getenv("IMAGE_CACHE_ENABLED", "true").lower() == "true"
+IMAGE_CACHE_MAX_ENTRIES = int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", "1000"))
+IMAGE_CACHE_TTL_SECONDS = int(os.getenv("IMAGE_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+
+# Whisper (faster-whisper) для таймкодов субтитров
+WHISPER_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "tiny")
+WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+WHISPER_CPU_THREADS = int(os.getenv("WHISPER_CPU_THREADS", "0"))  # 0 = автоматически
+WHISPER_PRELOAD = os.getenv("WHISPER_PRELOAD", "false").lower() == "true"
+
+# Озвучка: сколько сцен синтезируется одновременно (gTTS - сетевые запросы)
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", "4"))
+# Обработка озвучки одним проходом ffmpeg (темп, нормализация громкости, обрезка тишины) сразу в AAC/m4a:
+# битрейт AAC и целевая громкость loudnorm (LUFS)
+TTS_AUDIO_BITRATE = os.getenv("TTS_AUDIO_BITRATE", "96k")
+TTS_LOUDNESS_TARGET = float(os.getenv("TTS_LOUDNESS_TARGET", "-16"))
+
+# Сегментный рендер: каждая сцена кодируется отдельным сегментом и кэшируется по хэшу содержимого
+SEGMENT_RENDER_ENABLED = os.getenv("SEGMENT_RENDER_ENABLED", "true").lower() == "true"
+SEGMENT_CACHE_DIR = os.getenv("SEGMENT_CACHE_DIR", os.path.join(DATA_DIR, "segments"))
+SEGMENT_CACHE_MAX_BYTES = int(os.getenv("SEGMENT_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+SEGMENT_RENDER_CONCURRENCY = int(os.getenv("SEGMENT_RENDER_CONCURRENCY", "2"))
+
+# Локальный кэш скачанных ассетов (изображения, озвучка, субтитры): по содержимому, с LRU по размеру
+ASSET_CACHE_ENABLED = os.getenv("ASSET_CACHE_ENABLED", "true").lower() == "true"
+ASSET_CACHE_DIR = os.getenv("ASSET_CACHE_DIR", os.path.join(DATA_DIR, "assets"))
+ASSET_CACHE_MAX_BYTES = int(os.getenv("ASSET_CACHE_MAX_BYTES", str(1024 ** 3)))
+
+# Планировщик рендера: цель кодирования ("speed" - быстрее, "size" - меньший файл),
+# потоки ffmpeg на рендер (0 = делить ядра между активными рендерами),
+# оценка памяти на один рендер и минимальный таймаут ffmpeg
+RENDER_TARGET = os.getenv("RENDER_TARGET", "speed")
+RENDER_THREADS = int(os.getenv("RENDER_THREADS", "0"))
+RENDER_MEMORY_PER_JOB_MB = int(os.getenv("RENDER_MEMORY_PER_JOB_MB", "700"))
+RENDER_MIN_TIMEOUT = int(os.getenv("RENDER_MIN_TIMEOUT", "300"))
+
+# Предзагрузка ассетов рендера: одновременные скачивания и потоки подготовки изображений (PIL)
+RENDER_PREFETCH_CONCURRENCY = int(os.getenv("RENDER_PREFETCH_CONCURRENCY", "8"))
+RENDER_PREPARE_THREADS = int(os.getenv("RENDER_PREPARE_THREADS", "2"))
+
+# Прогресс рендера: не чаще одного обновления в RENDER_PROGRESS_INTERVAL секунд
+RENDER_PROGRESS_INTERVAL = float(os.getenv("RENDER_PROGRESS_INTERVAL", "1.0"))
+
+# События проектов (SSE): "sqlite" - общий для API и воркеров файл, "memory" - в пределах процесса
+PROJECT_EVENTS_BACKEND = os.getenv("PROJECT_EVENTS_BACKEND", "sqlite")
+PROJECT_EVENTS_PATH = os.getenv("PROJECT_EVENTS_PATH", os.path.join(DATA_DIR, "events.sqlite3"))
+PROJECT_EVENTS_POLL_INTERVAL = float(os.getenv("PROJECT_EVENTS_POLL_INTERVAL", "0.5"))
+PROJECT_EVENTS_RETENTION_SECONDS = int(os.getenv("PROJECT_EVENTS_RETENTION_SECONDS", "3600"))
+
+# Read-through кэш проектов и сцен: LRU в памяти процесса + общий SQLite для API и воркеров
+READ_CACHE_ENABLED = os.getenv("READ_CACHE_ENABLED", "true").lower() == "true"
+READ_CACHE_TTL_SECONDS = int(os.getenv("READ_CACHE_TTL_SECONDS", "30"))
+READ_CACHE_MAX_ENTRIES = int(os.getenv("READ_CACHE_MAX_ENTRIES", "2000"))
+READ_CACHE_SHARED = os.getenv("READ_CACHE_SHARED", "true").lower() == "true"
+READ_CACHE_PATH = os.getenv("READ_CACHE_PATH", os.path.join(DATA_DIR, "read_cache.sqlite3"))
+# Как часто процесс применяет инвалидации, сделанные другими процессами (секунды)
+READ_CACHE_SYNC_INTERVAL = float(os.getenv("READ_CACHE_SYNC_INTERVAL", "0.5"))
+
+# Список проектов: размер страницы по умолчанию и максимальный (keyset-пагинация)
+PROJECTS_PAGE_SIZE = int(os.getenv("PROJECTS_PAGE_SIZE", "50"))
+PROJECTS_MAX_PAGE_SIZE = int(os.getenv("PROJECTS_MAX_PAGE_SIZE", "200"))
+
+# Библиотека фоновых видео: заранее перекодированные в 720x1280/30fps сегменты с индексом
+BACKGROUND_LIBRARY_DIR = os.getenv("BACKGROUND_LIBRARY_DIR", os.path.join(DATA_DIR, "backgrounds"))
+BACKGROUND_SEGMENT_SECONDS = int(os.getenv("BACKGROUND_SEGMENT_SECONDS", "2"))
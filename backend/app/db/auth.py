@@ -1,32 +1,191 @@
+"""
+Аутентификация запросов по access token Supabase
+
+Токен проверяется локально (PyJWT): подпись, срок действия и audience.
+- асимметричные ключи (RS256/ES256) берутся из JWKS проекта и кэшируются;
+- HS256 (legacy) проверяется секретом SUPABASE_JWT_SECRET, если он задан.
+Проверенные токены кэшируются на короткое время. Запрос к Supabase Auth
+(auth.get_user) остаётся запасным путём - только когда ключ подписи неизвестен.
+"""
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import jwt
 from fastapi import Header, HTTPException, Depends
-from supabase import create_client
-from app.config import SUPABASE_URL, SUPABASE_KEY 
+from app.config import (
+    SUPABASE_URL,
+    SUPABASE_JWT_SECRET,
+    SUPABASE_JWT_AUDIENCE,
+    AUTH_JWKS_CACHE_SECONDS,
+    AUTH_TOKEN_CACHE_SECONDS,
+    AUTH_TOKEN_CACHE_MAX_ENTRIES,
+)
+from app.db.supa_request import get_db
+from app.service.http_client import get_http_client
+
+ASYMMETRIC_ALGORITHMS = ("RS256", "ES256")
+
+# Неизвестный kid не должен превращаться в запрос JWKS на каждый запрос
+JWKS_MIN_REFRESH_SECONDS = 30
+
+# kid -> ключ; время последней загрузки JWKS
+_jwks: Dict[str, jwt.PyJWK] = {}
+_jwks_loaded_at = 0.0
+
+# sha256(token) -> (user_id, действителен до)
+_verified: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+_stats = {
+    "cache_hits": 0,
+    "local_verified": 0,
+    "remote_verified": 0,
+    "rejected": 0,
+    "jwks_refreshes": 0,
+}
+
+
+async def _refresh_jwks(force: bool = False):
+    global _jwks, _jwks_loaded_at
+
+    age = time.monotonic() - _jwks_loaded_at
+    if _jwks_loaded_at and age < (JWKS_MIN_REFRESH_SECONDS if force else AUTH_JWKS_CACHE_SECONDS):
+        return
+
+    _jwks_loaded_at = time.monotonic()
+    try:
+        response = await get_http_client().get(f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json", timeout=10)
+        response.raise_for_status()
+        keys = {}
+        for key in response.json().get("keys", []):
+            if key.get("kid") and key.get("alg") in ASYMMETRIC_ALGORITHMS:
+                keys[key["kid"]] = jwt.PyJWK(key)
+        _jwks = keys
+        _stats["jwks_refreshes"] += 1
+        print(f"[AUTH] JWKS loaded: {len(keys)} signing keys")
+    except Exception as e:
+        print(f"[AUTH] Failed to load JWKS: {str(e)}")
+
+
+async def _signing_key(header: dict):
+    """Ключ проверки подписи по заголовку токена или None, если ключ неизвестен"""
+    algorithm = header.get("alg")
+
+    if algorithm == "HS256":
+        return SUPABASE_JWT_SECRET or None
+
+    if algorithm in ASYMMETRIC_ALGORITHMS:
+        kid = header.get("kid")
+        await _refresh_jwks()
+        if kid not in _jwks:
+            # Ключи могли смениться (ротация) - перечитываем JWKS
+            await _refresh_jwks(force=True)
+        key = _jwks.get(kid)
+        return key.key if key else None
+
+    return None
+
+
+async def verify_token_locally(token: str) -> Optional[dict]:
+    """
+    Проверяет токен без обращения к Supabase Auth
+
+    Returns:
+        dict | None: Claims токена или None, если ключ подписи неизвестен (нужна удалённая проверка)
+
+    Raises:
+        jwt.InvalidTokenError: Токен недействителен (подпись, срок, audience)
+    """
+    header = jwt.get_unverified_header(token)
+    key = await _signing_key(header)
+    if key is None:
+        return None
+
+    return jwt.decode(
+        token,
+        key,
+        algorithms=[header["alg"]],
+        audience=SUPABASE_JWT_AUDIENCE,
+        options={"require": ["exp", "sub"]},
+    )
+
+
+def _cache_get(token_hash: str) -> Optional[str]:
+    entry = _verified.get(token_hash)
+    if not entry:
+        return None
+    user_id, valid_until = entry
+    if time.time() >= valid_until:
+        _verified.pop(token_hash, None)
+        return None
+    _verified.move_to_end(token_hash)
+    return user_id
+
+
+def _cache_put(token_hash: str, user_id: str, expires_at: Optional[float]):
+    valid_until = time.time() + AUTH_TOKEN_CACHE_SECONDS
+    if expires_at:
+        # Токен не должен пережить в кэше собственный срок действия
+        valid_until = min(valid_until, expires_at)
+    _verified[token_hash] = (user_id, valid_until)
+    _verified.move_to_end(token_hash)
+    while len(_verified) > AUTH_TOKEN_CACHE_MAX_ENTRIES:
+        _verified.popitem(last=False)
+
+
+async def _verify_remote(token: str) -> str:
+    """Проверка токена через Supabase Auth (сетевой запрос)"""
+    db = await get_db()
+    user_response = await db.auth.get_user(token)
+
+    if not user_response.user or not user_response.user.id:
+        raise HTTPException(status_code=401, detail="Invalid token or user not found")
+
+    return user_response.user.id
 
-#Инициализируем Supabase клиент для верификации токена
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY) 
 
 async def get_current_user(authorization: str = Header(None)) -> str:
     """
     Dependency Injection для FastAPI.
-    Извлекает токен из заголовка 'Authorization', проверяет его через Supabase.
-    Возвращает user_id (UUID), если токен валиден.
+    Извлекает токен из заголовка 'Authorization' и проверяет его (локально по JWKS/секрету,
+    при неизвестном ключе - через Supabase). Возвращает user_id (UUID), если токен валиден.
     """
     if not authorization or not authorization.startswith("Bearer "):
         #Этого не должно случиться, если фронтенд работает правильно
         raise HTTPException(status_code=401, detail="Bearer token required")
 
     token = authorization.split(" ")[1]
+    token_hash = hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    user_id = _cache_get(token_hash)
+    if user_id:
+        _stats["cache_hits"] += 1
+        return user_id
 
     try:
-        #Проверяем токен через встроенный API Supabase
-        user_response = supabase.auth.get_user(token)
-        
-        if not user_response.user or not user_response.user.id:
-            raise HTTPException(status_code=401, detail="Invalid token or user not found")
-            
-        return user_response.user.id
-        
+        claims = await verify_token_locally(token)
+        if claims is not None:
+            _stats["local_verified"] += 1
+            _cache_put(token_hash, claims["sub"], claims.get("exp"))
+            return claims["sub"]
+
+        #Ключ подписи неизвестен - проверяем через встроенный API Supabase
+        user_id = await _verify_remote(token)
+        _stats["remote_verified"] += 1
+        unverified = jwt.decode(token, options={"verify_signature": False})
+        _cache_put(token_hash, user_id, unverified.get("exp"))
+        return user_id
+
+    except HTTPException:
+        _stats["rejected"] += 1
+        raise
     except Exception as e:
         #В случае ошибки верификации (например, токен истек)
+        _stats["rejected"] += 1
         print(f"Auth error: {e}")
-        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
\ No newline at end of file
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+
+
+def get_auth_stats() -> dict:
+    """Счётчики проверки токенов (для /metrics)"""
+    return {**_stats, "cached_tokens": len(_verified), "jwks_keys": len(_jwks)}
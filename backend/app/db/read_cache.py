@@ -0,0 +1,350 @@
+"""
+Read-through кэш чтений проектов и сцен (get_project_bundle, get_projects_page, count_projects)
+
+Записи помечаются тегами (project:{id}, scenes:{project_id}, scene:{id}, user:{id}),
+и каждая запись в Supabase инвалидирует свои теги: например, обновление картинки сцены
+(scene:{id}) сбрасывает закэшированный список сцен, в котором эта сцена есть.
+
+Два уровня:
+    1. LRU в памяти процесса с TTL
+    2. Общий SQLite файл (READ_CACHE_SHARED) - для API и процессов воркера. Инвалидации
+       пишутся в журнал, и каждый процесс применяет чужие инвалидации к своему LRU
+       не реже раза в READ_CACHE_SYNC_INTERVAL секунд
+"""
+import asyncio
+import copy
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from app.config import (
+    READ_CACHE_ENABLED,
+    READ_CACHE_TTL_SECONDS,
+    READ_CACHE_MAX_ENTRIES,
+    READ_CACHE_SHARED,
+    READ_CACHE_PATH,
+    READ_CACHE_SYNC_INTERVAL,
+)
+from app.db.sqlite_store import SqliteStore
+
+_stats = {
+    "memory_hits": 0,
+    "shared_hits": 0,
+    "misses": 0,
+    "invalidations": 0,
+    "evictions": 0,
+    # Загруженное значение не сохранено: его теги инвалидированы, пока шла загрузка
+    "stale_skips": 0,
+}
+
+
+class MemoryReadCache:
+    """LRU с TTL и тегами в памяти процесса"""
+
+    def __init__(self, max_entries: int = READ_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Any, float, Set[str]]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at, _ = entry
+        if time.time() >= expires_at:
+            self._entries.pop(key, None)
+            return None
+        self._entries.move_to_end(key)
+        return copy.deepcopy(value)
+
+    def set(self, key: str, value: Any, tags: Iterable[str], ttl: float):
+        self._entries[key] = (copy.deepcopy(value), time.time() + ttl, set(tags))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            _stats["evictions"] += 1
+
+    def invalidate(self, tags: Iterable[str]) -> int:
+        tags = set(tags)
+        stale = [key for key, (_, _, entry_tags) in self._entries.items() if entry_tags & tags]
+        for key in stale:
+            del self._entries[key]
+        return len(stale)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SqliteReadCache:
+    """Общий для процессов кэш в SQLite: записи, их теги и журнал инвалидаций"""
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS read_cache (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS read_cache_tags (
+        tag TEXT NOT NULL,
+        key TEXT NOT NULL,
+        PRIMARY KEY (tag, key)
+    );
+    CREATE TABLE IF NOT EXISTS read_cache_invalidations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tags TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+    """
+
+    def __init__(self, path: str = READ_CACHE_PATH):
+        self.path = path
+        self._store = SqliteStore(path, self._SCHEMA)
+
+    def get(self, key: str) -> Optional[Any]:
+        conn = self._store.connect()
+        try:
+            row = conn.execute("SELECT value, expires_at FROM read_cache WHERE key = ?", (key,)).fetchone()
+        finally:
+            conn.close()
+        if row is None or time.time() >= row[1]:
+            return None
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, tags: Iterable[str], ttl: float, after_invalidation_id: Optional[int] = None) -> bool:
+        """
+        Сохраняет запись, если после after_invalidation_id (курсор журнала, взятый до загрузки
+        значения) ни один процесс не инвалидировал её теги. Проверка и запись - одна транзакция
+
+        Returns:
+            bool: Запись сохранена
+        """
+        tags = list(tags)
+        conn = self._store.connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if after_invalidation_id is not None:
+                rows = conn.execute(
+                    "SELECT tags FROM read_cache_invalidations WHERE id > ?", (after_invalidation_id,)
+                ).fetchall()
+                if any(set(json.loads(row[0])) & set(tags) for row in rows):
+                    conn.execute("ROLLBACK")
+                    return False
+            conn.execute(
+                "INSERT OR REPLACE INTO read_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False, default=str), time.time() + ttl)
+            )
+            conn.execute("DELETE FROM read_cache_tags WHERE key = ?", (key,))
+            conn.executemany("INSERT OR IGNORE INTO read_cache_tags (tag, key) VALUES (?, ?)", [(tag, key) for tag in tags])
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def invalidate(self, tags: Iterable[str]) -> int:
+        tags = list(tags)
+        placeholders = ",".join("?" for _ in tags)
+        now = time.time()
+        conn = self._store.connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            keys = [row[0] for row in conn.execute(f"SELECT DISTINCT key FROM read_cache_tags WHERE tag IN ({placeholders})", tags)]
+            if keys:
+                key_placeholders = ",".join("?" for _ in keys)
+                conn.execute(f"DELETE FROM read_cache WHERE key IN ({key_placeholders})", keys)
+                conn.execute(f"DELETE FROM read_cache_tags WHERE key IN ({key_placeholders})", keys)
+            conn.execute("INSERT INTO read_cache_invalidations (tags, created_at) VALUES (?, ?)", (json.dumps(tags), now))
+            # Журнал нужен только на время, пока записи могут жить в памяти процессов
+            conn.execute("DELETE FROM read_cache_invalidations WHERE created_at < ?", (now - READ_CACHE_TTL_SECONDS * 2,))
+            conn.execute("COMMIT")
+            return len(keys)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def last_invalidation_id(self) -> int:
+        conn = self._store.connect()
+        try:
+            return conn.execute("SELECT MAX(id) FROM read_cache_invalidations").fetchone()[0] or 0
+        finally:
+            conn.close()
+
+    def invalidations_since(self, after_id: int) -> Tuple[int, List[str]]:
+        """Теги, инвалидированные после after_id (любым процессом), и новый курсор"""
+        conn = self._store.connect()
+        try:
+            rows = conn.execute(
+                "SELECT id, tags FROM read_cache_invalidations WHERE id > ? ORDER BY id", (after_id,)
+            ).fetchall()
+        finally:
+            conn.close()
+        if not rows:
+            return after_id, []
+        return rows[-1][0], [tag for _, tags in rows for tag in json.loads(tags)]
+
+
+_memory = MemoryReadCache()
+_shared: Optional[SqliteReadCache] = SqliteReadCache() if READ_CACHE_SHARED else None
+
+# Курсор журнала инвалидаций и время последней синхронизации LRU с ним
+_sync_cursor: Optional[int] = None
+_synced_at = 0.0
+_sync_running = False
+
+# Счётчик инвалидаций процесса и номер последней инвалидации каждого тега:
+# значение, загрузка которого началась до инвалидации его тегов, не сохраняется
+_generation = 0
+_tag_generations: Dict[str, int] = {}
+# Когда таблица версий тегов разрастается, она сбрасывается: загрузки, начатые раньше, не сохраняются
+_generations_reset_at = 0
+MAX_TRACKED_TAGS = 10000
+
+
+def _bump_generations(tags: Iterable[str]):
+    global _generation, _generations_reset_at
+    _generation += 1
+    if len(_tag_generations) >= MAX_TRACKED_TAGS:
+        _tag_generations.clear()
+        _generations_reset_at = _generation
+    for tag in tags:
+        _tag_generations[tag] = _generation
+
+
+def _invalidated_since(tags: Iterable[str], generation: int) -> bool:
+    if generation < _generations_reset_at:
+        return True
+    return any(_tag_generations.get(tag, 0) > generation for tag in tags)
+
+
+async def _sync_invalidations():
+    """
+    Применяет к LRU процесса инвалидации, сделанные другими процессами
+
+    Журнал читается в потоке (SQLite блокирует), одновременно - не больше одного чтения
+    """
+    global _sync_cursor, _synced_at, _sync_running
+
+    if _shared is None or _sync_running or time.monotonic() - _synced_at < READ_CACHE_SYNC_INTERVAL:
+        return
+    _synced_at = time.monotonic()
+    _sync_running = True
+
+    try:
+        if _sync_cursor is None:
+            # До первого чтения журнала LRU пуст - старые инвалидации не нужны
+            _sync_cursor = await asyncio.to_thread(_shared.last_invalidation_id)
+            return
+        _sync_cursor, tags = await asyncio.to_thread(_shared.invalidations_since, _sync_cursor)
+    except Exception as e:
+        print(f"[READ_CACHE] Failed to read invalidations: {str(e)}")
+        return
+    finally:
+        _sync_running = False
+    if tags:
+        _bump_generations(tags)
+        _memory.invalidate(tags)
+
+
+async def cached_read(key: str, loader: Callable[[], Awaitable[Any]], tags: Callable[[Any], Iterable[str]]) -> Any:
+    """
+    Read-through: значение из кэша или из loader() с сохранением в кэш
+
+    Args:
+        key: Ключ записи
+        loader: Чтение из Supabase (исключения не кэшируются)
+        tags: Теги записи по загруженному значению (по ним запись инвалидируется)
+    """
+    if not READ_CACHE_ENABLED:
+        return await loader()
+
+    await _sync_invalidations()
+
+    value = _memory.get(key)
+    if value is not None:
+        _stats["memory_hits"] += 1
+        return value
+
+    if _shared is not None:
+        try:
+            value = await asyncio.to_thread(_shared.get, key)
+        except Exception as e:
+            print(f"[READ_CACHE] Shared get failed: {str(e)}")
+            value = None
+        if value is not None:
+            _stats["shared_hits"] += 1
+            _memory.set(key, value, tags(value), READ_CACHE_TTL_SECONDS)
+            return value
+
+    _stats["misses"] += 1
+
+    # Версии до загрузки: запись, начавшаяся до инвалидации, не должна пережить её
+    started_generation = _generation
+    shared_cursor = None
+    if _shared is not None:
+        try:
+            shared_cursor = await asyncio.to_thread(_shared.last_invalidation_id)
+        except Exception as e:
+            print(f"[READ_CACHE] Failed to read invalidation cursor: {str(e)}")
+
+    value = await loader()
+    if value is None:
+        return value
+
+    entry_tags = list(tags(value))
+    if _invalidated_since(entry_tags, started_generation):
+        _stats["stale_skips"] += 1
+        return value
+
+    if _shared is not None and shared_cursor is not None:
+        try:
+            stored = await asyncio.to_thread(
+                _shared.set, key, value, entry_tags, READ_CACHE_TTL_SECONDS, shared_cursor
+            )
+        except Exception as e:
+            print(f"[READ_CACHE] Shared set failed: {str(e)}")
+            stored = True
+        if not stored:
+            # Другой процесс инвалидировал теги во время загрузки
+            _stats["stale_skips"] += 1
+            return value
+
+    # Без await между проверкой и записью: инвалидация в этом процессе не может вклиниться
+    if _invalidated_since(entry_tags, started_generation):
+        _stats["stale_skips"] += 1
+        return value
+    _memory.set(key, value, entry_tags, READ_CACHE_TTL_SECONDS)
+    return value
+
+
+async def invalidate(*tags: str):
+    """Сбрасывает все записи с любым из тегов (в этом процессе и в общем кэше)"""
+    if not READ_CACHE_ENABLED or not tags:
+        return
+
+    _bump_generations(tags)
+    removed = _memory.invalidate(tags)
+    if _shared is not None:
+        try:
+            removed += await asyncio.to_thread(_shared.invalidate, tags)
+        except Exception as e:
+            print(f"[READ_CACHE] Shared invalidate failed: {str(e)}")
+    _stats["invalidations"] += 1
+    if removed:
+        print(f"[READ_CACHE] Invalidated {', '.join(tags)}: {removed} entries")
+
+
+def get_read_cache_stats() -> dict:
+    hits = _stats["memory_hits"] + _stats["shared_hits"]
+    total = hits + _stats["misses"]
+    return {
+        **_stats,
+        "hit_ratio": round(hits / total, 3) if total else None,
+        "memory_entries": len(_memory),
+        "shared": _shared is not None,
+    }
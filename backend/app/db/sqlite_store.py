@@ -0,0 +1,40 @@
+"""
+Общие для процессов SQLite файлы (очередь задач, события проектов, read-through кэш)
+
+Одинаковые параметры соединения для всех: autocommit (транзакции - явные BEGIN IMMEDIATE),
+WAL для одновременных читателей и писателя, ожидание блокировки до 30 секунд.
+Схема создаётся при первом соединении процесса.
+"""
+import sqlite3
+from typing import Callable, Optional
+
+
+class SqliteStore:
+    """SQLite файл со схемой: connect() открывает новое соединение"""
+
+    def __init__(
+        self,
+        path: str,
+        schema: str,
+        row_factory: Optional[type] = None,
+        migrate: Optional[Callable[[sqlite3.Connection], None]] = None
+    ):
+        self.path = path
+        self.schema = schema
+        self.row_factory = row_factory
+        self.migrate = migrate
+        self._initialized = False
+
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        if self.row_factory is not None:
+            conn.row_factory = self.row_factory
+
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.schema)
+            if self.migrate is not None:
+                self.migrate(conn)
+            self._initialized = True
+
+        return conn
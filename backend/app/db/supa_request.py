@@ -1,15 +1,36 @@
-from supabase import create_client
+from supabase import create_client, acreate_client, AsyncClient
 from datetime import datetime
+import asyncio
+import base64
+import json
 import uuid
 from typing import List
 from app.config import SUPABASE_URL, SUPABASE_KEY
+from app.db.read_cache import cached_read, invalidate
 
+#Синхронный клиент - только для служебных скриптов (scripts/), в async коде не использовать
 supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+#Асинхронный клиент (PostgREST + Storage + Auth), создается лениво один раз на процесс
+_async_client: AsyncClient | None = None
+_async_client_lock = asyncio.Lock()
+
+
+async def get_db() -> AsyncClient:
+    """Возвращает общий асинхронный Supabase клиент (не блокирует event loop)"""
+    global _async_client
+
+    if _async_client is None:
+        async with _async_client_lock:
+            if _async_client is None:
+                _async_client = await acreate_client(SUPABASE_URL, SUPABASE_KEY)
+    return _async_client
+
 
 ###ADD PROJECT WITH SCENES
-def create_project_with_scenes(script: dict, user_prompt: str, time: float, genre: str | None, style: str | None, user_id: str) -> str:
+async def create_project_with_scenes(script: dict, user_prompt: str, time: float, genre: str | None, style: str | None, user_id: str) -> str:
     formatted_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    db = await get_db()
 
     #Создаем проект
     project_data = {
@@ -18,15 +39,15 @@ def create_project_with_scenes(script: dict, user_prompt: str, time: float, genr
         "intro": script.get("intro"),
         "project_time": time,
         "created_at": formatted_time,
-        "tone": genre,  
+        "tone": genre,
         "style": style,
         "user_id": user_id
     }
 
-    res = supabase.table("projects").insert(project_data).execute()
+    res = await db.table("projects").insert(project_data).execute()
+
 
 
-    
     project_id = res.data[0]["id"]
 
     #Создаём сцену
@@ -45,46 +66,182 @@ def create_project_with_scenes(script: dict, user_prompt: str, time: float, genr
 
 
     if scenes_data:
-        res_scenes = supabase.table("scenes").insert(scenes_data).execute()
+        res_scenes = await db.table("scenes").insert(scenes_data).execute()
 
+    await invalidate(f"user:{user_id}")
     return project_id
 
-#Get project by ID and add cache
-def get_project(project_id: str):
-    res = supabase.table("projects").select("*").eq("id", project_id).single().execute()
-    return res.data
 
-#Get scenes by project ID and add cache
-def get_project_scenes(project_id: str):
-    res = supabase.table("scenes").select("*").eq("project_id", project_id).order("scene_number").execute()
-    return res.data
+#Колонки для выборок проекта со сценами: только то, что читают эндпоинты и рендер
+PROJECT_VIEWS = {
+    #Карточка проекта в редакторе (GET /projects/{id})
+    "detail": (
+        "id, title, description, intro, tone, style, project_time",
+        "id, scene_number, action, dialogue, voice_over, visual_prompt, generated_image_url",
+    ),
+    #Озвучка и рендер: URL озвучки/субтитров и тайминги сцен
+    "render": (
+        "id, voiceover_url, subtitle_url, final_video_url, render_status, project_time",
+        "id, scene_number, dialogue, voice_over, visual_prompt, generated_image_url, "
+        "audio_url, audio_hash, audio_offset, audio_duration",
+    ),
+    #Статус рендера (без сцен)
+    "status": (
+        "id, voiceover_url, subtitle_url, final_video_url, render_status, project_time",
+        None,
+    ),
+}
+
+
+#Get project with scenes in one request (PostgREST resource embedding)
+async def get_project_bundle(project_id: str, view: str = "detail", use_cache: bool = True) -> dict | None:
+    """
+    Проект и его сцены одним запросом: projects?select=...,scenes(...) со сценами,
+    отсортированными по scene_number, в ключе "scenes"
 
+    Args:
+        view: Набор колонок из PROJECT_VIEWS
+        use_cache: False - читать из базы в обход read-through кэша
+
+    Returns:
+        dict | None: Проект или None, если его нет
+    """
+    project_columns, scene_columns = PROJECT_VIEWS[view]
+
+    async def load():
+        db = await get_db()
+        columns = f"{project_columns}, scenes({scene_columns})" if scene_columns else project_columns
+        query = db.table("projects").select(columns).eq("id", project_id)
+        if scene_columns:
+            query = query.order("scene_number", foreign_table="scenes")
+        res = await query.maybe_single().execute()
+        return res.data if res else None
+
+    if not use_cache:
+        return await load()
+
+    return await cached_read(
+        f"bundle:{view}:{project_id}",
+        load,
+        lambda project: [f"project:{project_id}", f"scenes:{project_id}"]
+                        + [f"scene:{scene['id']}" for scene in project.get("scenes") or []]
+    )
+
+
+#Колонки, которые клиент может запросить в списке проектов (fields=...)
+PROJECT_LIST_FIELDS = (
+    "id", "title", "description", "intro", "created_at", "project_time", "tone", "style",
+    "render_status", "final_video_url",
+)
+PROJECT_LIST_DEFAULT_FIELDS = ("id", "title", "description", "created_at", "project_time", "tone", "style")
+
+
+def encode_project_cursor(project: dict) -> str:
+    """Курсор следующей страницы: (created_at, id) последнего проекта страницы"""
+    raw = json.dumps([project["created_at"], project["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_project_cursor(cursor: str) -> tuple[str, str]:
+    """
+    Raises:
+        ValueError: Курсор повреждён
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, project_id = json.loads(raw)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(created_at, str) or not isinstance(project_id, str):
+        raise ValueError("Invalid cursor")
+    return created_at, project_id
+
+
+#Get one page of user projects (keyset pagination on created_at, id)
+async def get_projects_page(
+    user_id: str,
+    limit: int,
+    cursor: str | None = None,
+    fields: List[str] | None = None
+) -> tuple[List[dict], str | None]:
+    """
+    Страница проектов пользователя, новые первыми
+
+    Вместо OFFSET - условие "после последнего проекта прошлой страницы" по индексу
+    (created_at, id): стоимость запроса не растёт с номером страницы
+
+    Args:
+        limit: Размер страницы
+        cursor: Курсор из предыдущего ответа (None - первая страница)
+        fields: Колонки из PROJECT_LIST_FIELDS (None - PROJECT_LIST_DEFAULT_FIELDS)
+
+    Returns:
+        tuple: (проекты, курсор следующей страницы или None)
+
+    Raises:
+        ValueError: Повреждён курсор
+    """
+    after = decode_project_cursor(cursor) if cursor else None
+    #id и created_at нужны для курсора, даже если клиент их не просил
+    columns = [f for f in PROJECT_LIST_FIELDS if f in (fields or PROJECT_LIST_DEFAULT_FIELDS) or f in ("id", "created_at")]
+
+    async def load():
+        db = await get_db()
+        query = db.table("projects").select(", ".join(columns)).eq("user_id", user_id)
+        if after:
+            created_at, project_id = after
+            query = query.or_(
+                f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt."{project_id}")'
+            )
+        #Лишняя строка показывает, есть ли следующая страница
+        res = await query.order("created_at", desc=True).order("id", desc=True).limit(limit + 1).execute()
+        return res.data
+
+    rows = await cached_read(
+        f"projects:{user_id}:{limit}:{cursor or ''}:{','.join(columns)}",
+        load,
+        lambda projects: [f"user:{user_id}"] + [f"project:{project['id']}" for project in projects]
+    )
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_project_cursor(rows[-1])
+    return rows, None
+
+
+#Count user projects
+async def count_projects(user_id: str) -> int:
+    """Количество проектов пользователя (HEAD-запрос, строки не передаются)"""
+    async def load():
+        db = await get_db()
+        res = await db.table("projects").select("id", count="exact", head=True).eq("user_id", user_id).execute()
+        return {"count": res.count or 0}
+
+    result = await cached_read(f"projects_count:{user_id}", load, lambda value: [f"user:{user_id}"])
+    return result["count"]
 
-#Get all projects by user ID and add cache
-def get_all_projects(user_id: str) -> List[dict]:
-    res = supabase.table("projects")\
-        .select("id, title, description, created_at, project_time, tone, style")\
-        .eq("user_id", user_id)\
-        .order("created_at", desc=True).execute()
-    return res.data
 
 #Get scenes by project ID
-def get_visual_promt_by_project(project_id: str):
-    res = supabase.table("scenes").select("id, visual_prompt").eq("project_id", project_id).execute()
+async def get_visual_promt_by_project(project_id: str):
+    db = await get_db()
+    res = await db.table("scenes").select("id, visual_prompt").eq("project_id", project_id).execute()
     return res.data
 
 #Update scene with generated image URL
-def update_scene_image_url(scene_id: str, image_url: str):
-    res = supabase.table("scenes").update({"generated_image_url": image_url}).eq("id", scene_id).execute()
+async def update_scene_image_url(scene_id: str, image_url: str):
+    db = await get_db()
+    res = await db.table("scenes").update({"generated_image_url": image_url}).eq("id", scene_id).execute()
+    await invalidate(f"scene:{scene_id}")
     return res.data
 
 
-def get_scenes_by_project(project_id: str):
+async def get_scenes_by_project(project_id: str):
     """
     Возвращает все сцены проекта из таблицы 'scenes' по project_id.
     """
     try:
-        res = supabase.table("scenes") \
+        db = await get_db()
+        res = await db.table("scenes") \
             .select("id, scene_number, action, dialogue, voice_over, visual_prompt") \
             .eq("project_id", project_id) \
             .order("scene_number", desc=False) \
@@ -97,32 +254,149 @@ def get_scenes_by_project(project_id: str):
 
     except Exception as e:
         raise RuntimeError(f"Failed to fetch scenes: {str(e)}")
-    
-#Get count of scenes in project
-def update_scene(project_id: str, scene_number: int, update_data: dict):
-    try:
-        res = supabase.table("scenes") \
-            .update(update_data) \
-            .eq("project_id", project_id) \
-            .eq("scene_number", scene_number) \
+
+#Batch scene writes: один upsert по id (одна транзакция PostgREST) вместо запроса на каждую сцену
+async def _upsert_scenes(project_id: str, rows: List[dict]) -> List[dict]:
+    """
+    Записывает поля многих сцен проекта ровно одним upsert
+
+    PostgREST пишет объединение колонок всех строк, и отсутствующее у строки поле было бы
+    затёрто. Поэтому если наборы полей у строк разные, недостающие значения сначала читаются
+    из БД (один select) и все строки дополняются до общего набора. project_id добавляется
+    в каждую строку - NOT NULL колонки проверяются до разрешения конфликта по id
+    """
+    if not rows:
+        return []
+
+    columns = set().union(*rows)
+    missing = {column for row in rows for column in columns - set(row)}
+
+    db = await get_db()
+    if missing:
+        res = await db.table("scenes") \
+            .select(", ".join(["id", *sorted(missing)])) \
+            .in_("id", [row["id"] for row in rows]) \
             .execute()
+        current = {scene["id"]: scene for scene in res.data or []}
+        rows = [
+            {**{column: current.get(row["id"], {}).get(column) for column in missing}, **row}
+            for row in rows
+        ]
+
+    res = await db.table("scenes") \
+        .upsert([{**row, "project_id": project_id} for row in rows], on_conflict="id") \
+        .execute()
+
+    await invalidate(f"scenes:{project_id}")
+    return res.data or []
+
+
+async def _get_scene_order(project_id: str) -> List[dict]:
+    db = await get_db()
+    res = await db.table("scenes") \
+        .select("id, scene_number") \
+        .eq("project_id", project_id) \
+        .order("scene_number") \
+        .execute()
+    return res.data or []
+
+
+#Renumber scenes 1..N after deletion
+async def renumber_scenes(project_id: str) -> int:
+    """Перенумеровывает сцены проекта подряд с 1 (два запроса при любом числе сцен). Возвращает число изменённых сцен"""
+    scenes = await _get_scene_order(project_id)
+    rows = [
+        {"id": scene["id"], "scene_number": number}
+        for number, scene in enumerate(scenes, start=1)
+        if scene["scene_number"] != number
+    ]
+    await _upsert_scenes(project_id, rows)
+    return len(rows)
+
+
+#Update many scenes addressed by scene_number
+async def update_scenes_batch(project_id: str, updates: List[dict]) -> List[dict]:
+    """
+    Обновляет поля сцен проекта по номеру: каждый элемент - {"scene_number", ...поля}
 
-        if not res.data:
+    Raises:
+        ValueError: Сцены с таким scene_number нет в проекте
+    """
+    ids = {scene["scene_number"]: scene["id"] for scene in await _get_scene_order(project_id)}
+
+    rows = []
+    for update_data in updates:
+        scene_number = update_data["scene_number"]
+        if scene_number not in ids:
             raise ValueError(f"Scene {scene_number} not found for project {project_id}")
+        rows.append({**update_data, "id": ids[scene_number]})
+
+    return await _upsert_scenes(project_id, rows)
+
+
+#Reorder scenes
+async def reorder_scenes(project_id: str, scene_ids: List[str]) -> List[dict]:
+    """
+    Задаёт порядок сцен: scene_ids - все сцены проекта в новом порядке
+
+    Raises:
+        ValueError: Список не совпадает со сценами проекта
+    """
+    current = await _get_scene_order(project_id)
+    if sorted(scene_ids) != sorted(scene["id"] for scene in current):
+        raise ValueError("scene_ids must list every scene of the project exactly once")
+
+    numbers = {scene["id"]: scene["scene_number"] for scene in current}
+    rows = [
+        {"id": scene_id, "scene_number": number}
+        for number, scene_id in enumerate(scene_ids, start=1)
+        if numbers[scene_id] != number
+    ]
+    await _upsert_scenes(project_id, rows)
+    return [{"id": scene_id, "scene_number": number} for number, scene_id in enumerate(scene_ids, start=1)]
+
+
+#Insert scene at position
+async def insert_scene(project_id: str, position: int, scene_data: dict) -> dict:
+    """
+    Вставляет сцену на место position (с 1), сдвигая следующие: чтение порядка,
+    один upsert сдвига и вставка - три запроса при любом числе сцен
+    """
+    current = await _get_scene_order(project_id)
+    position = max(1, min(position, len(current) + 1))
+
+    #Сдвиг следующих сцен - одна транзакция, промежуточных дублей номеров не бывает
+    await _upsert_scenes(project_id, [
+        {"id": scene["id"], "scene_number": number + 1}
+        for number, scene in enumerate(current, start=1)
+        if number >= position
+    ])
+
+    db = await get_db()
+    res = await db.table("scenes").insert({
+        **scene_data,
+        "project_id": project_id,
+        "scene_number": position
+    }).execute()
+    await invalidate(f"scenes:{project_id}")
+    return res.data[0]
 
-        return res.data[0]  #возвращаем обновлённую строку
 
-    except Exception as e:
-        raise RuntimeError(f"Database update failed: {str(e)}")
-    
 ##Delete project by ID
-def delete_project_by_id(project_id: str):
+async def delete_project_by_id(project_id: str):
     try:
+        db = await get_db()
+
         #Удаляем сцены, связанные с проектом
-        supabase.table("scenes").delete().eq("project_id", project_id).execute()
+        await db.table("scenes").delete().eq("project_id", project_id).execute()
 
         #Удаляем сам проект
-        res = supabase.table("projects").delete().eq("id", project_id).execute()
+        res = await db.table("projects").delete().eq("id", project_id).execute()
+        await invalidate(f"project:{project_id}", f"scenes:{project_id}")
+        for project in res.data or []:
+            if project.get("user_id"):
+                #Счётчик и страницы списка пользователя
+                await invalidate(f"user:{project['user_id']}")
 
         return res.data
 
@@ -131,33 +405,52 @@ def delete_project_by_id(project_id: str):
 
 
 #Update voiceover URL for project
-def update_voiceover_url(project_id: str, voiceover_url: str):
+async def update_voiceover_url(project_id: str, voiceover_url: str):
     """Обновляет URL озвучки для проекта"""
-    res = supabase.table("projects").update({"voiceover_url": voiceover_url}).eq("id", project_id).execute()
+    db = await get_db()
+    res = await db.table("projects").update({"voiceover_url": voiceover_url}).eq("id", project_id).execute()
+    await invalidate(f"project:{project_id}")
+    return res.data
+
+
+#Update per-scene voiceover clip and its position in the project audio
+async def update_scene_audio(scene_id: str, audio_data: dict):
+    """
+    Сохраняет озвучку сцены: audio_url, audio_hash (хэш текста и параметров TTS),
+    audio_duration и audio_offset (начало клипа в общей дорожке), в секундах
+    """
+    db = await get_db()
+    res = await db.table("scenes").update(audio_data).eq("id", scene_id).execute()
+    await invalidate(f"scene:{scene_id}")
     return res.data
 
 
 #Update subtitle URL for project
-def update_subtitle_url(project_id: str, subtitle_url: str):
+async def update_subtitle_url(project_id: str, subtitle_url: str):
     """Обновляет URL субтитров для проекта"""
-    res = supabase.table("projects").update({"subtitle_url": subtitle_url}).eq("id", project_id).execute()
+    db = await get_db()
+    res = await db.table("projects").update({"subtitle_url": subtitle_url}).eq("id", project_id).execute()
+    await invalidate(f"project:{project_id}")
     return res.data
 
 
 #Update project time (duration)
-def update_project_time(project_id: str, project_time: float):
+async def update_project_time(project_id: str, project_time: float):
     """Обновляет длительность проекта в секундах"""
-    res = supabase.table("projects").update({"project_time": project_time}).eq("id", project_id).execute()
+    db = await get_db()
+    res = await db.table("projects").update({"project_time": project_time}).eq("id", project_id).execute()
+    await invalidate(f"project:{project_id}")
     return res.data
 
 
 #Get random fallback image
-def get_random_fallback_image():
+async def get_random_fallback_image():
     """Получает случайное фоллбэк изображение из базы данных"""
     import random
 
     try:
-        res = supabase.table("fallback_images").select("*").eq("is_active", True).execute()
+        db = await get_db()
+        res = await db.table("fallback_images").select("*").eq("is_active", True).execute()
 
         if res.data and len(res.data) > 0:
             random_image = random.choice(res.data)
@@ -172,26 +465,59 @@ def get_random_fallback_image():
 
 
 #Update final video URL for project
-def update_final_video_url(project_id: str, final_video_url: str):
+async def update_final_video_url(project_id: str, final_video_url: str):
     """Обновляет URL финального видео для проекта"""
-    res = supabase.table("projects").update({"final_video_url": final_video_url}).eq("id", project_id).execute()
+    db = await get_db()
+    res = await db.table("projects").update({"final_video_url": final_video_url}).eq("id", project_id).execute()
+    await invalidate(f"project:{project_id}")
     return res.data
 
 
 #Update render status for project
-def update_render_status(project_id: str, status: str):
+async def update_render_status(project_id: str, status: str):
     """Обновляет статус рендера для проекта
 
     Возможные статусы: 'pending', 'generating_audio', 'rendering_video', 'completed', 'error'
     """
-    res = supabase.table("projects").update({"render_status": status}).eq("id", project_id).execute()
+    db = await get_db()
+    res = await db.table("projects").update({"render_status": status}).eq("id", project_id).execute()
+    await invalidate(f"project:{project_id}")
     return res.data
 
 
-#Get project with voiceover and video data
-def get_project_render_data(project_id: str):
-    """Получает данные проекта для рендеринга (включая URLs озвучки и видео)"""
-    res = supabase.table("projects").select(
-        "id, voiceover_url, subtitle_url, final_video_url, render_status, project_time"
-    ).eq("id", project_id).single().execute()
-    return res.data
+#Storage helpers
+STORAGE_BUCKET = "videos"
+
+
+async def get_storage_url(file_name: str) -> str:
+    """Публичный URL файла в bucket 'videos' (или signed URL на 1 год, если bucket приватный)"""
+    db = await get_db()
+    bucket = db.storage.from_(STORAGE_BUCKET)
+
+    try:
+        return await bucket.get_public_url(file_name)
+    except Exception:
+        # Fallback: создаем signed URL на 1 год
+        signed_url = await bucket.create_signed_url(
+            file_name,
+            expires_in=31536000  # 1 год в секундах
+        )
+        return signed_url['signedURL']
+
+
+async def upload_to_storage(file_name: str, data: bytes, content_type: str) -> str:
+    """
+    Загружает файл в bucket 'videos' и возвращает публичный URL
+    (или signed URL на 1 год, если bucket приватный)
+    """
+    db = await get_db()
+    bucket = db.storage.from_(STORAGE_BUCKET)
+
+    # Используем upsert для перезаписи файла если он уже существует
+    await bucket.upload(
+        path=file_name,
+        file=data,
+        file_options={"content-type": content_type, "upsert": "true"}
+    )
+
+    return await get_storage_url(file_name)
@@ -0,0 +1,192 @@
+"""
+Локальный кэш ассетов из Supabase Storage (изображения сцен, озвучка, субтитры)
+
+Содержимое хранится по sha256 (blobs/{hash}), отдельно - указатели "URL -> hash"
+(urls/{sha256(ключа URL)}). Ключ URL - имя объекта в bucket, если URL указывает
+на Storage (публичный и подписанный URL одного файла совпадают), иначе URL целиком.
+Одинаковое содержимое под разными URL хранится один раз.
+
+Заполняется при скачивании и при загрузке в Storage (write-through), поэтому повторный
+рендер и шаги после загрузки не качают байты, которые уже есть на диске.
+Вытеснение - самые давно использованные blobs, пока кэш больше ASSET_CACHE_MAX_BYTES.
+
+Кэш общий для процессов на одной машине (API и воркеры): все записи - атомарные os.replace.
+Вызывающий код получает копии (не жёсткие ссылки), blobs - только для чтения.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import Optional
+from app.config import ASSET_CACHE_ENABLED, ASSET_CACHE_DIR, ASSET_CACHE_MAX_BYTES
+from app.db.supa_request import STORAGE_BUCKET
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+_stats = {
+    "hits": 0,
+    "misses": 0,
+    "stores": 0,
+    "evictions": 0,
+}
+
+
+def _url_key(url: str) -> str:
+    marker = f"/{STORAGE_BUCKET}/"
+    if marker in url:
+        return "storage:" + url.split(marker)[-1].split("?")[0]
+    return url
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# ioctl FICLONE (Linux): reflink - копия, разделяющая блоки до первой записи (btrfs, xfs)
+FICLONE = 0x40049409
+
+
+def copy_file(source: str, target: str):
+    """
+    Независимая копия файла: reflink, где файловая система умеет, иначе обычная копия
+
+    Не жёсткая ссылка: запись в target на месте (ffmpeg -y, open(..., "wb")) не должна
+    менять blob кэша, который видят другие потребители, и наоборот
+    """
+    if os.path.exists(target):
+        os.unlink(target)
+    try:
+        import fcntl
+        with open(source, "rb") as src, open(target, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return
+    except (ImportError, OSError):
+        pass
+    shutil.copyfile(source, target)
+
+
+class AssetCache:
+    """Кэш файлов по содержимому с указателями по URL"""
+
+    def __init__(self, directory: str = ASSET_CACHE_DIR, max_bytes: int = ASSET_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.blobs = os.path.join(directory, "blobs")
+        self.urls = os.path.join(directory, "urls")
+        os.makedirs(self.blobs, exist_ok=True)
+        os.makedirs(self.urls, exist_ok=True)
+
+    def _pointer(self, url: str) -> str:
+        return os.path.join(self.urls, hashlib.sha256(_url_key(url).encode("utf-8")).hexdigest())
+
+    def _write_atomic(self, directory: str, path: str, write):
+        temp = tempfile.NamedTemporaryFile(delete=False, dir=directory, prefix=".tmp_")
+        temp.close()
+        try:
+            write(temp.name)
+            os.replace(temp.name, path)
+        except BaseException:
+            if os.path.exists(temp.name):
+                os.unlink(temp.name)
+            raise
+
+    @staticmethod
+    def _write_blob(source_path: str, temp: str):
+        copy_file(source_path, temp)
+        # blob только для чтения: случайная запись в него завершится ошибкой, а не испортит кэш
+        os.chmod(temp, 0o444)
+
+    def get(self, url: str) -> Optional[str]:
+        """
+        Путь к закэшированному содержимому URL или None
+
+        Файл принадлежит кэшу и доступен только для чтения: не изменять и не удалять,
+        для изменяемой копии - copy_file
+        """
+        try:
+            with open(self._pointer(url), "r", encoding="ascii") as f:
+                content_hash = f.read().strip()
+        except FileNotFoundError:
+            _stats["misses"] += 1
+            return None
+
+        path = os.path.join(self.blobs, content_hash)
+        try:
+            # Обновляем mtime - blob недавно использовался
+            os.utime(path)
+        except FileNotFoundError:
+            # blob вытеснен - указатель устарел
+            _stats["misses"] += 1
+            return None
+        _stats["hits"] += 1
+        return path
+
+    def put_file(self, url: str, source_path: str) -> str:
+        """Кладёт копию файла (source_path остаётся у вызывающего) и связывает её с URL"""
+        content_hash = _file_hash(source_path)
+        path = os.path.join(self.blobs, content_hash)
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            self._write_atomic(self.blobs, path, lambda temp: self._write_blob(source_path, temp))
+
+        def write_pointer(temp: str):
+            with open(temp, "w", encoding="ascii") as f:
+                f.write(content_hash)
+        self._write_atomic(self.urls, self._pointer(url), write_pointer)
+
+        _stats["stores"] += 1
+        self.prune()
+        return path
+
+    def put_bytes(self, url: str, data: bytes) -> str:
+        temp = tempfile.NamedTemporaryFile(delete=False, dir=self.blobs, prefix=".tmp_")
+        try:
+            temp.write(data)
+            temp.close()
+            return self.put_file(url, temp.name)
+        finally:
+            temp.close()
+            if os.path.exists(temp.name):
+                os.unlink(temp.name)
+
+    def prune(self):
+        """Удаляет самые давно использованные blobs, пока кэш больше max_bytes (указатели на них становятся промахами)"""
+        entries = []
+        for name in os.listdir(self.blobs):
+            if name.startswith("."):
+                continue
+            path = os.path.join(self.blobs, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+                _stats["evictions"] += 1
+            except FileNotFoundError:
+                pass
+
+
+asset_cache: Optional[AssetCache] = AssetCache() if ASSET_CACHE_ENABLED else None
+
+
+def get_asset_cache_stats() -> dict:
+    """Счётчики кэша ассетов (для /metrics)"""
+    total = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "enabled": asset_cache is not None,
+        "hit_ratio": round(_stats["hits"] / total, 3) if total else None,
+    }
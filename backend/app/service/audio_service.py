@@ -1,35 +1,51 @@
 """
 Сервис для генерации озвучки (TTS) и субтитров
 """
+import asyncio
+import hashlib
+import io
 import os
 import tempfile
-import uuid
+from typing import List
 from gtts import gTTS
-from app.db.supa_request import supabase
-import subprocess
+from app.config import TTS_CONCURRENCY, TTS_AUDIO_BITRATE, TTS_LOUDNESS_TARGET
+from app.service.storage_io import download_to_file, upload_file, upload_bytes
+from app.service.subprocess_utils import run_process
+from app.service.video_service import probe_audio
+from app.service.whisper_model import is_whisper_available, transcribe_audio
+from app.service.subtitle_alignment import align_phrases
+from app.service.ffmpeg_binary import FFMPEG_BINARY
 import json
 
-# Определяем путь к ffmpeg
-# Приоритет: системный (Docker) -> imageio-ffmpeg (локальная разработка)
-import shutil
+# Частота дискретизации озвучки (речь; AAC в mp4 рендера копируется как есть)
+TTS_SAMPLE_RATE = 24000
+
+# Версия формата клипов озвучки: входит в audio_hash, поэтому клипы старого формата (mp3)
+# не переиспользуются, а синтезируются заново
+TTS_CLIP_FORMAT = "m4a-loudnorm-v1"
 
-if shutil.which("ffmpeg"):
-    FFMPEG_BINARY = "ffmpeg"
-    print(f"[AUDIO] Using system ffmpeg")
-else:
-    try:
-        import imageio_ffmpeg
-        FFMPEG_BINARY = imageio_ffmpeg.get_ffmpeg_exe()
-        print(f"[AUDIO] Using imageio-ffmpeg binary: {FFMPEG_BINARY}")
-    except ImportError:
-        FFMPEG_BINARY = "ffmpeg"
-        print(f"[AUDIO] WARNING: No ffmpeg found, will try system command")
 
+def tts_audio_filter(speed: float) -> str:
+    """
+    Фильтры обработки озвучки: обрезка тишины в начале, темп, нормализация громкости
 
-async def generate_voiceover(text: str, lang: str = "ru", speed: float = 1.3) -> str:
+    atempo меняет скорость без изменения тона и работает только в диапазоне 0.5-2.0;
+    loudnorm внутри передискретизирует в 192 кГц, поэтому частота задаётся на выходе (-ar)
     """
-    Генерирует озвучку из текста с помощью Google TTS
-    После генерации увеличивает скорость с помощью ffmpeg
+    filters = ["silenceremove=start_periods=1:start_threshold=-50dB"]
+    if speed != 1.0:
+        filters.append(f"atempo={min(max(speed, 0.5), 2.0)}")
+    filters.append(f"loudnorm=I={TTS_LOUDNESS_TARGET}:TP=-1.5:LRA=11")
+    return ",".join(filters)
+
+
+async def synthesize_speech(text: str, lang: str = "ru", speed: float = 1.3) -> str:
+    """
+    Синтезирует речь с помощью Google TTS во временный m4a (AAC) файл
+
+    mp3 от gTTS не сохраняется на диск: байты подаются в stdin одного процесса ffmpeg,
+    который меняет скорость, нормализует громкость и сразу кодирует в AAC -
+    единственное lossy кодирование, рендер копирует эту дорожку без перекодирования
 
     Args:
         text: Текст для озвучки
@@ -37,109 +53,278 @@ async def generate_voiceover(text: str, lang: str = "ru", speed: float = 1.3) ->
         speed: Множитель скорости (1.0 = нормальная, 1.3 = на 30% быстрее)
 
     Returns:
-        str: Публичный URL загруженного аудио файла
+        str: Путь к локальному m4a файлу (удаляет вызывающий код)
     """
+    output_path = None
     try:
         # Генерируем аудио с помощью gTTS
         # Используем tld='com.au' для более приятного женского голоса
         tts = gTTS(text=text, lang=lang, slow=False, tld='com.au')
 
-        # Создаем временный файл
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
-        temp_path = temp_file.name
-        temp_file.close()
+        # gTTS ходит в сеть синхронно - выносим в поток; mp3 остаётся в памяти
+        buffer = io.BytesIO()
+        await asyncio.to_thread(tts.write_to_fp, buffer)
+
+        output = tempfile.NamedTemporaryFile(delete=False, suffix=".m4a")
+        output_path = output.name
+        output.close()
+
+        ffmpeg_cmd = [
+            FFMPEG_BINARY, "-y",
+            "-f", "mp3", "-i", "pipe:0",
+            "-filter:a", tts_audio_filter(speed),
+            "-vn",  # Только аудио
+            "-ar", str(TTS_SAMPLE_RATE), "-ac", "1",
+            "-c:a", "aac", "-b:a", TTS_AUDIO_BITRATE,
+            "-movflags", "+faststart",
+            output_path
+        ]
+
+        print(f"[AUDIO] Processing speech with ffmpeg (speed {speed}x, loudnorm {TTS_LOUDNESS_TARGET} LUFS)...")
+        returncode, _, stderr = await run_process(ffmpeg_cmd, timeout=60, input_data=buffer.getvalue())
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {stderr.decode('utf-8', errors='ignore')[-300:]}")
+        return output_path
 
-        # Сохраняем аудио во временный файл
-        tts.save(temp_path)
+    except Exception as e:
+        # Очищаем временный файл в случае ошибки
+        if output_path and os.path.exists(output_path):
+            try:
+                os.unlink(output_path)
+            except:
+                pass
+        raise Exception(f"Failed to synthesize speech: {str(e)}")
 
-        # Если нужна другая скорость - обрабатываем через ffmpeg
-        final_audio_path = temp_path
-        if speed != 1.0:
-            import subprocess
 
-            # Создаем еще один временный файл для ускоренного аудио
-            speed_temp = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
-            speed_temp_path = speed_temp.name
-            speed_temp.close()
+async def audio_artifact(audio_path: str) -> dict:
+    """
+    Локальный аудио артефакт: файл и его параметры, измеренные один раз
 
-            # Используем atempo фильтр для изменения скорости без изменения тона
-            # atempo может работать только в диапазоне 0.5-2.0
-            atempo_value = min(max(speed, 0.5), 2.0)
+    Длительность, субтитры (Whisper) и загрузка в storage работают с этим же файлом,
+    без повторного скачивания загруженной озвучки
 
-            ffmpeg_cmd = [
-                FFMPEG_BINARY, "-y",
-                "-i", temp_path,
-                "-filter:a", f"atempo={atempo_value}",
-                "-vn",  # Только аудио
-                speed_temp_path
-            ]
+    Returns:
+        dict: {"path", "duration", "codec", "sample_rate", "channels", "size"}
+    """
+    metadata = await probe_audio(audio_path)
+    return {"path": audio_path, **metadata}
 
-            try:
-                print(f"[AUDIO] Changing speed to {atempo_value}x with ffmpeg...")
-                subprocess.run(ffmpeg_cmd, check=True, capture_output=True, timeout=30)
-                final_audio_path = speed_temp_path
-                # Удаляем оригинальный файл
-                os.unlink(temp_path)
-                print(f"[AUDIO] Speed changed successfully")
-            except Exception as ffmpeg_error:
-                print(f"[AUDIO] FFmpeg speed change failed: {ffmpeg_error}, using original speed")
-                # Если не получилось - используем оригинал
-                if os.path.exists(speed_temp_path):
-                    os.unlink(speed_temp_path)
-                final_audio_path = temp_path
-
-        # Генерируем уникальное имя файла
-        file_name = f"voiceover_{uuid.uuid4()}.mp3"
-
-        # Загружаем в Supabase Storage
-        with open(final_audio_path, "rb") as f:
-            file_data = f.read()
-
-        # Используем upsert для перезаписи файла если он уже существует
-        res = supabase.storage.from_("videos").upload(
-            path=file_name,
-            file=file_data,
-            file_options={"content-type": "audio/mpeg", "upsert": "true"}
-        )
 
-        # Удаляем временный файл
-        if os.path.exists(final_audio_path):
-            os.unlink(final_audio_path)
+def build_scene_voiceover_text(scene: dict) -> str:
+    """
+    Текст озвучки одной сцены: сначала voice_over (закадровый голос),
+    потом dialogue (реплики персонажей), между ними пауза
+    """
+    scene_text = []
+
+    #Закадровый голос
+    voice_over = (scene.get("voice_over") or "").strip()
+    if voice_over:
+        scene_text.append(voice_over)
 
-        # Получаем публичный URL
-        # Если bucket публичный - используем get_public_url
-        # Если приватный - используем signed URL (действует 1 год)
-        try:
-            public_url = supabase.storage.from_("videos").get_public_url(file_name)
-            return public_url
-        except Exception:
-            # Fallback: создаем signed URL на 1 год
-            signed_url = supabase.storage.from_("videos").create_signed_url(
-                file_name,
-                expires_in=31536000  # 1 год в секундах
-            )
-            return signed_url['signedURL']
+    #Диалоги персонажей (после паузы)
+    dialogue = (scene.get("dialogue") or "").strip()
+    if dialogue:
+        #Добавляем небольшую паузу перед диалогом если есть закадровый текст
+        if voice_over:
+            scene_text.append("...")  # Пауза ~0.5 сек в TTS
+        scene_text.append(dialogue)
 
-    except Exception as e:
-        # Очищаем временные файлы в случае ошибки
-        for path_var in ['temp_path', 'final_audio_path', 'speed_temp_path']:
-            if path_var in locals():
-                path = locals()[path_var]
-                if path and os.path.exists(path):
-                    try:
-                        os.unlink(path)
-                    except:
-                        pass
-        raise Exception(f"Failed to generate voiceover: {str(e)}")
-
-
-def generate_subtitles_from_audio(audio_path: str, original_text: str = None) -> str:
+    return " ".join(scene_text)
+
+
+def scene_voiceover_hash(text: str, lang: str, speed: float) -> str:
+    """Хэш текста и параметров TTS: клип сцены пересинтезируется только при его изменении"""
+    return hashlib.sha256(f"{TTS_CLIP_FORMAT}|{lang}|{speed}|{text}".encode("utf-8")).hexdigest()
+
+
+async def concat_audio_clips(clip_paths: List[str], output_path: str):
+    """
+    Склеивает m4a (AAC) клипы через concat demuxer ffmpeg без перекодирования (-c copy)
+    Все клипы получены одним и тем же TTS + ffmpeg, поэтому параметры потоков совпадают
+    """
+    list_file = tempfile.NamedTemporaryFile(delete=False, suffix=".txt", mode="w", encoding="utf-8")
+    try:
+        for path in clip_paths:
+            # В файле списка одинарные кавычки экранируются как '\''
+            escaped = path.replace("'", "'\\''")
+            list_file.write(f"file '{escaped}'\n")
+        list_file.close()
+
+        cmd = [
+            FFMPEG_BINARY, "-y",
+            "-f", "concat",
+            "-safe", "0",
+            "-i", list_file.name,
+            "-c", "copy",
+            "-movflags", "+faststart",
+            output_path
+        ]
+        returncode, _, stderr = await run_process(cmd, timeout=60)
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg concat failed: {stderr.decode('utf-8', errors='ignore')[-300:]}")
+    finally:
+        if os.path.exists(list_file.name):
+            os.unlink(list_file.name)
+
+
+async def generate_scene_voiceovers(
+    project_id: str,
+    scenes: List[dict],
+    lang: str = "ru",
+    speed: float = 1.3,
+    concurrency: int = TTS_CONCURRENCY
+) -> dict:
+    """
+    Озвучка проекта по сценам
+
+    Каждая сцена синтезируется отдельным клипом (параллельно, не больше concurrency
+    одновременно). Клип сцены, чей текст не менялся (совпадает audio_hash), не синтезируется
+    заново, а скачивается из storage. Затем клипы склеиваются без перекодирования,
+    а для каждой сцены сохраняются точные offset и длительность в общей дорожке.
+
+    Args:
+        project_id: ID проекта
+        scenes: Сцены проекта (с полями voice_over, dialogue и audio_*)
+        lang: Язык озвучки
+        speed: Множитель скорости
+
+    Returns:
+        dict: {
+            "artifact": склеенная дорожка (см. audio_artifact, файл удаляет вызывающий код),
+            "text": полный текст озвучки (для субтитров),
+            "scenes": [{"scene_id", "audio_offset", "audio_duration", ...}],
+            "synthesized": сколько клипов синтезировано заново
+        }
+    """
+    voiced = []
+    for scene in sorted(scenes, key=lambda x: x.get("scene_number", 0)):
+        text = build_scene_voiceover_text(scene)
+        if text:
+            voiced.append((scene, text))
+
+    if not voiced:
+        raise ValueError("No voice_over or dialogue text found in scenes")
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    synthesized = 0
+
+    async def prepare_clip(scene: dict, text: str) -> dict:
+        nonlocal synthesized
+        clip_hash = scene_voiceover_hash(text, lang, speed)
+        upload_name = None
+
+        async with semaphore:
+            clip_path = None
+            audio_url = scene.get("audio_url")
+
+            # Текст сцены не менялся - берём готовый клип
+            if audio_url and scene.get("audio_hash") == clip_hash:
+                try:
+                    clip_path = await download_to_file(audio_url, suffix=".m4a")
+                    print(f"[VOICEOVER] Scene {scene.get('scene_number')}: reusing cached clip")
+                except Exception as e:
+                    print(f"[VOICEOVER] Scene {scene.get('scene_number')}: cached clip unavailable ({e}), resynthesizing")
+
+            if clip_path is None:
+                print(f"[VOICEOVER] Scene {scene.get('scene_number')}: synthesizing clip")
+                clip_path = await synthesize_speech(text, lang=lang, speed=speed)
+                upload_name = f"voiceover_{project_id}_{scene['id']}_{clip_hash[:12]}.m4a"
+                synthesized += 1
+
+        # Вне слота синтеза: загрузка нового клипа идёт параллельно с его измерением
+        try:
+            if upload_name:
+                audio_url, artifact = await asyncio.gather(
+                    upload_file(clip_path, upload_name, "audio/mp4"),
+                    audio_artifact(clip_path)
+                )
+            else:
+                artifact = await audio_artifact(clip_path)
+        except BaseException:
+            if os.path.exists(clip_path):
+                os.unlink(clip_path)
+            raise
+
+        return {
+            "scene_id": scene["id"],
+            "path": clip_path,
+            "audio_url": audio_url,
+            "audio_hash": clip_hash,
+            "audio_duration": artifact["duration"],
+            "artifact": artifact,
+        }
+
+    tasks = [asyncio.create_task(prepare_clip(scene, text)) for scene, text in voiced]
+    try:
+        clips = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        # Отменённые задачи должны завершиться: клип мог подготовиться уже после отмены
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        # Удаляем клипы, которые успели подготовиться
+        for result in results:
+            if isinstance(result, dict) and os.path.exists(result["path"]):
+                os.unlink(result["path"])
+        raise
+
+    output = tempfile.NamedTemporaryFile(delete=False, suffix=".m4a")
+    output.close()
+    try:
+        await concat_audio_clips([clip["path"] for clip in clips], output.name)
+    except Exception:
+        os.unlink(output.name)
+        raise
+    finally:
+        for clip in clips:
+            if os.path.exists(clip["path"]):
+                os.unlink(clip["path"])
+
+    # Offset каждой сцены - сумма длительностей предыдущих клипов
+    offset = 0.0
+    scene_timings = []
+    for clip in clips:
+        scene_timings.append({
+            "scene_id": clip["scene_id"],
+            "audio_url": clip["audio_url"],
+            "audio_hash": clip["audio_hash"],
+            "audio_offset": round(offset, 3),
+            "audio_duration": round(clip["audio_duration"], 3),
+        })
+        offset += clip["audio_duration"]
+
+    print(f"[VOICEOVER] {len(clips)} scene clips ready ({synthesized} synthesized), total {offset:.2f}s")
+
+    # Клипы склеены без перекодирования - параметры потока те же, длительность - сумма клипов
+    first = clips[0]["artifact"]
+    artifact = {
+        "path": output.name,
+        "duration": offset,
+        "codec": first["codec"],
+        "sample_rate": first["sample_rate"],
+        "channels": first["channels"],
+        "size": os.path.getsize(output.name),
+    }
+
+    return {
+        "artifact": artifact,
+        "text": ". ".join(text for _, text in voiced),
+        "scenes": scene_timings,
+        "synthesized": synthesized,
+    }
+
+
+async def generate_subtitles_from_audio(audio_path: str, original_text: str = None) -> str:
     """
     Генерирует точные субтитры из аудио файла используя faster-whisper
 
     ВАЖНО: Если передан original_text, использует его вместо распознанного текста,
     но сохраняет таймкоды от Whisper. Это гарантирует корректный текст без ошибок распознавания.
 
+    Модель загружается один раз на процесс (см. whisper_model.py),
+    распознавание выполняется в выделенном потоке модели.
+
     Args:
         audio_path: Путь к аудио файлу
         original_text: Исходный текст (из сценария), если None - использует распознанный Whisper
@@ -149,21 +334,14 @@ def generate_subtitles_from_audio(audio_path: str, original_text: str = None) ->
     """
     try:
         # Проверяем доступность faster-whisper
-        try:
-            from faster_whisper import WhisperModel
-            print(f"[WHISPER] faster-whisper module available")
-        except ImportError:
+        if not is_whisper_available():
             print(f"[WHISPER] ⚠️ faster-whisper not installed, skipping subtitle generation from audio")
             return ""
 
         print(f"[WHISPER] Generating subtitles from audio: {audio_path}")
 
-        # Используем faster-whisper (CPU mode для экономии памяти)
-        # tiny - самая маленькая модель (~40MB), base ~75MB
-        model = WhisperModel("tiny", device="cpu", compute_type="int8")
-
         print(f"[WHISPER] Transcribing audio...")
-        segments, info = model.transcribe(
+        segments, info = await transcribe_audio(
             audio_path,
             language="ru",
             word_timestamps=True,  # Точная синхронизация по словам
@@ -248,67 +426,81 @@ def format_timestamp_srt(seconds: float) -> str:
     return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
 
 
-def generate_subtitles_with_whisper_timing(segments, original_text: str) -> str:
+def split_into_phrases(text: str) -> list:
     """
-    Комбинирует таймкоды от Whisper с исходным текстом из сценария
-    Это даёт идеальную синхронизацию БЕЗ ошибок распознавания
-
-    Args:
-        segments: Whisper segments с таймкодами
-        original_text: Исходный текст из сценария (корректный)
-
-    Returns:
-        str: SRT контент с корректным текстом и точными таймкодами
+    Разбивает текст на короткие фразы для субтитров:
+    сначала по предложениям, затем длинные предложения (>50 символов) - по запятым и союзам
     """
-    print(f"[WHISPER_TIMING] Generating subtitles from original text with Whisper timings")
-
-    # Разбиваем исходный текст на фразы (как в generate_subtitles)
-    sentences = original_text.replace("! ", "!|").replace("? ", "?|").replace(". ", ".|").split("|")
+    sentences = text.replace("! ", "!|").replace("? ", "?|").replace(". ", ".|").split("|")
     sentences = [s.strip() for s in sentences if s.strip()]
 
     phrases = []
     for sentence in sentences:
         if len(sentence) > 50:
-            # Разбиваем длинные предложения
+            # Разбиваем по запятым, союзам "и", "но", "а", многоточиям
             parts = sentence.replace(", ", ",|").replace("... ", "...|").replace(" и ", " и|").replace(" но ", " но|").replace(" а ", " а|").split("|")
             for part in parts:
                 part = part.strip()
-                if part and part != "...":
+                if part and part != "...":  # Пропускаем чистые паузы
                     phrases.append(part)
         else:
             phrases.append(sentence)
 
+    return phrases
+
+
+def generate_subtitles_with_whisper_timing(segments, original_text: str) -> str:
+    """
+    Комбинирует таймкоды от Whisper с исходным текстом из сценария
+    Это даёт идеальную синхронизацию БЕЗ ошибок распознавания
+
+    Слова сценария выравниваются по словам Whisper (см. subtitle_alignment.py),
+    поэтому каждая фраза получает реальные время начала и конца.
+    Если Whisper не вернул таймкоды слов - фразы распределяются пропорционально длине
+
+    Args:
+        segments: Whisper segments с таймкодами
+        original_text: Исходный текст из сценария (корректный)
+
+    Returns:
+        str: SRT контент с корректным текстом и точными таймкодами
+    """
+    print(f"[WHISPER_TIMING] Generating subtitles from original text with Whisper timings")
+
+    phrases = split_into_phrases(original_text)
     if not phrases:
         print(f"[WHISPER_TIMING] No phrases extracted from original text")
         return ""
 
     print(f"[WHISPER_TIMING] Extracted {len(phrases)} phrases from original text")
 
-    # Собираем все таймкоды от Whisper
-    all_timecodes = []
-    for segment in segments:
-        all_timecodes.append({
-            'start': segment.start,
-            'end': segment.end
-        })
-
-    if not all_timecodes:
+    if not segments:
         print(f"[WHISPER_TIMING] No timecodes from Whisper")
         return ""
 
-    print(f"[WHISPER_TIMING] Got {len(all_timecodes)} timecode segments from Whisper")
+    # Собираем таймкоды слов от Whisper
+    words = []
+    for segment in segments:
+        for word in segment.words or []:
+            words.append((word.word, word.start, word.end))
+
+    if words:
+        print(f"[WHISPER_TIMING] Aligning {len(phrases)} phrases to {len(words)} Whisper words")
+        timings = align_phrases(phrases, words)
+    else:
+        # Нет таймкодов слов - распределяем фразы по длительности пропорционально числу символов
+        print(f"[WHISPER_TIMING] No word timestamps, distributing phrases by length")
+        start, total_end = segments[0].start, segments[-1].end
+        total_chars = sum(len(phrase) for phrase in phrases)
+        timings = []
+        position = 0
+        for phrase in phrases:
+            phrase_start = start + (total_end - start) * position / total_chars
+            position += len(phrase)
+            timings.append((phrase_start, start + (total_end - start) * position / total_chars))
 
-    # Распределяем фразы по таймкодам
     srt_lines = []
-    total_duration = all_timecodes[-1]['end']
-
-    # Равномерно распределяем фразы по общей длительности
-    for i, phrase in enumerate(phrases):
-        # Пропорционально распределяем время
-        start_time = (i / len(phrases)) * total_duration
-        end_time = ((i + 1) / len(phrases)) * total_duration
-
-        # Форматируем в SRT
+    for i, (phrase, (start_time, end_time)) in enumerate(zip(phrases, timings)):
         srt_lines.append(f"{i + 1}")
         srt_lines.append(f"{format_timestamp_srt(start_time)} --> {format_timestamp_srt(end_time)}")
         srt_lines.append(phrase)
@@ -334,23 +526,7 @@ def generate_subtitles(text: str, duration: float, start_offset: float = 0.1) ->
     Returns:
         str: Содержимое SRT файла
     """
-    # Сначала разбиваем по предложениям
-    sentences = text.replace("! ", "!|").replace("? ", "?|").replace(". ", ".|").split("|")
-    sentences = [s.strip() for s in sentences if s.strip()]
-
-    # Затем разбиваем длинные предложения на короткие фразы (по запятым и союзам)
-    phrases = []
-    for sentence in sentences:
-        # Если предложение длинное (>50 символов), разбиваем его
-        if len(sentence) > 50:
-            # Разбиваем по запятым, союзам "и", "но", "а", многоточиям
-            parts = sentence.replace(", ", ",|").replace("... ", "...|").replace(" и ", " и|").replace(" но ", " но|").replace(" а ", " а|").split("|")
-            for part in parts:
-                part = part.strip()
-                if part and part != "...":  # Пропускаем чистые паузы
-                    phrases.append(part)
-        else:
-            phrases.append(sentence)
+    phrases = split_into_phrases(text)
 
     if not phrases:
         return ""
@@ -402,25 +578,12 @@ async def upload_subtitles(srt_content: str, project_id: str) -> str:
     try:
         file_name = f"subtitles_{project_id}.srt"
 
-        # Используем upsert для перезаписи файла если он уже существует
         # ВАЖНО: Добавляем UTF-8 BOM для корректного отображения кириллицы в ffmpeg
-        res = supabase.storage.from_("videos").upload(
-            path=file_name,
-            file='\ufeff'.encode('utf-8') + srt_content.encode('utf-8'),
-            file_options={"content-type": "text/plain; charset=utf-8", "upsert": "true"}
+        return await upload_bytes(
+            '\ufeff'.encode('utf-8') + srt_content.encode('utf-8'),
+            file_name,
+            "text/plain; charset=utf-8"
         )
 
-        # Получаем публичный URL
-        try:
-            public_url = supabase.storage.from_("videos").get_public_url(file_name)
-            return public_url
-        except Exception:
-            # Fallback: создаем signed URL на 1 год
-            signed_url = supabase.storage.from_("videos").create_signed_url(
-                file_name,
-                expires_in=31536000  # 1 год в секундах
-            )
-            return signed_url['signedURL']
-
     except Exception as e:
         raise Exception(f"Failed to upload subtitles: {str(e)}")
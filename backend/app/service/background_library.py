@@ -0,0 +1,253 @@
+"""
+Библиотека фоновых видео
+
+Исходные фоны (assets/backgrounds/*.mp4) разного размера и fps, и раньше каждый рендер
+декодировал их целиком с -stream_loop и масштабировал/дополнял до 720x1280.
+Здесь каждый фон один раз перекодируется в готовые к рендеру сегменты:
+720x1280, 30 fps, ключевой кадр в начале каждого сегмента (BACKGROUND_SEGMENT_SECONDS),
+и описывается индексом (index.json). Рендер выбирает сегмент, с которого начать,
+и подаёт в ffmpeg только нужные сегменты через concat demuxer - без масштабирования
+и без декодирования лишнего.
+
+Подготовка выполняется при сборке Docker образа (scripts/prepare_backgrounds.py);
+пока индекса нет, рендер использует исходный файл.
+"""
+import json
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+from typing import Dict, List, Optional, Tuple
+from app.config import BACKGROUND_LIBRARY_DIR, BACKGROUND_SEGMENT_SECONDS
+from app.service.ffmpeg_binary import FFMPEG_BINARY
+
+# Пути к фоновым видео (абсолютные пути от корня backend)
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BACKGROUND_VIDEOS = {
+    "minecraft": os.path.join(_BACKEND_DIR, "assets", "backgrounds", "minecraft.mp4"),
+    "subway": os.path.join(_BACKEND_DIR, "assets", "backgrounds", "subway.mp4"),
+    "abstract": os.path.join(_BACKEND_DIR, "assets", "backgrounds", "abstract.mp4"),
+}
+
+# Меняется при изменении параметров перекодирования - индексы старой версии пересобираются
+INDEX_VERSION = 1
+
+VIDEO_WIDTH = 720
+VIDEO_HEIGHT = 1280
+FPS = 30
+
+# Кэш прочитанных индексов: style -> (mtime index.json, index)
+_indexes: Dict[str, Tuple[float, dict]] = {}
+
+
+def _source_identity(source_path: str) -> dict:
+    stat = os.stat(source_path)
+    return {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+
+def _style_dir(style: str) -> str:
+    return os.path.join(BACKGROUND_LIBRARY_DIR, style)
+
+
+def _is_current(index: dict, source_path: str) -> bool:
+    return (
+        index.get("version") == INDEX_VERSION
+        and index.get("segment_seconds") == BACKGROUND_SEGMENT_SECONDS
+        and index.get("source") == _source_identity(source_path)
+    )
+
+
+def get_background_index(style: str) -> Optional[dict]:
+    """
+    Индекс подготовленного фона или None, если фон ещё не перекодирован
+    (или исходный файл изменился после подготовки)
+    """
+    source_path = BACKGROUND_VIDEOS.get(style)
+    if not source_path or not os.path.exists(source_path):
+        return None
+
+    index_path = os.path.join(_style_dir(style), "index.json")
+    try:
+        mtime = os.path.getmtime(index_path)
+    except OSError:
+        return None
+
+    cached = _indexes.get(style)
+    if cached and cached[0] == mtime:
+        index = cached[1]
+    else:
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        _indexes[style] = (mtime, index)
+
+    return index if _is_current(index, source_path) else None
+
+
+def prepare_background(style: str, force: bool = False) -> Optional[dict]:
+    """
+    Перекодирует фон в сегменты библиотеки (синхронно, может занять минуту и больше)
+
+    Результат пишется во временную директорию и атомарно переименовывается,
+    поэтому рендеры никогда не видят частично подготовленный фон
+
+    Returns:
+        dict | None: Индекс фона или None, если исходного файла нет
+    """
+    source_path = BACKGROUND_VIDEOS.get(style)
+    if not source_path or not os.path.exists(source_path):
+        print(f"[BACKGROUNDS] {style}: source not found, skipping")
+        return None
+
+    if not force:
+        index = get_background_index(style)
+        if index:
+            return index
+
+    print(f"[BACKGROUNDS] {style}: transcoding {source_path} into {BACKGROUND_SEGMENT_SECONDS}s segments...")
+    os.makedirs(BACKGROUND_LIBRARY_DIR, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix=f".{style}_", dir=BACKGROUND_LIBRARY_DIR)
+
+    try:
+        segment_list = os.path.join(work_dir, "segments.csv")
+        cmd = [
+            FFMPEG_BINARY, "-y", "-v", "error",
+            "-i", source_path,
+            "-an",
+            "-vf", f"scale={VIDEO_WIDTH}:{VIDEO_HEIGHT}:force_original_aspect_ratio=decrease,"
+                   f"pad={VIDEO_WIDTH}:{VIDEO_HEIGHT}:(ow-iw)/2:(oh-ih)/2,fps={FPS}",
+            "-c:v", "libx264",
+            "-preset", "veryfast",
+            "-crf", "23",
+            "-pix_fmt", "yuv420p",
+            # Ключевой кадр строго в начале каждого сегмента
+            "-force_key_frames", f"expr:gte(t,n_forced*{BACKGROUND_SEGMENT_SECONDS})",
+            "-sc_threshold", "0",
+            "-f", "segment",
+            "-segment_time", str(BACKGROUND_SEGMENT_SECONDS),
+            # Кадр на границе может оказаться чуть раньше её из-за округления timestamps
+            "-segment_time_delta", "0.05",
+            "-segment_list", segment_list,
+            "-segment_list_type", "csv",
+            "-reset_timestamps", "1",
+            os.path.join(work_dir, "seg_%05d.mp4")
+        ]
+        result = subprocess.run(cmd, capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.decode("utf-8", errors="ignore")[-500:])
+
+        segments = []
+        with open(segment_list, "r", encoding="utf-8") as f:
+            for line in f:
+                name, start, end = line.strip().split(",")[:3]
+                segments.append({"file": name, "start": float(start), "duration": float(end) - float(start)})
+        os.unlink(segment_list)
+
+        if not segments:
+            raise RuntimeError("No segments produced")
+
+        index = {
+            "version": INDEX_VERSION,
+            "style": style,
+            "source": _source_identity(source_path),
+            "width": VIDEO_WIDTH,
+            "height": VIDEO_HEIGHT,
+            "fps": FPS,
+            "segment_seconds": BACKGROUND_SEGMENT_SECONDS,
+            "duration": sum(segment["duration"] for segment in segments),
+            "segments": segments,
+        }
+        with open(os.path.join(work_dir, "index.json"), "w", encoding="utf-8") as f:
+            json.dump(index, f)
+
+        # Подменяем старую версию библиотеки
+        style_dir = _style_dir(style)
+        if os.path.exists(style_dir):
+            old_dir = tempfile.mkdtemp(prefix=f".{style}_old_", dir=BACKGROUND_LIBRARY_DIR)
+            os.rename(style_dir, os.path.join(old_dir, style))
+            os.rename(work_dir, style_dir)
+            shutil.rmtree(old_dir, ignore_errors=True)
+        else:
+            os.rename(work_dir, style_dir)
+
+        print(f"[BACKGROUNDS] {style}: {len(segments)} segments, {index['duration']:.1f}s")
+        return index
+
+    except Exception as e:
+        print(f"[BACKGROUNDS] {style}: preparation failed: {str(e)}")
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return None
+
+
+def prepare_all_backgrounds(force: bool = False) -> Dict[str, Optional[dict]]:
+    """Подготавливает все фоны из BACKGROUND_VIDEOS"""
+    return {style: prepare_background(style, force=force) for style in BACKGROUND_VIDEOS}
+
+
+def background_identity(index: dict) -> str:
+    """Идентичность подготовленного фона для ключей кэша сегментов"""
+    source = index["source"]
+    return f"lib{index['version']}:{index['style']}:{source['size']}:{source['mtime']}"
+
+
+def snap_offset(index: dict, offset: float) -> float:
+    """Смещение, выровненное вниз до начала сегмента (там ключевой кадр - декодировать лишнее не нужно)"""
+    offset = offset % index["duration"] if index["duration"] else 0.0
+    start = 0.0
+    for segment in index["segments"]:
+        if segment["start"] + segment["duration"] > offset:
+            return segment["start"]
+        start = segment["start"]
+    return start
+
+
+def random_offset(index: dict, duration: float) -> float:
+    """Случайная точка старта (начало сегмента), чтобы рендеры начинались с разных мест фона"""
+    span = max(index["duration"] - duration, 0.0)
+    return snap_offset(index, random.uniform(0, span))
+
+
+def background_input(index: dict, start: float, duration: float) -> Tuple[str, List[str]]:
+    """
+    Готовит вход ffmpeg для отрезка фона [start, start + duration)
+
+    Пишет список сегментов для concat demuxer, начиная с сегмента, содержащего start,
+    и по кругу (если фон короче ролика) до покрытия нужной длительности
+
+    Returns:
+        tuple: (путь к файлу списка - удаляет вызывающий код, опции входа ffmpeg)
+    """
+    segments = index["segments"]
+    directory = _style_dir(index["style"])
+
+    first = 0
+    for i, segment in enumerate(segments):
+        if segment["start"] + segment["duration"] > start:
+            first = i
+            break
+
+    lines = []
+    covered = -(start - segments[first]["start"])
+    i = first
+    # Небольшой запас: сегменты могут быть на кадр короче номинала
+    while covered < duration + 1.0 / FPS:
+        segment = segments[i % len(segments)]
+        path = os.path.join(directory, segment["file"]).replace("'", "'\\''")
+        lines.append(f"file '{path}'")
+        covered += segment["duration"]
+        i += 1
+
+    list_file = tempfile.NamedTemporaryFile(delete=False, suffix=".txt", mode="w", encoding="utf-8")
+    list_file.write("\n".join(lines) + "\n")
+    list_file.close()
+
+    options = ["-f", "concat", "-safe", "0"]
+    inner_offset = start - segments[first]["start"]
+    if inner_offset > 0:
+        options = ["-ss", f"{inner_offset:.3f}"] + options
+
+    return list_file.name, options
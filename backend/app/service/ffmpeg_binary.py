@@ -0,0 +1,23 @@
+"""
+Путь к ffmpeg/ffprobe - одно определение для всех сервисов
+
+Приоритет: системный (Docker) -> imageio-ffmpeg (локальная разработка Windows)
+"""
+import shutil
+
+if shutil.which("ffmpeg"):
+    # Docker или Linux с установленным ffmpeg
+    FFMPEG_BINARY = "ffmpeg"
+    FFPROBE_BINARY = "ffprobe"
+    print(f"[FFMPEG] Using system ffmpeg/ffprobe")
+else:
+    # Локальная разработка без системного ffmpeg - используем imageio-ffmpeg
+    try:
+        import imageio_ffmpeg
+        FFMPEG_BINARY = imageio_ffmpeg.get_ffmpeg_exe()
+        FFPROBE_BINARY = imageio_ffmpeg.get_ffmpeg_exe().replace('ffmpeg', 'ffprobe')
+        print(f"[FFMPEG] Using imageio-ffmpeg binaries: {FFMPEG_BINARY}")
+    except ImportError:
+        FFMPEG_BINARY = "ffmpeg"
+        FFPROBE_BINARY = "ffprobe"
+        print(f"[FFMPEG] WARNING: No ffmpeg found, will try system commands")
@@ -0,0 +1,33 @@
+"""
+Общий асинхронный HTTP клиент (httpx) с пулом соединений
+Используется для всех внешних запросов: провайдеры изображений, скачивание файлов
+"""
+import httpx
+
+_client: httpx.AsyncClient | None = None
+
+# Лимиты пула соединений: достаточно для параллельной загрузки сцен, но без лавины сокетов
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+HTTP_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Возвращает общий httpx.AsyncClient (создаётся при первом обращении)"""
+    global _client
+
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            limits=HTTP_LIMITS,
+            timeout=HTTP_TIMEOUT,
+            follow_redirects=True,
+        )
+    return _client
+
+
+async def close_http_client():
+    """Закрывает общий клиент (при остановке приложения)"""
+    global _client
+
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
@@ -0,0 +1,131 @@
+"""
+Кэш сгенерированных изображений по хэшу промпта (content-addressed)
+
+Ключ - sha256 от нормализованного промпта, стиля и размера изображения.
+Провайдер в ключ не входит намеренно: ключ описывает запрос, а не способ его выполнить.
+Провайдера выбирает provider_router по латентности и состоянию circuit breaker, и с провайдером
+в ключе попадание в кэш зависело бы от того, какой провайдер сейчас доступен. Провайдер
+хранится рядом с URL (для статистики), но на поиск не влияет.
+Два уровня:
+    1. LRU в памяти процесса с TTL (мгновенный ответ)
+    2. Таблица image_cache в Supabase (общая для API и воркеров, переживает рестарт)
+"""
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+from app.config import IMAGE_CACHE_ENABLED, IMAGE_CACHE_MAX_ENTRIES, IMAGE_CACHE_TTL_SECONDS
+from app.db.supa_request import get_db
+
+_memory_cache: "OrderedDict[str, dict]" = OrderedDict()
+
+_stats = {
+    "memory_hits": 0,
+    "db_hits": 0,
+    "misses": 0,
+    "stores": 0,
+    "evictions": 0,
+    "expired": 0,
+}
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Нормализует промпт: регистр, пробелы, пунктуация по краям"""
+    prompt = (prompt or "").lower().strip()
+    prompt = re.sub(r"\s+", " ", prompt)
+    return prompt.strip(" .,;")
+
+
+def make_cache_key(prompt: str, style: str = None, width: int = 768, height: int = 1024) -> str:
+    """Ключ кэша: sha256(нормализованный промпт | стиль | размер)"""
+    raw = "|".join([normalize_prompt(prompt), normalize_prompt(style or ""), f"{width}x{height}"])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _remember(key: str, entry: dict):
+    _memory_cache[key] = entry
+    _memory_cache.move_to_end(key)
+    while len(_memory_cache) > IMAGE_CACHE_MAX_ENTRIES:
+        _memory_cache.popitem(last=False)
+        _stats["evictions"] += 1
+
+
+def _is_expired(created_at: float) -> bool:
+    return IMAGE_CACHE_TTL_SECONDS > 0 and time.time() - created_at > IMAGE_CACHE_TTL_SECONDS
+
+
+async def get_cached_image(key: str) -> Optional[str]:
+    """
+    Ищет изображение в кэше (сначала память, затем Supabase)
+
+    Returns:
+        str | None: URL изображения или None при промахе
+    """
+    if not IMAGE_CACHE_ENABLED:
+        return None
+
+    entry = _memory_cache.get(key)
+    if entry:
+        if _is_expired(entry["created_at"]):
+            _memory_cache.pop(key, None)
+            _stats["expired"] += 1
+        else:
+            _memory_cache.move_to_end(key)
+            _stats["memory_hits"] += 1
+            print(f"[IMAGE_CACHE] Memory hit {key[:12]} ({entry['provider']})")
+            return entry["image_url"]
+
+    try:
+        db = await get_db()
+        res = await db.table("image_cache").select("image_url, provider, created_at").eq("prompt_hash", key).limit(1).execute()
+        if res.data:
+            row = res.data[0]
+            created_at = datetime.fromisoformat(row["created_at"]).timestamp()
+            if _is_expired(created_at):
+                _stats["expired"] += 1
+                await db.table("image_cache").delete().eq("prompt_hash", key).execute()
+            else:
+                _remember(key, {"image_url": row["image_url"], "provider": row.get("provider"), "created_at": created_at})
+                _stats["db_hits"] += 1
+                print(f"[IMAGE_CACHE] DB hit {key[:12]} ({row.get('provider')})")
+                return row["image_url"]
+    except Exception as e:
+        # Кэш не должен ломать генерацию
+        print(f"[IMAGE_CACHE] Lookup error: {str(e)}")
+
+    _stats["misses"] += 1
+    return None
+
+
+async def store_cached_image(key: str, image_url: str, provider: str, prompt: str):
+    """Сохраняет результат генерации в оба уровня кэша"""
+    if not IMAGE_CACHE_ENABLED:
+        return
+
+    _remember(key, {"image_url": image_url, "provider": provider, "created_at": time.time()})
+    _stats["stores"] += 1
+
+    try:
+        db = await get_db()
+        await db.table("image_cache").upsert({
+            "prompt_hash": key,
+            "image_url": image_url,
+            "provider": provider,
+            "prompt": prompt[:500],
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }).execute()
+    except Exception as e:
+        print(f"[IMAGE_CACHE] Store error: {str(e)}")
+
+
+def get_image_cache_stats() -> dict:
+    """Метрики кэша (в пределах процесса)"""
+    hits = _stats["memory_hits"] + _stats["db_hits"]
+    lookups = hits + _stats["misses"]
+    return {
+        **_stats,
+        "entries": len(_memory_cache),
+        "hit_ratio": round(hits / lookups, 3) if lookups else None,
+    }
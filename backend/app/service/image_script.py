@@ -1,21 +1,27 @@
 import urllib.parse
-import requests
+import httpx
 import time
 import asyncio
 import io
 import base64
 from PIL import Image
-from app.db.supa_request import supabase
-from app.config import HUGGING_FACE_API_KEY
+from app.service.storage_io import upload_bytes
+from app.service.http_client import get_http_client
+from app.config import HUGGING_FACE_API_KEY, IMAGE_SCENE_CONCURRENCY, IMAGE_PROVIDER_CONCURRENCY, PROVIDER_OPEN_SECONDS
+from app.service.provider_router import ProviderRouter
+from app.service.image_cache import make_cache_key, get_cached_image, store_cached_image
+from typing import List, Dict, Callable, Awaitable, Optional
 import uuid
 
 # Hugging Face API endpoint для генерации изображений
 HF_API_URL = "https://router.huggingface.co/hf-inference/models/black-forest-labs/FLUX.1-schnell"
 
-# Глобальный флаг для отслеживания rate limit HF (сбрасывается при перезапуске сервера)
-_HF_RATE_LIMITED = False
+# Размер генерируемых изображений (входит в ключ кэша)
+IMAGE_WIDTH = 768
+IMAGE_HEIGHT = 1024
 
 # Список API для генерации изображений (в порядке приоритета)
+# "concurrency" - лимит одновременных запросов к провайдеру (по умолчанию IMAGE_PROVIDER_CONCURRENCY)
 IMAGE_APIS = [
     {
         "name": "Hugging Face FLUX Schnell",
@@ -25,12 +31,14 @@ IMAGE_APIS = [
     {
         "name": "Pollinations (Turbo)",
         "url_template": "https://image.pollinations.ai/prompt/{prompt}?width=768&height=1024&nologo=true&model=turbo",
-        "timeout": 45  # Увеличен с 10 до 45 секунд
+        "timeout": 45,  # Увеличен с 10 до 45 секунд
+        "concurrency": 3
     },
     {
         "name": "Pollinations (Flux)",
         "url_template": "https://image.pollinations.ai/prompt/{prompt}?width=768&height=1024&nologo=true&model=flux",
-        "timeout": 60  # Flux модель медленнее но качественнее
+        "timeout": 60,  # Flux модель медленнее но качественнее
+        "concurrency": 3
     },
     {
         "name": "Replicate Stable Diffusion",
@@ -40,19 +48,26 @@ IMAGE_APIS = [
     }
 ]
 
+# Статистика и circuit breaker провайдеров (на процесс)
+provider_router = ProviderRouter(IMAGE_APIS)
+
+# Семафоры провайдеров (создаются лениво, по одному на провайдера в процессе)
+_PROVIDER_SEMAPHORES: Dict[str, asyncio.Semaphore] = {}
+
+
+def _provider_semaphore(api_config: dict) -> asyncio.Semaphore:
+    """Ограничивает количество одновременных запросов к провайдеру"""
+    name = api_config["name"]
+    if name not in _PROVIDER_SEMAPHORES:
+        _PROVIDER_SEMAPHORES[name] = asyncio.Semaphore(api_config.get("concurrency", IMAGE_PROVIDER_CONCURRENCY))
+    return _PROVIDER_SEMAPHORES[name]
+
 
 async def generate_with_huggingface(prompt: str, timeout: int = 30):
     """
     Генерирует изображение через Hugging Face Inference API
     Загружает результат в Supabase Storage и возвращает публичный URL
     """
-    global _HF_RATE_LIMITED
-
-    # Если уже получили rate limit - сразу пропускаем
-    if _HF_RATE_LIMITED:
-        print(f"[HF] Skipping due to previous rate limit")
-        return "SKIP"
-
     try:
         print(f"[HF] Sending request to Hugging Face...")
 
@@ -64,13 +79,13 @@ async def generate_with_huggingface(prompt: str, timeout: int = 30):
         payload = {
             "inputs": prompt,
             "parameters": {
-                "width": 768,
-                "height": 1024,
+                "width": IMAGE_WIDTH,
+                "height": IMAGE_HEIGHT,
                 "num_inference_steps": 4  # Schnell модель работает с 4 шагами
             }
         }
 
-        response = requests.post(
+        response = await get_http_client().post(
             HF_API_URL,
             headers=headers,
             json=payload,
@@ -85,27 +100,18 @@ async def generate_with_huggingface(prompt: str, timeout: int = 30):
             # Загружаем в Supabase Storage
             file_name = f"generated_{uuid.uuid4()}.png"
 
-            supabase.storage.from_("videos").upload(
-                path=file_name,
-                file=image_bytes,
-                file_options={"content-type": "image/png", "upsert": "true"}
-            )
-
-            # Получаем публичный URL
-            public_url = supabase.storage.from_("videos").get_public_url(file_name)
+            public_url = await upload_bytes(image_bytes, file_name, "image/png")
             print(f"[HF] ✓ Uploaded to Supabase: {public_url}")
 
             return public_url
 
         elif response.status_code == 503:
-            # Модель загружается (нужно подождать)
+            # Модель загружается (ждать будет вызывающий код, не занимая слот провайдера)
             print(f"[HF] Model is loading, estimated time: 20s")
-            await asyncio.sleep(20)
-            return None  # Вернет None для retry
-        elif response.status_code == 402:
-            # Rate limit / токены закончились
-            _HF_RATE_LIMITED = True  # Устанавливаем флаг
-            print(f"[HF] Rate limit exceeded (токены закончились), пропускаем HF API для всех последующих запросов")
+            return "LOADING"
+        elif response.status_code in (402, 429):
+            # Rate limit / токены закончились - breaker выключит HF на долгий cooldown
+            print(f"[HF] Rate limit exceeded ({response.status_code}), disabling HF until half-open probe")
             return "SKIP"  # Специальный код для пропуска этого API
         else:
             print(f"[HF] Error {response.status_code}: {response.text[:200]}")
@@ -116,43 +122,98 @@ async def generate_with_huggingface(prompt: str, timeout: int = 30):
         return None
 
 
-async def generate_image(visual_promt: str, max_retries: int = 3):
+async def generate_image(visual_promt: str, max_retries: int = 3, style: str = None, use_cache: bool = True):
     """
-    Генерирует изображение, пробуя несколько API в порядке приоритета
+    Генерирует изображение (с кэшем по хэшу промпта)
+
+    Одинаковый (после нормализации и сокращения) промпт со тем же стилем
+    возвращает ранее сгенерированное изображение без обращения к провайдерам.
+    Заглушки при отказе всех провайдеров в кэш не попадают.
 
     Args:
         visual_promt: Текстовый промпт для генерации
         max_retries: Максимальное количество попыток на API
+        style: Модификатор стиля (добавляется в начало промпта)
+        use_cache: False - всегда генерировать заново (результат всё равно кэшируется)
 
     Returns:
         str: URL сгенерированного изображения
     """
+    if style:
+        visual_promt = f"{style}, {visual_promt}"
+
     # Сокращаем промпт если он слишком длинный
     original_prompt = visual_promt
     if len(visual_promt) > 180:
         visual_promt = visual_promt[:160] + "... vertical, cinematic"
         print(f"[IMAGE_GEN] Prompt shortened from {len(original_prompt)} to {len(visual_promt)} chars")
 
-    # Пробуем каждый API по очереди
-    for api_index, api_config in enumerate(IMAGE_APIS):
+    cache_key = make_cache_key(visual_promt, width=IMAGE_WIDTH, height=IMAGE_HEIGHT)
+    if use_cache:
+        cached_url = await get_cached_image(cache_key)
+        if cached_url:
+            return cached_url
+
+    image_url, provider = await _generate_with_providers(visual_promt, max_retries)
+
+    if image_url:
+        await store_cached_image(cache_key, image_url, provider, visual_promt)
+        return image_url
+
+    # Если все API провалились - возвращаем placeholder
+    print(f"[IMAGE_GEN] ⚠️ All APIs failed, using placeholder")
+    return await generate_placeholder_image(visual_promt)
+
+
+async def _generate_with_providers(visual_promt: str, max_retries: int = 3):
+    """
+    Генерирует изображение, пробуя провайдеров в порядке ожидаемой латентности
+
+    Порядок и доступность провайдеров определяет provider_router: провайдеры
+    с открытым circuit breaker пропускаются до истечения cooldown.
+    При таймауте сразу переходим к следующему провайдеру - повтор
+    у медленного провайдера только увеличивает хвост латентности.
+
+    Returns:
+        tuple: (URL, имя провайдера) или (None, None), если все провайдеры отказали
+    """
+    ranked_apis = provider_router.ranked()
+
+    for api_index, api_config in enumerate(ranked_apis):
         api_name = api_config["name"]
-        print(f"\n[IMAGE_GEN] Trying API {api_index + 1}/{len(IMAGE_APIS)}: {api_name}")
+        health = provider_router.get(api_config)
+        print(f"\n[IMAGE_GEN] Trying API {api_index + 1}/{len(ranked_apis)}: {api_name} "
+              f"(state={health.state}, expected={health.expected_latency():.1f}s)")
 
         # Пробуем несколько раз для текущего API
         for attempt in range(max_retries):
-            try:
-                print(f"[IMAGE_GEN] Attempt {attempt + 1}/{max_retries}...")
+            if not health.allow_request():
+                print(f"[IMAGE_GEN] Skipping {api_name} (circuit {health.state})")
+                break
+
+            print(f"[IMAGE_GEN] Attempt {attempt + 1}/{max_retries}...")
+            started = time.monotonic()
 
+            try:
                 # Hugging Face API (загружает в Storage)
                 if api_config.get("type") == "huggingface":
-                    result = await generate_with_huggingface(visual_promt, api_config["timeout"])
+                    async with _provider_semaphore(api_config):
+                        result = await generate_with_huggingface(visual_promt, api_config["timeout"])
+                    latency = time.monotonic() - started
+
                     if result == "SKIP":
-                        print(f"[IMAGE_GEN] Skipping {api_name} (rate limit)")
+                        health.record_failure(latency, fatal=True)
                         break  # Пропускаем этот API полностью
+                    elif result == "LOADING":
+                        health.record_failure(latency)
+                        await asyncio.sleep(20)
+                        continue
                     elif result:
-                        print(f"[IMAGE_GEN] ✓ Success with {api_name}!")
-                        return result
+                        health.record_success(latency)
+                        print(f"[IMAGE_GEN] ✓ Success with {api_name} in {latency:.1f}s!")
+                        return result, api_name
                     else:
+                        health.record_failure(latency)
                         print(f"[IMAGE_GEN] HF returned None, retrying...")
                         await asyncio.sleep(5)
                         continue
@@ -163,38 +224,103 @@ async def generate_image(visual_promt: str, max_retries: int = 3):
                     url = api_config["url_template"].format(prompt=encoded_prompt)
                     print(f"[IMAGE_GEN] URL: {url[:120]}...")
 
-                    response = requests.get(url, timeout=api_config["timeout"], stream=True)
+                    async with _provider_semaphore(api_config):
+                        response = await get_http_client().get(url, timeout=api_config["timeout"])
+                    latency = time.monotonic() - started
 
                     if response.status_code == 200:
                         content_type = response.headers.get('content-type', '')
                         if 'image' in content_type or len(response.content) > 1000:
-                            print(f"[IMAGE_GEN] ✓ Success with {api_name}!")
-                            return url
+                            health.record_success(latency)
+                            print(f"[IMAGE_GEN] ✓ Success with {api_name} in {latency:.1f}s!")
+                            return url, api_name
                         else:
+                            health.record_failure(latency)
                             print(f"[IMAGE_GEN] Response is not an image, trying next...")
                             break
 
                     elif response.status_code in [530, 502, 503, 504]:
+                        health.record_failure(latency)
                         print(f"[IMAGE_GEN] Server error {response.status_code}, waiting...")
                         await asyncio.sleep(2 ** attempt)
+                    elif response.status_code in (402, 429):
+                        health.record_failure(latency, fatal=True, cooldown=PROVIDER_OPEN_SECONDS * 4)
+                        print(f"[IMAGE_GEN] Rate limited by {api_name}, trying next API...")
+                        break
                     else:
+                        health.record_failure(latency)
                         print(f"[IMAGE_GEN] Status {response.status_code}, trying next API...")
                         break
 
-            except requests.exceptions.Timeout:
-                print(f"[IMAGE_GEN] Timeout after {api_config['timeout']}s")
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(1)
-                else:
-                    break
+            except httpx.TimeoutException:
+                health.record_failure(time.monotonic() - started)
+                print(f"[IMAGE_GEN] Timeout after {api_config['timeout']}s, trying next API...")
+                break
 
-            except requests.exceptions.RequestException as e:
+            except httpx.HTTPError as e:
+                health.record_failure(time.monotonic() - started)
                 print(f"[IMAGE_GEN] Request error: {str(e)[:100]}")
                 break
 
-    # Если все API провалились - возвращаем placeholder
-    print(f"[IMAGE_GEN] ⚠️ All APIs failed, using placeholder")
-    return await generate_placeholder_image(visual_promt)
+            except Exception:
+                health.record_failure(time.monotonic() - started)
+                raise
+
+            finally:
+                # Не оставляем half-open пробу "висящей" (в том числе при отмене задачи)
+                health.release_probe()
+
+    return None, None
+
+
+async def generate_scene_images(
+    scenes: List[Dict],
+    on_scene_done: Optional[Callable[[Dict, str], Awaitable[None]]] = None,
+    on_progress: Optional[Callable[[Dict], Awaitable[None]]] = None,
+    concurrency: int = IMAGE_SCENE_CONCURRENCY
+) -> Dict:
+    """
+    Генерирует изображения для нескольких сцен параллельно
+
+    Одновременно обрабатывается не более concurrency сцен; нагрузку на каждого
+    провайдера дополнительно ограничивают семафоры провайдеров.
+    Каждый готовый URL сразу отдаётся в on_scene_done (например, запись в БД),
+    не дожидаясь остальных сцен.
+
+    Args:
+        scenes: Сцены с полями id и visual_prompt
+        on_scene_done: Колбэк (scene, image_url), вызывается для каждой готовой сцены
+        on_progress: Колбэк с текущим прогрессом после каждой сцены
+        concurrency: Максимум одновременно обрабатываемых сцен
+
+    Returns:
+        dict: Прогресс {"total", "done", "failed", "pending", "results"}
+    """
+    progress = {"total": len(scenes), "done": 0, "failed": 0, "pending": len(scenes)}
+    results = {}
+    scene_semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def process(scene: Dict):
+        promt = scene.get("visual_prompt") or ""
+        async with scene_semaphore:
+            try:
+                image_url = await generate_image(promt)
+                if on_scene_done:
+                    await on_scene_done(scene, image_url)
+                results[scene["id"]] = image_url
+                progress["done"] += 1
+                print(f"[IMAGE_GEN] ✓ Scene {scene['id']} ready ({progress['done']}/{progress['total']})")
+            except Exception as e:
+                progress["failed"] += 1
+                print(f"[IMAGE_GEN] ✗ Error for scene {scene['id']}: {str(e)}")
+
+            progress["pending"] -= 1
+            if on_progress:
+                await on_progress(dict(progress))
+
+    await asyncio.gather(*(process(scene) for scene in scenes))
+
+    return {**progress, "results": results}
 
 
 async def generate_placeholder_image(visual_promt: str):
@@ -205,7 +331,7 @@ async def generate_placeholder_image(visual_promt: str):
     from app.db.supa_request import get_random_fallback_image
 
     # Пробуем получить случайное изображение из базы
-    fallback_url = get_random_fallback_image()
+    fallback_url = await get_random_fallback_image()
 
     if fallback_url:
         print(f"[IMAGE_GEN] Using fallback image from database: {fallback_url[:60]}...")
@@ -0,0 +1,126 @@
+"""
+Обработчики задач из очереди (выполняются в процессах воркера, см. worker.py)
+"""
+import asyncio
+from app.service.image_script import generate_scene_images
+from app.service.video_service import create_slideshow_video, download_from_supabase_or_url
+from app.service.job_queue import JOB_RENDER_VIDEO, JOB_GENERATE_IMAGES, update_job_progress
+from app.service.project_events import publish_project_event
+from app.db.supa_request import (
+    get_project_bundle,
+    get_visual_promt_by_project,
+    update_scene_image_url,
+    update_final_video_url,
+    update_render_status,
+)
+
+
+#ГЕНЕРАЦИЯ ВСЕХ ИЗОБРАЖЕНИЙ
+async def generate_images_job(job: dict):
+    """
+    Задача генерации изображений для всех сцен проекта
+
+    Сцены генерируются параллельно, каждый готовый URL сразу пишется в таблицу scenes
+    и публикуется в события проекта, а прогресс (done/failed/pending) - в задачу очереди
+    """
+    project_id = job["project_id"]
+    scenes = await get_visual_promt_by_project(project_id) or []
+
+    print(f"\n[BG_GENERATE_IMAGES] Starting background image generation for project: {project_id}")
+    print(f"[BG_GENERATE_IMAGES] Scenes to process: {len(scenes)}")
+
+    await asyncio.to_thread(update_job_progress, job["id"], {"total": len(scenes), "done": 0, "failed": 0, "pending": len(scenes)})
+
+    async def on_scene_done(scene: dict, image_url: str):
+        await update_scene_image_url(scene["id"], image_url)
+        await publish_project_event(project_id, "scene_image", {"scene_id": scene["id"], "generated_image_url": image_url})
+        print(f"[BG_GENERATE_IMAGES] ✓ Scene {scene['id']} updated in DB")
+
+    async def on_progress(progress: dict):
+        await asyncio.to_thread(update_job_progress, job["id"], progress)
+        await publish_project_event(project_id, "image_progress", progress)
+
+    progress = await generate_scene_images(scenes, on_scene_done=on_scene_done, on_progress=on_progress)
+    await publish_project_event(project_id, "images_completed", {"done": progress["done"], "failed": progress["failed"]})
+
+    print(f"\n[BG_GENERATE_IMAGES] ✓ Background generation completed for project {project_id}: "
+          f"{progress['done']} done, {progress['failed']} failed")
+
+
+#РЕНДЕР ВИДЕО
+async def render_video_job(job: dict):
+    """
+    Задача рендеринга видео
+
+    Данные проекта читаются в момент выполнения (а не постановки в очередь),
+    чтобы рендер учитывал правки, сделанные пока задача ждала воркера
+    """
+    project_id = job["project_id"]
+    background_style = job["payload"].get("background", "minecraft")
+
+    try:
+        #Проект и сцены одним запросом, в обход кэша: рендер должен видеть последние правки
+        render_data = await get_project_bundle(project_id, "render", use_cache=False) or {}
+        scenes = render_data.get("scenes") or []
+        scenes_with_images = [s for s in scenes if s.get("generated_image_url")]
+
+        voiceover_url = render_data.get("voiceover_url")
+        subtitle_url = render_data.get("subtitle_url")
+        duration = render_data.get("project_time") or 30.0
+
+        #Загружаем субтитры если есть
+        subtitle_content = None
+        if subtitle_url:
+            try:
+                subtitle_bytes = await download_from_supabase_or_url(subtitle_url)
+                subtitle_content = subtitle_bytes.decode('utf-8')
+            except Exception as e:
+                print(f"Warning: Could not download subtitles: {str(e)}")
+
+        print(f"[RENDER_BG] Starting background render for project: {project_id}")
+        print(f"[RENDER_BG] Scenes count: {len(scenes_with_images)}")
+        print(f"[RENDER_BG] Voiceover URL: {voiceover_url}")
+        print(f"[RENDER_BG] Background style: {background_style}")
+        print(f"[RENDER_BG] Duration: {duration}")
+
+        await update_render_status(project_id, "rendering_video")
+        await publish_project_event(project_id, "render_status", {"render_status": "rendering_video", "job_id": job["id"]})
+
+        #Прогресс (процент, fps, ETA) пишется в задачу очереди - его читают /render-status и SSE
+        async def on_progress(progress: dict):
+            await asyncio.to_thread(update_job_progress, job["id"], progress)
+            await publish_project_event(project_id, "render_progress", progress)
+
+        #Создаем видео
+        print(f"[RENDER_BG] Calling create_slideshow_video...")
+        #Передаём все сцены: тайминги слайдов считаются по озвучке всех сцен
+        video_url = await create_slideshow_video(
+            scenes=scenes,
+            voiceover_url=voiceover_url,
+            subtitle_content=subtitle_content,
+            total_duration=duration,
+            background_style=background_style,
+            on_progress=on_progress
+        )
+
+        print(f"[RENDER_BG] Video created successfully: {video_url}")
+
+        #Сохраняем URL видео
+        await update_final_video_url(project_id, video_url)
+        await update_render_status(project_id, "completed")
+        await publish_project_event(project_id, "render_status", {"render_status": "completed", "final_video_url": video_url})
+        print(f"[RENDER_BG] Render completed!")
+
+    except Exception as e:
+        print(f"[RENDER_BG] Background render error: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        await update_render_status(project_id, "error")
+        await publish_project_event(project_id, "render_status", {"render_status": "error", "error": str(e)})
+        raise
+
+
+JOB_HANDLERS = {
+    JOB_RENDER_VIDEO: render_video_job,
+    JOB_GENERATE_IMAGES: generate_images_job,
+}
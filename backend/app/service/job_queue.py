@@ -0,0 +1,306 @@
+"""
+Персистентная очередь фоновых задач (рендер видео, генерация изображений)
+Хранится в локальном SQLite файле: задачи переживают перезапуск API и воркера,
+а воркеры из разных процессов безопасно забирают задачи через транзакции
+"""
+import json
+import sqlite3
+import time
+import uuid
+from typing import Optional, List
+from app.config import JOB_QUEUE_PATH, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS
+from app.db.sqlite_store import SqliteStore
+
+# Типы задач
+JOB_RENDER_VIDEO = "render_video"
+JOB_GENERATE_IMAGES = "generate_images"
+
+# Статусы задач: 'queued', 'running', 'completed', 'error'
+ACTIVE_STATUSES = ("queued", "running")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    project_id TEXT NOT NULL,
+    payload TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker_id TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    heartbeat_at REAL,
+    progress TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_kind ON jobs (status, kind, created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_project ON jobs (project_id, kind, created_at);
+"""
+
+# Колонки, добавленные после первой версии схемы (для уже существующих файлов очереди)
+_MIGRATIONS = {
+    "progress": "ALTER TABLE jobs ADD COLUMN progress TEXT",
+}
+
+def _migrate(conn: sqlite3.Connection):
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+    for column, statement in _MIGRATIONS.items():
+        if column not in columns:
+            conn.execute(statement)
+
+
+_store = SqliteStore(JOB_QUEUE_PATH, _SCHEMA, row_factory=sqlite3.Row, migrate=_migrate)
+
+
+def _connect() -> sqlite3.Connection:
+    """Открывает соединение с базой очереди (autocommit, WAL для конкурентного доступа)"""
+    return _store.connect()
+
+
+def _row_to_job(row: sqlite3.Row) -> Optional[dict]:
+    if row is None:
+        return None
+    job = dict(row)
+    job["payload"] = json.loads(job.get("payload") or "{}")
+    job["progress"] = json.loads(job["progress"]) if job.get("progress") else None
+    return job
+
+
+def enqueue_job(kind: str, project_id: str, payload: dict = None) -> dict:
+    """
+    Ставит задачу в очередь
+
+    Если для проекта уже есть задача того же типа в статусе 'queued',
+    новую не создаём, а обновляем payload существующей (повторное нажатие "Рендер")
+
+    Returns:
+        dict: Задача (id, status, ...)
+    """
+    payload_json = json.dumps(payload or {}, ensure_ascii=False)
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        existing = conn.execute(
+            "SELECT * FROM jobs WHERE kind = ? AND project_id = ? AND status = 'queued' "
+            "ORDER BY created_at LIMIT 1",
+            (kind, project_id)
+        ).fetchone()
+
+        if existing:
+            conn.execute("UPDATE jobs SET payload = ? WHERE id = ?", (payload_json, existing["id"]))
+            job_id = existing["id"]
+            print(f"[JOB_QUEUE] Job {job_id} ({kind}) already queued for project {project_id}, payload updated")
+        else:
+            job_id = str(uuid.uuid4())
+            conn.execute(
+                "INSERT INTO jobs (id, kind, project_id, payload, status, created_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+                (job_id, kind, project_id, payload_json, time.time())
+            )
+            print(f"[JOB_QUEUE] Enqueued job {job_id} ({kind}) for project {project_id}")
+
+        conn.execute("COMMIT")
+        return get_job(job_id)
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def claim_job(worker_id: str, kinds: List[str]) -> Optional[dict]:
+    """
+    Атомарно забирает самую старую задачу одного из типов kinds
+
+    Returns:
+        dict | None: Задача или None, если очередь пуста
+    """
+    placeholders = ",".join("?" for _ in kinds)
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            f"SELECT id FROM jobs WHERE status = 'queued' AND kind IN ({placeholders}) "
+            f"ORDER BY created_at LIMIT 1",
+            tuple(kinds)
+        ).fetchone()
+
+        if not row:
+            conn.execute("COMMIT")
+            return None
+
+        now = time.time()
+        conn.execute(
+            "UPDATE jobs SET status = 'running', worker_id = ?, attempts = attempts + 1, "
+            "started_at = ?, heartbeat_at = ? WHERE id = ?",
+            (worker_id, now, now, row["id"])
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    return get_job(row["id"])
+
+
+def heartbeat_job(job_id: str, worker_id: str):
+    """Продлевает аренду задачи (воркер жив и работает)"""
+    conn = _connect()
+    try:
+        conn.execute(
+            "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+            (time.time(), job_id, worker_id)
+        )
+    finally:
+        conn.close()
+
+
+def update_job_progress(job_id: str, progress: dict):
+    """Сохраняет прогресс выполнения задачи (читается API для отдачи клиенту)"""
+    conn = _connect()
+    try:
+        conn.execute(
+            "UPDATE jobs SET progress = ?, heartbeat_at = ? WHERE id = ?",
+            (json.dumps(progress, ensure_ascii=False), time.time(), job_id)
+        )
+    finally:
+        conn.close()
+
+
+def complete_job(job_id: str, worker_id: str) -> bool:
+    """
+    Завершает задачу, если она всё ещё за этим воркером
+
+    Returns:
+        bool: False - аренда истекла и задачу уже вернули в очередь или забрал другой воркер
+    """
+    conn = _connect()
+    try:
+        cursor = conn.execute(
+            "UPDATE jobs SET status = 'completed', finished_at = ?, error = NULL "
+            "WHERE id = ? AND worker_id = ? AND status = 'running'",
+            (time.time(), job_id, worker_id)
+        )
+        return cursor.rowcount > 0
+    finally:
+        conn.close()
+
+
+def fail_job(job_id: str, worker_id: str, error: str) -> bool:
+    """
+    Помечает задачу ошибкой, если она всё ещё за этим воркером
+
+    Returns:
+        bool: False - задача уже не за этим воркером (см. complete_job)
+    """
+    conn = _connect()
+    try:
+        cursor = conn.execute(
+            "UPDATE jobs SET status = 'error', finished_at = ?, error = ? "
+            "WHERE id = ? AND worker_id = ? AND status = 'running'",
+            (time.time(), error[:1000], job_id, worker_id)
+        )
+        return cursor.rowcount > 0
+    finally:
+        conn.close()
+
+
+def requeue_stale_jobs(lease_seconds: int = JOB_LEASE_SECONDS) -> int:
+    """
+    Возвращает в очередь задачи, чей воркер перестал присылать heartbeat
+    (процесс упал, сервер перезапустился). После JOB_MAX_ATTEMPTS попыток задача помечается ошибкой
+
+    Returns:
+        int: Количество задач, возвращённых в очередь
+    """
+    deadline = time.time() - lease_seconds
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            "UPDATE jobs SET status = 'error', finished_at = ?, error = 'Too many attempts' "
+            "WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?",
+            (time.time(), deadline, JOB_MAX_ATTEMPTS)
+        )
+        cursor = conn.execute(
+            "UPDATE jobs SET status = 'queued', worker_id = NULL, progress = NULL "
+            "WHERE status = 'running' AND heartbeat_at < ?",
+            (deadline,)
+        )
+        conn.execute("COMMIT")
+        if cursor.rowcount:
+            print(f"[JOB_QUEUE] Requeued {cursor.rowcount} stale jobs")
+        return cursor.rowcount
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    conn = _connect()
+    try:
+        return _row_to_job(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+    finally:
+        conn.close()
+
+
+def get_latest_project_job(project_id: str, kind: str) -> Optional[dict]:
+    """Последняя задача указанного типа для проекта"""
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE project_id = ? AND kind = ? ORDER BY created_at DESC LIMIT 1",
+            (project_id, kind)
+        ).fetchone()
+        return _row_to_job(row)
+    finally:
+        conn.close()
+
+
+def get_queue_depth(kind: str = None) -> int:
+    """Количество задач, ожидающих воркера"""
+    conn = _connect()
+    try:
+        if kind:
+            row = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND kind = ?", (kind,)).fetchone()
+        else:
+            row = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()
+        return row[0]
+    finally:
+        conn.close()
+
+
+def get_running_count(kind: str = None) -> int:
+    """Количество задач, выполняющихся прямо сейчас"""
+    conn = _connect()
+    try:
+        if kind:
+            row = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'running' AND kind = ?", (kind,)).fetchone()
+        else:
+            row = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'running'").fetchone()
+        return row[0]
+    finally:
+        conn.close()
+
+
+def get_queue_position(job: dict) -> Optional[int]:
+    """
+    Позиция задачи в очереди (1 = следующая на выполнение)
+    Для задач не в статусе 'queued' возвращает None
+    """
+    if not job or job.get("status") != "queued":
+        return None
+
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND kind = ? AND created_at < ?",
+            (job["kind"], job["created_at"])
+        ).fetchone()
+        return row[0] + 1
+    finally:
+        conn.close()
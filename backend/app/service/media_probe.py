@@ -0,0 +1,296 @@
+"""
+Чтение длительности и параметров аудио без запуска ffprobe
+
+MP3: заголовок первого фрейма (версия MPEG, layer, битрейт, частота, каналы) и,
+если есть, заголовок Xing/Info/VBRI с точным числом фреймов; без него - CBR оценка
+по размеру аудиоданных. MP4/M4A: длительность из moov/mvhd, параметры звука - из
+описания первой аудио дорожки (stsd). Читаются только заголовки (единицы КБ),
+файл целиком не декодируется.
+
+Результаты кэшируются по отпечатку файла (размер + хэш начала и конца), поэтому
+повторное измерение того же файла (другой путь, другой процесс-шаг) почти бесплатно.
+Форматы, которые здесь не разбираются, измеряет ffprobe (см. video_service.probe_audio).
+"""
+import hashlib
+import os
+import struct
+from collections import OrderedDict
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+# Сколько байт после ID3v2 тега просматривается в поисках первого фрейма MP3
+MP3_SYNC_SEARCH_BYTES = 64 * 1024
+
+# Отпечаток файла для кэша: размер + начало и конец файла
+FINGERPRINT_BYTES = 64 * 1024
+
+PROBE_CACHE_MAX_ENTRIES = 1024
+
+_MPEG_VERSIONS = {0: 2.5, 2: 2, 3: 1}
+_MPEG_LAYERS = {1: 3, 2: 2, 3: 1}
+
+_MPEG_SAMPLE_RATES = {
+    1: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    2.5: (11025, 12000, 8000),
+}
+
+# Битрейты, кбит/с, по индексу 1..14
+_MPEG_BITRATES = {
+    (1, 1): (32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+_MP4_CODECS = {"mp4a": "aac", ".mp3": "mp3", "alac": "alac", "Opus": "opus", "fLaC": "flac"}
+
+_stats = {
+    "native": 0,
+    "ffprobe": 0,
+    "cache_hits": 0,
+}
+
+
+def _parse_mp3_header(header: bytes) -> Optional[dict]:
+    """Разбирает 4 байта заголовка фрейма MPEG audio (None - не заголовок)"""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+
+    version = _MPEG_VERSIONS.get((header[1] >> 3) & 0x03)
+    layer = _MPEG_LAYERS.get((header[1] >> 1) & 0x03)
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x03
+    if version is None or layer is None or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    bitrate = _MPEG_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index - 1] * 1000
+    sample_rate = _MPEG_SAMPLE_RATES[version][sample_rate_index]
+    padding = (header[2] >> 1) & 0x01
+    channels = 1 if header[3] >> 6 == 3 else 2
+
+    if layer == 1:
+        samples_per_frame = 384
+        frame_length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples_per_frame = 576 if layer == 3 and version != 1 else 1152
+        frame_length = samples_per_frame // 8 * bitrate // sample_rate + padding
+
+    return {
+        "version": version,
+        "layer": layer,
+        "bitrate": bitrate,
+        "sample_rate": sample_rate,
+        "channels": channels,
+        "samples_per_frame": samples_per_frame,
+        "frame_length": frame_length,
+    }
+
+
+def _id3v2_size(head: bytes) -> int:
+    """Размер ID3v2 тега в начале файла (0 - тега нет)"""
+    if len(head) < 10 or head[:3] != b"ID3":
+        return 0
+    size = (head[6] & 0x7F) << 21 | (head[7] & 0x7F) << 14 | (head[8] & 0x7F) << 7 | (head[9] & 0x7F)
+    footer = 10 if head[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def probe_mp3(f: BinaryIO, file_size: int) -> Optional[dict]:
+    head = f.read(10)
+    audio_start = _id3v2_size(head)
+
+    f.seek(audio_start)
+    data = f.read(MP3_SYNC_SEARCH_BYTES)
+
+    # Первый фрейм: заголовок, за которым на расстоянии длины фрейма идёт ещё один заголовок
+    offset = data.find(b"\xff")
+    frame = None
+    while offset != -1 and offset + 4 <= len(data):
+        frame = _parse_mp3_header(data[offset:offset + 4])
+        if frame:
+            next_offset = offset + frame["frame_length"]
+            if next_offset + 4 > len(data) or _parse_mp3_header(data[next_offset:next_offset + 4]):
+                break
+        frame = None
+        offset = data.find(b"\xff", offset + 1)
+    if frame is None:
+        return None
+
+    # Xing/Info (LAME, ffmpeg) после side info первого фрейма, VBRI (Fraunhofer) - на смещении 32
+    side_info = (32 if frame["channels"] == 2 else 17) if frame["version"] == 1 else (17 if frame["channels"] == 2 else 9)
+    frames = None
+    xing = offset + 4 + side_info
+    if data[xing:xing + 4] in (b"Xing", b"Info"):
+        flags = struct.unpack(">I", data[xing + 4:xing + 8])[0]
+        if flags & 0x01:
+            frames = struct.unpack(">I", data[xing + 8:xing + 12])[0]
+    elif data[offset + 36:offset + 40] == b"VBRI":
+        frames = struct.unpack(">I", data[offset + 50:offset + 54])[0]
+
+    if frames:
+        duration = frames * frame["samples_per_frame"] / frame["sample_rate"]
+    else:
+        # CBR: аудиоданные от первого фрейма до ID3v1 тега в конце
+        audio_bytes = file_size - audio_start - offset
+        f.seek(max(file_size - 128, 0))
+        if f.read(3) == b"TAG":
+            audio_bytes -= 128
+        duration = audio_bytes * 8 / frame["bitrate"]
+
+    return {
+        "duration": duration,
+        "codec": "mp3",
+        "sample_rate": frame["sample_rate"],
+        "channels": frame["channels"],
+    }
+
+
+def _mp4_boxes(f: BinaryIO, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """Боксы MP4 в диапазоне [start, end): (тип, начало содержимого, конец бокса)"""
+    position = start
+    while position + 8 <= end:
+        f.seek(position)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack(">I4s", header)
+        payload = position + 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            payload += 8
+        elif size == 0:
+            size = end - position
+        if size < payload - position:
+            return
+        yield box_type, payload, position + size
+        position += size
+
+
+def _mp4_child(f: BinaryIO, start: int, end: int, box_type: bytes) -> Optional[Tuple[int, int]]:
+    for child_type, payload, child_end in _mp4_boxes(f, start, end):
+        if child_type == box_type:
+            return payload, child_end
+    return None
+
+
+def probe_mp4(f: BinaryIO, file_size: int) -> Optional[dict]:
+    moov = _mp4_child(f, 0, file_size, b"moov")
+    if moov is None:
+        return None
+
+    mvhd = _mp4_child(f, *moov, b"mvhd")
+    if mvhd is None:
+        return None
+    f.seek(mvhd[0])
+    version = f.read(4)[0]
+    if version == 1:
+        f.seek(mvhd[0] + 20)
+        timescale, duration = struct.unpack(">IQ", f.read(12))
+    else:
+        f.seek(mvhd[0] + 12)
+        timescale, duration = struct.unpack(">II", f.read(8))
+    if not timescale:
+        return None
+
+    result = {"duration": duration / timescale, "codec": None, "sample_rate": None, "channels": None}
+
+    # Параметры первой аудио дорожки: trak/mdia/hdlr == soun, trak/mdia/minf/stbl/stsd
+    for box_type, payload, end in _mp4_boxes(f, *moov):
+        if box_type != b"trak":
+            continue
+        mdia = _mp4_child(f, payload, end, b"mdia")
+        hdlr = mdia and _mp4_child(f, *mdia, b"hdlr")
+        if not hdlr:
+            continue
+        f.seek(hdlr[0] + 8)
+        if f.read(4) != b"soun":
+            continue
+        minf = _mp4_child(f, *mdia, b"minf")
+        stbl = minf and _mp4_child(f, *minf, b"stbl")
+        stsd = stbl and _mp4_child(f, *stbl, b"stsd")
+        if stsd:
+            # FullBox (4) + entry_count (4), затем AudioSampleEntry
+            f.seek(stsd[0] + 8)
+            entry = f.read(36)
+            if len(entry) == 36:
+                codec = entry[4:8].decode("latin-1")
+                channels, = struct.unpack(">H", entry[24:26])
+                sample_rate, = struct.unpack(">I", entry[32:36])
+                result.update({
+                    "codec": _MP4_CODECS.get(codec, codec.strip()),
+                    "channels": channels,
+                    "sample_rate": sample_rate >> 16,
+                })
+        break
+
+    return result
+
+
+def probe_file(path: str) -> Optional[dict]:
+    """
+    Длительность и параметры аудио из заголовков файла
+
+    Returns:
+        dict | None: {"duration", "codec", "sample_rate", "channels"} или None,
+            если формат не MP3/MP4 или заголовки не разобраны (нужен ffprobe)
+    """
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        head = f.read(12)
+        f.seek(0)
+        try:
+            if head[4:8] == b"ftyp":
+                return probe_mp4(f, file_size)
+            if head[:3] == b"ID3" or _parse_mp3_header(head[:4]):
+                return probe_mp3(f, file_size)
+        except (struct.error, IndexError, ValueError) as e:
+            print(f"[MEDIA_PROBE] Failed to parse {path}: {str(e)}")
+    return None
+
+
+def fingerprint(path: str) -> str:
+    """Отпечаток содержимого для кэша: размер и sha256 первых и последних FINGERPRINT_BYTES"""
+    size = os.path.getsize(path)
+    digest = hashlib.sha256(str(size).encode("ascii"))
+    with open(path, "rb") as f:
+        digest.update(f.read(FINGERPRINT_BYTES))
+        if size > FINGERPRINT_BYTES:
+            f.seek(max(size - FINGERPRINT_BYTES, FINGERPRINT_BYTES))
+            digest.update(f.read(FINGERPRINT_BYTES))
+    return digest.hexdigest()
+
+
+class ProbeCache:
+    """LRU результатов измерения по отпечатку файла"""
+
+    def __init__(self, max_entries: int = PROBE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            _stats["cache_hits"] += 1
+        return entry
+
+    def put(self, key: str, info: dict):
+        self._entries[key] = info
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+probe_cache = ProbeCache()
+
+
+def record_probe(method: str):
+    """Учитывает, чем измерен файл: "native" или "ffprobe" """
+    _stats[method] += 1
+
+
+def get_probe_stats() -> dict:
+    """Счётчики измерений (для /metrics)"""
+    return {**_stats, "cached_files": len(probe_cache._entries)}
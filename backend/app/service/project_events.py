@@ -0,0 +1,266 @@
+"""
+События проектов (pub/sub) для push-обновлений клиентам через SSE
+
+Публикуют: воркер (готовые изображения сцен, прогресс и статусы рендера) и API
+(озвучка/субтитры, перегенерация сцен). Подписчик - SSE endpoint /projects/{id}/events.
+
+Хранилище событий подключаемое (PROJECT_EVENTS_BACKEND):
+    "memory" - в памяти процесса (только если публикатор и подписчик в одном процессе)
+    "sqlite" - локальный SQLite файл, общий для API и процессов воркера
+
+Каждое событие получает возрастающий id: клиент, переподключившись с Last-Event-ID,
+получает пропущенные события из хранилища.
+"""
+import asyncio
+import itertools
+import json
+import sqlite3
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List, Optional, Set
+from app.config import (
+    PROJECT_EVENTS_BACKEND,
+    PROJECT_EVENTS_PATH,
+    PROJECT_EVENTS_POLL_INTERVAL,
+    PROJECT_EVENTS_RETENTION_SECONDS,
+)
+from app.db.sqlite_store import SqliteStore
+
+# Сколько событий проекта хранит memory backend для повтора после переподключения
+MEMORY_HISTORY_SIZE = 200
+
+# Очередь подписчика: медленный клиент не должен копить события бесконечно
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+# Как часто sqlite backend чистит старые события (раз в N публикаций)
+PRUNE_EVERY = 200
+
+
+class MemoryEventBackend:
+    """События в памяти процесса"""
+
+    shared = False
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._history: Dict[str, Deque[dict]] = {}
+
+    def append(self, project_id: str, event_type: str, data: dict) -> dict:
+        event = {"id": next(self._ids), "project_id": project_id, "type": event_type, "data": data, "created_at": time.time()}
+        self._history.setdefault(project_id, deque(maxlen=MEMORY_HISTORY_SIZE)).append(event)
+        return event
+
+    def since(self, project_ids: List[str], after_id: int, up_to: int = None) -> List[dict]:
+        events = [
+            event for project_id in project_ids for event in self._history.get(project_id, ())
+            if event["id"] > after_id and (up_to is None or event["id"] <= up_to)
+        ]
+        return sorted(events, key=lambda event: event["id"])
+
+    def last_id(self) -> int:
+        return max((history[-1]["id"] for history in self._history.values() if history), default=0)
+
+
+class SqliteEventBackend:
+    """События в SQLite файле (WAL): видны всем процессам на машине"""
+
+    shared = True
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS project_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        project_id TEXT NOT NULL,
+        type TEXT NOT NULL,
+        data TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_project_events_project ON project_events (project_id, id);
+    CREATE INDEX IF NOT EXISTS idx_project_events_created ON project_events (created_at);
+    """
+
+    def __init__(self, path: str = PROJECT_EVENTS_PATH):
+        self.path = path
+        self._store = SqliteStore(path, self._SCHEMA, row_factory=sqlite3.Row)
+
+    @staticmethod
+    def _row_to_event(row: sqlite3.Row) -> dict:
+        event = dict(row)
+        event["data"] = json.loads(event["data"])
+        return event
+
+    def append(self, project_id: str, event_type: str, data: dict) -> dict:
+        created_at = time.time()
+        conn = self._store.connect()
+        try:
+            cursor = conn.execute(
+                "INSERT INTO project_events (project_id, type, data, created_at) VALUES (?, ?, ?, ?)",
+                (project_id, event_type, json.dumps(data, ensure_ascii=False), created_at)
+            )
+            event_id = cursor.lastrowid
+            if event_id % PRUNE_EVERY == 0:
+                conn.execute(
+                    "DELETE FROM project_events WHERE created_at < ?",
+                    (created_at - PROJECT_EVENTS_RETENTION_SECONDS,)
+                )
+        finally:
+            conn.close()
+        return {"id": event_id, "project_id": project_id, "type": event_type, "data": data, "created_at": created_at}
+
+    def since(self, project_ids: List[str], after_id: int, up_to: int = None) -> List[dict]:
+        if not project_ids:
+            return []
+        placeholders = ",".join("?" for _ in project_ids)
+        query = f"SELECT * FROM project_events WHERE project_id IN ({placeholders}) AND id > ?"
+        params = [*project_ids, after_id]
+        if up_to is not None:
+            query += " AND id <= ?"
+            params.append(up_to)
+        conn = self._store.connect()
+        try:
+            rows = conn.execute(query + " ORDER BY id", params).fetchall()
+            return [self._row_to_event(row) for row in rows]
+        finally:
+            conn.close()
+
+    def last_id(self) -> int:
+        conn = self._store.connect()
+        try:
+            row = conn.execute("SELECT MAX(id) FROM project_events").fetchone()
+            return row[0] or 0
+        finally:
+            conn.close()
+
+
+EVENT_BACKENDS = {
+    "memory": MemoryEventBackend,
+    "sqlite": SqliteEventBackend,
+}
+
+
+class ProjectEventBus:
+    """
+    Раздаёт события подписчикам процесса
+
+    Для memory backend события доставляются сразу при публикации. Для общего (sqlite)
+    backend один фоновый поллер на процесс читает новые события всех проектов, на которые
+    есть подписчики, и раскладывает их по очередям (публикация в этом же процессе будит
+    поллер сразу, не дожидаясь интервала)
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._poller: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._cursor = 0
+
+    async def _backend_call(self, method, *args):
+        """Вызов backend: общий (SQLite, блокирующий, с ожиданием блокировок) - в отдельном потоке"""
+        if self.backend.shared:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def publish(self, project_id: str, event_type: str, data: dict = None) -> Optional[dict]:
+        """Публикует событие проекта (ошибки хранилища не ломают вызывающий код)"""
+        try:
+            event = await self._backend_call(self.backend.append, project_id, event_type, data or {})
+        except Exception as e:
+            print(f"[PROJECT_EVENTS] Failed to publish {event_type} for {project_id}: {str(e)}")
+            return None
+
+        if self.backend.shared:
+            if self._wakeup:
+                self._wakeup.set()
+        else:
+            self._dispatch(event)
+        return event
+
+    def _dispatch(self, event: dict):
+        for queue in self._subscribers.get(event["project_id"], ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                print(f"[PROJECT_EVENTS] Subscriber queue full for {event['project_id']}, dropping event {event['id']}")
+
+    async def _poll(self):
+        while self._subscribers:
+            try:
+                up_to = await self._backend_call(self.backend.last_id)
+                if up_to > self._cursor:
+                    events = await self._backend_call(self.backend.since, list(self._subscribers), self._cursor, up_to)
+                    for event in events:
+                        self._dispatch(event)
+                    self._cursor = up_to
+            except Exception as e:
+                print(f"[PROJECT_EVENTS] Poll failed: {str(e)}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=PROJECT_EVENTS_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+        self._poller = None
+
+    async def subscribe(self, project_id: str, last_event_id: int = None) -> AsyncIterator[dict]:
+        """
+        Подписка на события проекта (async генератор)
+
+        Args:
+            last_event_id: id последнего полученного события - пропущенные будут отданы первыми
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+        if self.backend.shared and self._poller is None:
+            last_id = await self._backend_call(self.backend.last_id)
+            # Пока шло чтение, поллер мог запустить другой подписчик - его курсор не трогаем
+            if self._poller is None:
+                self._cursor = last_id
+        cursor = self._cursor if self.backend.shared else self.backend.last_id()
+
+        self._subscribers.setdefault(project_id, set()).add(queue)
+        if self.backend.shared and self._poller is None:
+            self._wakeup = asyncio.Event()
+            self._poller = asyncio.create_task(self._poll())
+
+        try:
+            # Повтор пропущенного: всё, что было после last_event_id и до начала подписки
+            last_seen = last_event_id or 0
+            if last_event_id is not None:
+                for event in await self._backend_call(self.backend.since, [project_id], last_event_id, cursor):
+                    last_seen = event["id"]
+                    yield event
+
+            while True:
+                event = await queue.get()
+                if event["id"] <= last_seen:
+                    continue
+                last_seen = event["id"]
+                yield event
+        finally:
+            subscribers = self._subscribers.get(project_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[project_id]
+
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+
+_bus: Optional[ProjectEventBus] = None
+
+
+def get_event_bus() -> ProjectEventBus:
+    """Шина событий процесса (backend выбирается PROJECT_EVENTS_BACKEND)"""
+    global _bus
+    if _bus is None:
+        backend_class = EVENT_BACKENDS.get(PROJECT_EVENTS_BACKEND)
+        if backend_class is None:
+            raise ValueError(f"Unknown PROJECT_EVENTS_BACKEND: {PROJECT_EVENTS_BACKEND}")
+        _bus = ProjectEventBus(backend_class())
+    return _bus
+
+
+async def publish_project_event(project_id: str, event_type: str, data: dict = None) -> Optional[dict]:
+    """Публикует событие проекта в шину процесса"""
+    return await get_event_bus().publish(project_id, event_type, data)
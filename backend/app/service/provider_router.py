@@ -0,0 +1,180 @@
+"""
+Маршрутизация запросов генерации изображений между провайдерами
+
+Для каждого провайдера ведётся скользящая статистика (латентность, доля ошибок)
+и circuit breaker:
+    closed    - провайдер здоров, запросы идут
+    open      - провайдер выключен на cooldown секунд (ошибки подряд или rate limit)
+    half_open - cooldown истёк, пропускается один пробный запрос;
+                успех закрывает breaker, ошибка снова открывает его с удвоенным cooldown
+
+Провайдеры упорядочиваются по ожидаемому времени до успешного результата,
+а не по фиксированному приоритету; пока статистики нет, действует исходный порядок.
+"""
+import time
+from collections import deque
+from typing import List, Dict
+from app.config import (
+    PROVIDER_STATS_WINDOW,
+    PROVIDER_FAILURE_THRESHOLD,
+    PROVIDER_OPEN_SECONDS,
+    PROVIDER_MAX_OPEN_SECONDS,
+)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+# Шаг априорной оценки между соседними по приоритету провайдерами (секунды)
+PRIOR_PRIORITY_STEP = 1.0
+
+
+class ProviderHealth:
+    """Скользящая статистика и circuit breaker одного провайдера"""
+
+    def __init__(self, name: str, timeout: float, priority: int, prior_latency: float = None):
+        self.name = name
+        self.timeout = timeout
+        self.priority = priority
+        self.prior_latency = timeout / 2 if prior_latency is None else prior_latency
+        self.samples = deque(maxlen=PROVIDER_STATS_WINDOW)  # (ok, latency)
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self.cooldown = PROVIDER_OPEN_SECONDS
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+
+    def allow_request(self) -> bool:
+        """Можно ли сейчас отправить запрос провайдеру (с учётом breaker)"""
+        if self.state == STATE_CLOSED:
+            return True
+
+        if self.state == STATE_OPEN:
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            # Cooldown истёк - пропускаем один пробный запрос
+            self.state = STATE_HALF_OPEN
+            self.probe_in_flight = False
+            print(f"[PROVIDER_ROUTER] {self.name}: half-open, sending probe")
+
+        if self.probe_in_flight:
+            return False
+        self.probe_in_flight = True
+        return True
+
+    def release_probe(self):
+        """
+        Освобождает слот пробного запроса, если он не завершился ни успехом, ни ошибкой
+        (отмена задачи, отключение клиента) - иначе провайдер остался бы выключен навсегда
+        """
+        self.probe_in_flight = False
+
+    def record_success(self, latency: float):
+        self.samples.append((True, latency))
+        self.consecutive_failures = 0
+        if self.state != STATE_CLOSED:
+            print(f"[PROVIDER_ROUTER] {self.name}: probe succeeded, closing circuit")
+        self.state = STATE_CLOSED
+        self.cooldown = PROVIDER_OPEN_SECONDS
+        self.probe_in_flight = False
+
+    def record_failure(self, latency: float, fatal: bool = False, cooldown: float = None):
+        """
+        Регистрирует ошибку
+
+        Args:
+            latency: Сколько времени заняла неудачная попытка
+            fatal: Открыть breaker сразу (например, rate limit / закончилась квота)
+            cooldown: Свой cooldown для этого открытия (секунды)
+        """
+        self.samples.append((False, latency))
+        self.consecutive_failures += 1
+        self.probe_in_flight = False
+
+        if self.state == STATE_HALF_OPEN:
+            # Пробный запрос не прошёл - снова открываем с удвоенным cooldown
+            self._open(min(self.cooldown * 2, PROVIDER_MAX_OPEN_SECONDS))
+        elif fatal:
+            self._open(cooldown or PROVIDER_MAX_OPEN_SECONDS)
+        elif self.consecutive_failures >= PROVIDER_FAILURE_THRESHOLD:
+            self._open(cooldown or self.cooldown)
+
+    def _open(self, cooldown: float):
+        self.state = STATE_OPEN
+        self.opened_at = time.monotonic()
+        self.cooldown = cooldown
+        print(f"[PROVIDER_ROUTER] {self.name}: circuit opened for {cooldown:.0f}s")
+
+    def success_rate(self) -> float:
+        if not self.samples:
+            return 1.0
+        return sum(1 for ok, _ in self.samples if ok) / len(self.samples)
+
+    def expected_latency(self) -> float:
+        """
+        Ожидаемое время до успешного ответа: (p * L_ok + (1 - p) * L_fail) / p
+
+        Без статистики используется априорная оценка prior_latency (см. ProviderRouter)
+        """
+        if not self.samples:
+            return self.prior_latency
+
+        ok_latencies = [latency for ok, latency in self.samples if ok]
+        fail_latencies = [latency for ok, latency in self.samples if not ok]
+        p = len(ok_latencies) / len(self.samples)
+
+        latency_ok = sum(ok_latencies) / len(ok_latencies) if ok_latencies else self.timeout
+        latency_fail = sum(fail_latencies) / len(fail_latencies) if fail_latencies else 0.0
+
+        # Минимальная вероятность успеха, чтобы не делить на ноль
+        p = max(p, 0.05)
+        return (p * latency_ok + (1 - p) * latency_fail) / p
+
+    def stats(self) -> dict:
+        latencies = [latency for ok, latency in self.samples if ok]
+        return {
+            "name": self.name,
+            "state": self.state,
+            "samples": len(self.samples),
+            "success_rate": round(self.success_rate(), 3),
+            "avg_latency": round(sum(latencies) / len(latencies), 3) if latencies else None,
+            "expected_latency": round(self.expected_latency(), 3),
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+class ProviderRouter:
+    """Выбирает порядок провайдеров для очередного запроса"""
+
+    def __init__(self, apis: List[Dict]):
+        self.apis = apis
+        self.health = {}
+
+        # Априорная оценка растёт по списку: половина таймаута, но не меньше оценки
+        # предыдущего провайдера плюс шаг - без статистики сохраняется исходный приоритет,
+        # а таймаут лишь задаёт масштаб для сравнения с измеренной латентностью
+        prior = 0.0
+        for index, api in enumerate(apis):
+            timeout = api.get("timeout", 30)
+            prior = timeout / 2 if index == 0 else max(timeout / 2, prior + PRIOR_PRIORITY_STEP)
+            self.health[api["name"]] = ProviderHealth(api["name"], timeout, index, prior)
+
+    def get(self, api_config: Dict) -> ProviderHealth:
+        return self.health[api_config["name"]]
+
+    def ranked(self) -> List[Dict]:
+        """
+        Провайдеры в порядке возрастания ожидаемой латентности
+
+        Провайдеры с открытым breaker идут в конец: generate_image всё равно
+        проверит allow_request() перед запросом и пропустит их до истечения cooldown
+        """
+        def sort_key(api: Dict):
+            health = self.get(api)
+            is_open = health.state == STATE_OPEN
+            return (is_open, health.expected_latency(), health.priority)
+
+        return sorted(self.apis, key=sort_key)
+
+    def stats(self) -> List[dict]:
+        return [self.get(api).stats() for api in self.ranked()]
@@ -0,0 +1,158 @@
+"""
+Построение filter_complex для рендера слайд-шоу
+
+Слайды сцен собираются в одну дорожку (zoompan каждого изображения -> concat),
+которая накладывается на фон ОДНИМ overlay. Каждый кадр проходит через один
+overlay независимо от количества сцен, поэтому стоимость рендера зависит от длительности
+ролика, а не от числа сцен (раньше каждая сцена добавляла свой overlay с enable=between(...),
+и каждый кадр проходил через все N overlay-узлов).
+"""
+import re
+from typing import List, Dict, Tuple, Optional
+
+FPS = 30
+
+# Ken Burns эффект: zoom от 1.0 до ZOOM_MAX за время показа слайда
+ZOOM_MAX = 1.25
+
+# Слайды размещаются в верхней части экрана (5% от верха), ниже - фон и субтитры
+SLIDE_TOP_RATIO = 0.05
+
+
+class RenderGraph:
+    """Входы ffmpeg и цепочки filter_complex, собираемые по шагам"""
+
+    def __init__(self):
+        self.inputs: List[List[str]] = []
+        self.filters: List[str] = []
+
+    def add_input(self, path: str, options: List[str] = None) -> int:
+        """Добавляет вход (options - опции перед -i) и возвращает его индекс"""
+        self.inputs.append((options or []) + ["-i", path])
+        return len(self.inputs) - 1
+
+    def add(self, chain: str):
+        self.filters.append(chain)
+
+    def input_args(self) -> List[str]:
+        return [arg for item in self.inputs for arg in item]
+
+    def filter_complex(self) -> str:
+        return ";".join(self.filters)
+
+
+def is_image(path: str) -> bool:
+    return path.lower().endswith((".jpg", ".jpeg", ".png"))
+
+
+def escape_filter_path(path: str) -> str:
+    """
+    Экранирует путь для использования внутри filter_complex (ass='...')
+    1. Обратные слэши -> прямые (Windows -> POSIX)
+    2. Двоеточие после буквы диска (C: -> C\\:)
+    3. Одиночные кавычки
+    """
+    escaped = path.replace('\\', '/')
+    escaped = re.sub(r'^([A-Za-z]):', r'\1\\:', escaped)
+    return escaped.replace("'", r"'\\\''")
+
+
+def split_frames(timings: List[Tuple[float, float]], total_duration: float) -> List[int]:
+    """
+    Количество кадров каждого слайда
+
+    Длительность округляется до кадра по каждому слайду отдельно (не по абсолютному времени),
+    чтобы сдвиг одной сцены не менял длину остальных. Последний слайд добирает остаток
+    до общей длительности
+    """
+    frames = [max(1, round(duration * FPS)) for _, duration in timings]
+    frames[-1] = max(1, round(total_duration * FPS) - sum(frames[:-1]))
+    return frames
+
+
+def build_slideshow_graph(
+    background_path: str,
+    images: List[Dict],
+    frames: List[int],
+    video_width: int,
+    video_height: int,
+    subtitle_path: str = None,
+    background_start: float = 0.0,
+    duration: Optional[float] = None,
+    background_options: List[str] = None,
+    background_prepared: bool = False
+) -> RenderGraph:
+    """
+    Граф рендера: фон (+ субтитры) и дорожка слайдов, наложенная одним overlay
+
+    Args:
+        background_path: Фоновое видео (зацикливается) или изображение
+        images: Изображения слайдов: {"path", "width", "height"}, в порядке показа
+        frames: Количество кадров каждого слайда (слайды идут подряд с нуля)
+        video_width: Ширина видео
+        video_height: Высота видео
+        subtitle_path: Файл субтитров .ass (может быть None)
+        background_start: С какой секунды фонового видео начинать
+        duration: Обрезать фон до этой длительности (None - ограничение задаётся -frames:v)
+        background_options: Свои опции входа фона (например, concat список из библиотеки фонов)
+        background_prepared: Фон уже 720x1280/30fps (библиотека фонов) - без scale/pad/fps
+
+    Returns:
+        RenderGraph: Выходная метка видео - [outv]
+    """
+    graph = RenderGraph()
+
+    if background_options is not None:
+        background_index = graph.add_input(background_path, background_options)
+    elif is_image(background_path):
+        background_index = graph.add_input(background_path, ["-loop", "1"])
+    else:
+        # stream_loop зацикливает фон, если он короче ролика
+        background_index = graph.add_input(
+            background_path, ["-ss", f"{background_start:.3f}", "-stream_loop", "-1"]
+        )
+
+    trim = f"trim=duration={duration}," if duration else ""
+    if background_prepared:
+        graph.add(f"[{background_index}:v]{trim}setpts=PTS-STARTPTS[bg_raw]")
+    else:
+        graph.add(
+            f"[{background_index}:v]{trim}setpts=PTS-STARTPTS,"
+            f"scale={video_width}:{video_height}:force_original_aspect_ratio=decrease,"
+            f"pad={video_width}:{video_height}:(ow-iw)/2:(oh-ih)/2,fps={FPS}[bg_raw]"
+        )
+
+    # Субтитры рисуются на фоне ДО наложения слайдов
+    # ВАЖНО: ass фильтр вместо subtitles для лучшей поддержки кодировок
+    if subtitle_path:
+        graph.add(f"[bg_raw]ass='{escape_filter_path(subtitle_path)}'[bg]")
+    else:
+        graph.add("[bg_raw]null[bg]")
+
+    # Все слайды приводятся к одному холсту (прозрачные поля), иначе concat невозможен
+    slide_width = max(image["width"] for image in images)
+    slide_height = max(image["height"] for image in images)
+
+    slide_labels = []
+    for i, (image, image_frames) in enumerate(zip(images, frames)):
+        image_index = graph.add_input(image["path"])
+        graph.add(
+            f"[{image_index}:v]scale={image['width']}:{image['height']},"
+            f"zoompan=z='min(1.0+on/{image_frames}*{ZOOM_MAX - 1.0},{ZOOM_MAX})'"
+            f":d={image_frames}:s={image['width']}x{image['height']}:fps={FPS},"
+            f"format=yuva420p,pad={slide_width}:{slide_height}:(ow-iw)/2:0:color=black@0,setsar=1[s{i}]"
+        )
+        slide_labels.append(f"[s{i}]")
+
+    if len(slide_labels) == 1:
+        slides_label = slide_labels[0]
+    else:
+        graph.add(f"{''.join(slide_labels)}concat=n={len(slide_labels)}:v=1:a=0[slides]")
+        slides_label = "[slides]"
+
+    # Единственный overlay: после конца дорожки слайдов остаётся фон
+    x_pos = (video_width - slide_width) // 2
+    y_pos = int(video_height * SLIDE_TOP_RATIO)
+    graph.add(f"[bg]{slides_label}overlay={x_pos}:{y_pos}:eof_action=pass[outv]")
+
+    return graph
@@ -0,0 +1,125 @@
+"""
+Предзагрузка ассетов рендера
+
+Изображения сцен и озвучка скачиваются одновременно через общий пул соединений httpx
+(не более RENDER_PREFETCH_CONCURRENCY скачиваний сразу), подготовка изображений
+(PIL: resize + JPEG) идёт в отдельном пуле потоков. Каждое изображение - отдельная задача,
+поэтому кодирование сцены начинается, как только готово её изображение, а не все сразу.
+
+Файлы принадлежат prefetcher'у и удаляются в close().
+"""
+import asyncio
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+from app.config import RENDER_PREFETCH_CONCURRENCY, RENDER_PREPARE_THREADS
+from app.service.storage_io import download_to_file
+
+# Пул потоков для PIL: ограничивает и CPU, и пиковую память (декодированные изображения)
+_prepare_pool = ThreadPoolExecutor(max_workers=max(1, RENDER_PREPARE_THREADS), thread_name_prefix="render-prepare")
+
+
+def _is_dead(task: asyncio.Task) -> bool:
+    """Задача отменена или завершилась ошибкой - её результат использовать нельзя"""
+    return task.done() and (task.cancelled() or task.exception() is not None)
+
+
+class AssetPrefetcher:
+    """Параллельные скачивания ассетов одного рендера с подготовкой изображений"""
+
+    def __init__(self, video_height: int, concurrency: int = RENDER_PREFETCH_CONCURRENCY):
+        self.video_height = video_height
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._downloads: Dict[str, asyncio.Task] = {}
+        self._prepared: Dict[str, asyncio.Task] = {}
+        self._files: List[str] = []
+        self._started = time.monotonic()
+        self.stats = {
+            "downloads": 0,
+            "bytes": 0,
+            # Время от создания prefetcher'а до последнего скачанного файла (стена, не сумма)
+            "download_seconds": 0.0,
+            # Суммарное время подготовки изображений в пуле потоков
+            "prepare_seconds": 0.0,
+        }
+
+    async def _download(self, url: str, suffix: str, file_name_hint: Optional[str]) -> str:
+        async with self._semaphore:
+            path = await download_to_file(url, suffix=suffix, file_name_hint=file_name_hint)
+        self._files.append(path)
+        self.stats["downloads"] += 1
+        self.stats["bytes"] += os.path.getsize(path)
+        self.stats["download_seconds"] = round(time.monotonic() - self._started, 3)
+        return path
+
+    def fetch(self, url: str, suffix: str = "", file_name_hint: str = None) -> asyncio.Task:
+        """
+        Запускает скачивание (один раз на URL) и возвращает его задачу - путь к файлу
+
+        Отменённое (release) или упавшее скачивание запускается заново: файл мог
+        понадобиться позже, например если сегмент вытеснили из кэша уже после проверки
+        """
+        task = self._downloads.get(url)
+        if task is None or _is_dead(task):
+            task = asyncio.create_task(self._download(url, suffix, file_name_hint))
+            self._downloads[url] = task
+        return task
+
+    def prefetch_images(self, urls: Iterable[str]):
+        """Запускает скачивание изображений, не дожидаясь их"""
+        for url in urls:
+            self.fetch(url, suffix=".jpg")
+
+    def release(self, keep: Iterable[str]):
+        """Отменяет ещё не завершённые скачивания, кроме keep (например, сцены уже есть в кэше сегментов)"""
+        keep = set(keep)
+        for url, task in self._downloads.items():
+            if url not in keep and not task.done():
+                task.cancel()
+
+    async def _prepare(self, url: str) -> dict:
+        from app.service.video_service import prepare_overlay_image
+
+        source = await self.fetch(url, suffix=".jpg")
+
+        temp = tempfile.NamedTemporaryFile(delete=False, suffix=".jpg")
+        temp.close()
+        self._files.append(temp.name)
+
+        started = time.monotonic()
+        width, height = await asyncio.get_running_loop().run_in_executor(
+            _prepare_pool, prepare_overlay_image, source, temp.name, self.video_height
+        )
+        self.stats["prepare_seconds"] = round(self.stats["prepare_seconds"] + time.monotonic() - started, 3)
+        return {"path": temp.name, "width": width, "height": height}
+
+    async def image(self, url: str) -> dict:
+        """
+        Подготовленное изображение сцены для overlay
+
+        Returns:
+            dict: {"path", "width", "height"}
+        """
+        task = self._prepared.get(url)
+        if task is None or _is_dead(task):
+            task = asyncio.create_task(self._prepare(url))
+            self._prepared[url] = task
+        # Задача общая для всех сцен с этим URL - отмена одного ожидающего её не отменяет
+        return await asyncio.shield(task)
+
+    async def close(self):
+        """Отменяет незавершённые задачи и удаляет скачанные и подготовленные файлы"""
+        tasks = [task for task in [*self._downloads.values(), *self._prepared.values()] if not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*self._downloads.values(), *self._prepared.values(), return_exceptions=True)
+
+        for path in self._files:
+            if os.path.exists(path):
+                try:
+                    os.unlink(path)
+                except OSError as e:
+                    print(f"[RENDER_PREFETCH] Failed to delete {path}: {str(e)}")
+        self._files.clear()
@@ -0,0 +1,141 @@
+"""
+Прогресс рендера по выводу ffmpeg -progress
+
+ffmpeg с "-progress pipe:1 -nostats" пишет в stdout блоки key=value
+(frame, fps, out_time_us, speed, ...), каждый блок заканчивается строкой
+progress=continue или progress=end. Из них считаются процент готовности,
+скорость кодирования и оставшееся время. Публикация троттлится, чтобы
+обновления не превращались в поток записей в базу.
+"""
+import time
+from typing import Awaitable, Callable, Dict, Optional
+from app.config import RENDER_PROGRESS_INTERVAL
+
+# Аргументы ffmpeg: машиночитаемый прогресс в stdout вместо строки статистики в stderr
+PROGRESS_ARGS = ["-progress", "pipe:1", "-nostats"]
+
+ProgressCallback = Callable[[dict], Awaitable[None]]
+
+
+class FfmpegProgressParser:
+    """Собирает блоки key=value из вывода -progress и отдаёт снимок на каждой границе блока"""
+
+    def __init__(self):
+        self._block: Dict[str, str] = {}
+
+    def feed(self, line: str) -> Optional[dict]:
+        """
+        Принимает одну строку вывода
+
+        Returns:
+            dict | None: {"frame", "fps", "out_time", "speed", "done"} в конце блока, иначе None
+        """
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return None
+        if key != "progress":
+            self._block[key] = value.strip()
+            return None
+
+        block, self._block = self._block, {}
+        out_time_us = _to_float(block.get("out_time_us") or block.get("out_time_ms"))
+        return {
+            "frame": int(_to_float(block.get("frame")) or 0),
+            "fps": _to_float(block.get("fps")) or 0.0,
+            "out_time": (out_time_us or 0.0) / 1_000_000,
+            "speed": _to_float((block.get("speed") or "").rstrip("x")),
+            "done": value.strip() == "end",
+        }
+
+
+def _to_float(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value not in (None, "", "N/A") else None
+    except ValueError:
+        return None
+
+
+class RenderProgress:
+    """
+    Прогресс одного рендера в кадрах: несколько процессов ffmpeg (сегменты)
+    могут сообщать свои кадры независимо, итог считается по сумме
+
+    Публикует {"stage", "percent", "frames_done", "frames_total", "fps", "eta_seconds", "timings"}
+    не чаще раза в interval секунд (смена стадии и завершение - сразу);
+    timings - сколько секунд заняла каждая завершённая стадия
+    """
+
+    def __init__(self, on_progress: Optional[ProgressCallback], interval: float = RENDER_PROGRESS_INTERVAL):
+        self.on_progress = on_progress
+        self.interval = interval
+        self.stage = "preparing"
+        self.frames_total = 0
+        self._frames: Dict[str, int] = {}
+        self._fps: Dict[str, float] = {}
+        self._started = time.monotonic()
+        self._stage_started = time.monotonic()
+        self._published_at = 0.0
+        self.timings: Dict[str, float] = {}
+
+    def snapshot(self) -> dict:
+        done = min(sum(self._frames.values()), self.frames_total) if self.frames_total else 0
+        fps = sum(self._fps.values())
+        if not fps and done:
+            # ffmpeg ещё не посчитал fps - оцениваем по времени с начала кодирования
+            fps = done / max(time.monotonic() - self._started, 1e-6)
+
+        remaining = self.frames_total - done
+        eta = None
+        if self.frames_total and remaining <= 0:
+            eta = 0.0
+        elif fps:
+            eta = round(remaining / fps, 1)
+
+        return {
+            "stage": self.stage,
+            "percent": round(100.0 * done / self.frames_total, 1) if self.frames_total else 0.0,
+            "frames_done": done,
+            "frames_total": self.frames_total,
+            "fps": round(fps, 1),
+            "eta_seconds": eta,
+            "timings": dict(self.timings),
+        }
+
+    async def publish(self, force: bool = False):
+        if not self.on_progress:
+            return
+        now = time.monotonic()
+        if not force and now - self._published_at < self.interval:
+            return
+        self._published_at = now
+        try:
+            await self.on_progress(self.snapshot())
+        except Exception as e:
+            # Прогресс - вспомогательная информация, рендер из-за него не падает
+            print(f"[RENDER_PROGRESS] Failed to publish progress: {str(e)}")
+
+    async def set_stage(self, stage: str, frames_total: int = None):
+        now = time.monotonic()
+        self.timings[self.stage] = round(self.timings.get(self.stage, 0.0) + now - self._stage_started, 3)
+        self._stage_started = now
+        self.stage = stage
+        if frames_total is not None:
+            self.frames_total = frames_total
+            self._frames.clear()
+            self._fps.clear()
+            self._started = time.monotonic()
+        await self.publish(force=True)
+
+    def line_handler(self, name: str = "main") -> Callable[[str], Awaitable[None]]:
+        """Обработчик строк stdout одного процесса ffmpeg (для run_process(on_stdout_line=...))"""
+        parser = FfmpegProgressParser()
+
+        async def handle(line: str):
+            sample = parser.feed(line)
+            if sample is None:
+                return
+            self._frames[name] = sample["frame"]
+            self._fps[name] = 0.0 if sample["done"] else sample["fps"]
+            await self.publish()
+
+        return handle
@@ -0,0 +1,177 @@
+"""
+Планировщик ресурсов рендера
+
+Определяет доступные ядра и память (с учётом лимитов контейнера - cgroup v1/v2),
+решает, сколько рендеров может идти одновременно, и для каждого рендера выбирает
+количество потоков ffmpeg, preset/CRF и таймаут по текущей загрузке очереди:
+
+- очередь пуста и рендер один - он получает все ядра;
+- под нагрузкой ядра делятся между активными рендерами, preset становится быстрее,
+  а таймаут растёт вместе с ожидаемым временем кодирования (а не обрывается на 5 минутах).
+
+Цель кодирования задаётся RENDER_TARGET: "speed" - быстрее отдать ролик,
+"size" - меньший файл ценой времени кодирования.
+"""
+import os
+from typing import Optional
+from app.config import (
+    RENDER_TARGET,
+    RENDER_THREADS,
+    RENDER_MEMORY_PER_JOB_MB,
+    RENDER_MIN_TIMEOUT,
+)
+
+# Цепочки preset/CRF по уровню загрузки: 0 - свободно, 1 - есть другие рендеры, 2 - перегрузка
+ENCODER_LADDERS = {
+    "speed": [("ultrafast", 28), ("ultrafast", 28), ("ultrafast", 30)],
+    "size": [("medium", 23), ("fast", 24), ("veryfast", 26)],
+}
+
+# Примерная скорость кодирования 720x1280 (кадров/с на один поток) - для расчёта таймаута
+PRESET_FPS_PER_THREAD = {
+    "ultrafast": 20.0,
+    "superfast": 14.0,
+    "veryfast": 10.0,
+    "faster": 7.0,
+    "fast": 5.0,
+    "medium": 4.0,
+}
+
+# Запас таймаута относительно ожидаемого времени кодирования
+TIMEOUT_SAFETY_FACTOR = 4.0
+
+
+def _read_cgroup(path: str) -> Optional[str]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def detect_cpu_count() -> int:
+    """Количество ядер, доступных процессу (affinity и квота CPU контейнера)"""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+
+    # cgroup v2: "max 100000" или "200000 100000"
+    quota = None
+    cpu_max = _read_cgroup("/sys/fs/cgroup/cpu.max")
+    if cpu_max:
+        limit, period = (cpu_max.split() + ["100000"])[:2]
+        if limit != "max":
+            quota = int(limit) / int(period)
+    else:
+        # cgroup v1
+        limit = _read_cgroup("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+        period = _read_cgroup("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+        if limit and period and int(limit) > 0:
+            quota = int(limit) / int(period)
+
+    if quota:
+        cores = min(cores, max(1, int(quota)))
+    return max(1, cores)
+
+
+def detect_memory_bytes() -> Optional[int]:
+    """Память, доступная процессу: лимит контейнера или физическая память (None - неизвестно)"""
+    total = None
+    try:
+        total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        pass
+
+    limit = _read_cgroup("/sys/fs/cgroup/memory.max") or _read_cgroup("/sys/fs/cgroup/memory/memory.limit_in_bytes")
+    if limit and limit.isdigit():
+        # v1 без лимита отдаёт огромное число - берём минимум с физической памятью
+        total = min(int(limit), total) if total else int(limit)
+    return total
+
+
+def max_concurrent_renders() -> int:
+    """
+    Сколько рендеров может идти одновременно
+
+    Ограничено памятью (RENDER_MEMORY_PER_JOB_MB на рендер) и ядрами:
+    меньше двух потоков на рендер x264 использует неэффективно
+    """
+    cores = detect_cpu_count()
+    by_cpu = max(1, cores // 2)
+
+    memory = detect_memory_bytes()
+    if memory:
+        by_memory = max(1, memory // (RENDER_MEMORY_PER_JOB_MB * 1024 * 1024))
+        return int(min(by_cpu, by_memory))
+    return by_cpu
+
+
+def get_render_load() -> dict:
+    """Текущая загрузка рендера по очереди задач: активные (включая текущий) и ожидающие"""
+    from app.service.job_queue import JOB_RENDER_VIDEO, get_queue_depth, get_running_count
+
+    try:
+        return {"running": get_running_count(JOB_RENDER_VIDEO), "queued": get_queue_depth(JOB_RENDER_VIDEO)}
+    except Exception as e:
+        print(f"[RENDER_SCHEDULER] Failed to read queue load: {str(e)}")
+        return {"running": 1, "queued": 0}
+
+
+def plan_render(
+    frames: int,
+    target: str = None,
+    load: dict = None,
+    parallel: int = 1,
+    min_timeout: int = RENDER_MIN_TIMEOUT
+) -> dict:
+    """
+    Параметры кодирования для одного процесса ffmpeg
+
+    Args:
+        frames: Количество кадров, которое предстоит закодировать
+        target: "speed" или "size" (по умолчанию RENDER_TARGET)
+        load: {"running", "queued"} (по умолчанию - из очереди задач)
+        parallel: Сколько процессов ffmpeg этот рендер запускает одновременно (сегменты)
+        min_timeout: Нижняя граница таймаута, секунды
+
+    Returns:
+        dict: {"threads", "preset", "crf", "timeout", "level"}
+    """
+    target = target if target in ENCODER_LADDERS else RENDER_TARGET
+    if target not in ENCODER_LADDERS:
+        target = "speed"
+    load = load or get_render_load()
+
+    cores = detect_cpu_count()
+    slots = max_concurrent_renders()
+    running = max(1, load.get("running", 1))
+    queued = load.get("queued", 0)
+
+    # Ядра делятся поровну между идущими рендерами (и процессами ffmpeg внутри рендера)
+    threads = RENDER_THREADS or max(1, cores // (min(running, slots) * max(1, parallel)))
+
+    if running <= 1 and queued == 0:
+        level = 0
+    elif running + queued <= slots:
+        level = 1
+    else:
+        level = 2
+
+    preset, crf = ENCODER_LADDERS[target][level]
+
+    # Ожидаемое время кодирования: при нехватке ядер растёт, и таймаут растёт вместе с ним
+    expected = frames / (PRESET_FPS_PER_THREAD[preset] * threads)
+    timeout = max(min_timeout, int(expected * TIMEOUT_SAFETY_FACTOR))
+
+    return {"threads": threads, "preset": preset, "crf": crf, "timeout": timeout, "level": level}
+
+
+def encoder_args(plan: dict) -> list:
+    """Аргументы ffmpeg для libx264 по плану рендера"""
+    return [
+        "-c:v", "libx264",
+        "-preset", plan["preset"],
+        "-crf", str(plan["crf"]),
+        "-threads", str(plan["threads"]),
+    ]
@@ -0,0 +1,510 @@
+"""
+Сегментный (инкрементальный) рендер видео
+
+Каждая сцена кодируется в независимый сегмент: изображение + тайминг + кусок фона +
+субтитры этой сцены. Сегмент идентифицируется хэшем своего содержимого и хранится
+в локальном кэше, поэтому при повторном рендере перекодируются только изменённые сцены.
+Финальное видео собирается из сегментов concat demuxer'ом без перекодирования видео.
+
+Все сегменты кодируются с одинаковыми параметрами (кодек, размер, fps, pix_fmt),
+иначе склейка через -c copy невозможна.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+from typing import Awaitable, Callable, List, Dict, Optional, Tuple
+try:
+    import fcntl
+except ImportError:  # Windows (локальная разработка): сегменты не блокируются
+    fcntl = None
+from app.config import SEGMENT_CACHE_DIR, SEGMENT_CACHE_MAX_BYTES, SEGMENT_RENDER_CONCURRENCY
+from app.service.audio_service import format_srt_time
+from app.service.background_library import background_identity, background_input, snap_offset
+from app.service.render_graph import FPS, build_slideshow_graph, is_image, split_frames
+from app.service.render_scheduler import encoder_args, get_render_load, plan_render
+from app.service.render_progress import PROGRESS_ARGS, RenderProgress
+from app.service.render_prefetch import AssetPrefetcher
+from app.service.subprocess_utils import run_process
+from app.service.video_service import (
+    FFMPEG_BINARY,
+    convert_srt_to_ass,
+    get_audio_duration,
+    audio_output_args,
+)
+
+# Меняется при изменении параметров кодирования - старые сегменты перестают совпадать
+SEGMENT_RENDER_VERSION = 2
+
+# Нижняя граница таймаута одного сегмента (planner увеличивает его под нагрузкой)
+SEGMENT_MIN_TIMEOUT = 120
+
+_SRT_TIME_RE = re.compile(r"(\d+):(\d+):(\d+)[,.](\d+)")
+
+
+class SegmentPins:
+    """
+    Сегменты, которые использует один рендер: на каждый файл держится shared flock до release()
+
+    Кэш общий для всех рендеров (и процессов воркера): prune не удаляет сегмент,
+    пока хоть один рендер держит его блокировку
+    """
+
+    def __init__(self):
+        self._files = {}
+
+    def pin(self, key: str, path: str) -> bool:
+        """Блокирует сегмент; False - файла уже нет (вытеснен)"""
+        if key in self._files:
+            return True
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return False
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH)
+            # prune мог удалить файл между open и flock - тогда открыт уже не файл кэша
+            try:
+                current = os.stat(path).st_ino == os.fstat(f.fileno()).st_ino
+            except FileNotFoundError:
+                current = False
+            if not current:
+                f.close()
+                return False
+        self._files[key] = f
+        return True
+
+    def release(self):
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+
+
+class SegmentCache:
+    """Локальный кэш сегментов: {key}.mp4, вытеснение самых старых по времени использования"""
+
+    def __init__(self, directory: str = SEGMENT_CACHE_DIR, max_bytes: int = SEGMENT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.mp4")
+
+    def get(self, key: str, pins: SegmentPins = None) -> Optional[str]:
+        """Путь к сегменту или None; с pins сегмент блокируется от вытеснения до pins.release()"""
+        path = self.path(key)
+        if pins is not None:
+            if not pins.pin(key, path):
+                return None
+        elif not os.path.exists(path):
+            return None
+        # Обновляем mtime - сегмент недавно использовался
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key: str, source_path: str, pins: SegmentPins = None) -> str:
+        path = self.path(key)
+        # Блокировка берётся до публикации файла - вытеснить его раньше не получится
+        if pins is not None:
+            pins.pin(key, source_path)
+        # Атомарная замена: параллельный рендер не увидит недописанный файл
+        os.replace(source_path, path)
+        return path
+
+    def prune(self):
+        """
+        Удаляет самые давно использованные сегменты, пока кэш больше max_bytes
+
+        Сегменты, заблокированные рендерами (SegmentPins), пропускаются
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            # Временные файлы (.tmp_*) пишутся параллельными рендерами - не трогаем
+            if not name.endswith(".mp4") or name.startswith("."):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                with open(path, "rb") as f:
+                    if fcntl is not None:
+                        try:
+                            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        except BlockingIOError:
+                            # Сегмент сейчас использует другой рендер
+                            continue
+                    os.unlink(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+
+
+segment_cache = SegmentCache()
+
+
+def parse_srt(srt_content: str) -> List[Tuple[float, float, str]]:
+    """Разбирает SRT в список (start, end, text)"""
+    events = []
+    for block in (srt_content or "").replace("\ufeff", "").strip().split("\n\n"):
+        lines = block.strip().split("\n")
+        if len(lines) < 3 or "-->" not in lines[1]:
+            continue
+        start, end = (_parse_srt_time(part) for part in lines[1].split("-->"))
+        if start is None or end is None:
+            continue
+        events.append((start, end, " ".join(lines[2:])))
+    return events
+
+
+def _parse_srt_time(value: str) -> Optional[float]:
+    match = _SRT_TIME_RE.search(value)
+    if not match:
+        return None
+    hours, minutes, seconds, millis = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds) + int(millis.ljust(3, "0")[:3]) / 1000
+
+
+def slice_subtitles(events: List[Tuple[float, float, str]], start: float, end: float) -> str:
+    """
+    Субтитры отрезка [start, end) в формате SRT со временем относительно начала отрезка
+    Событие на стыке сегментов попадает в оба (обрезанным), на видео это незаметно
+    """
+    lines = []
+    for event_start, event_end, text in events:
+        if event_end <= start or event_start >= end:
+            continue
+        local_start = max(event_start, start) - start
+        local_end = min(event_end, end) - start
+        lines.append(f"{len(lines) // 4 + 1}")
+        lines.append(f"{format_srt_time(local_start)} --> {format_srt_time(local_end)}")
+        lines.append(text)
+        lines.append("")
+    return "\n".join(lines)
+
+
+def background_offset(scene_id: str, background_duration: float, segment_duration: float) -> float:
+    """
+    Стабильное для сцены смещение в фоновом видео: не зависит от позиции сцены в ролике,
+    поэтому перестановка или изменение длительности других сцен не инвалидирует сегмент
+    """
+    span = background_duration - segment_duration
+    if span <= 0:
+        return 0.0
+    fraction = int(hashlib.sha256(str(scene_id).encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF
+    return round(fraction * span, 3)
+
+
+def segment_key(spec: dict) -> str:
+    return hashlib.sha256(json.dumps(spec, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _background_identity(background_path: str) -> str:
+    """
+    Идентичность фона для ключа сегмента: для видео - имя, размер и время изменения,
+    для изображения (временный файл-заглушка) - хэш содержимого
+    """
+    if is_image(background_path):
+        with open(background_path, "rb") as f:
+            return "image:" + hashlib.sha256(f.read()).hexdigest()
+    stat = os.stat(background_path)
+    return f"{os.path.basename(background_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+
+async def render_segment(
+    output_path: str,
+    background_path: str,
+    background_start: float,
+    image: Dict,
+    frames: int,
+    video_width: int,
+    video_height: int,
+    subtitle_path: str = None,
+    background_options: List[str] = None,
+    background_prepared: bool = False,
+    plan: dict = None,
+    on_progress_line: Callable[[str], Awaitable[None]] = None
+) -> bool:
+    """
+    Кодирует один сегмент: кусок фона + субтитры + изображение сцены с zoom эффектом
+
+    plan - потоки/preset/CRF/таймаут (по умолчанию - render_scheduler.plan_render),
+    on_progress_line - обработчик вывода ffmpeg -progress (RenderProgress.line_handler)
+
+    Returns:
+        bool: True если успешно
+    """
+    if plan is None:
+        plan = plan_render(frames, min_timeout=SEGMENT_MIN_TIMEOUT)
+
+    graph = build_slideshow_graph(
+        background_path=background_path,
+        images=[image],
+        frames=[frames],
+        video_width=video_width,
+        video_height=video_height,
+        subtitle_path=subtitle_path,
+        background_start=background_start,
+        background_options=background_options,
+        background_prepared=background_prepared
+    )
+
+    cmd = [FFMPEG_BINARY, "-y"]
+    if on_progress_line:
+        cmd.extend(PROGRESS_ARGS)
+    cmd.extend(graph.input_args())
+    cmd.extend([
+        "-filter_complex", graph.filter_complex(),
+        "-map", "[outv]",
+        "-frames:v", str(frames),
+        "-an",
+        *encoder_args(plan),
+        "-pix_fmt", "yuv420p",
+        "-r", str(FPS),
+        output_path
+    ])
+
+    try:
+        returncode, _, stderr = await run_process(cmd, timeout=plan["timeout"], on_stdout_line=on_progress_line)
+    except TimeoutError:
+        print(f"[SEGMENT] ERROR: segment render timeout")
+        return False
+
+    if returncode != 0:
+        print(f"[SEGMENT] ERROR: {stderr.decode('utf-8', errors='ignore')[-500:]}")
+        return False
+    return True
+
+
+async def concat_segments(segment_paths: List[str], audio_path: Optional[str], output_path: str, total_duration: float) -> bool:
+    """Склеивает сегменты без перекодирования видео и добавляет дорожку озвучки"""
+    list_file = tempfile.NamedTemporaryFile(delete=False, suffix=".txt", mode="w", encoding="utf-8")
+    try:
+        for path in segment_paths:
+            escaped = path.replace("'", "'\\''")
+            list_file.write(f"file '{escaped}'\n")
+        list_file.close()
+
+        cmd = [FFMPEG_BINARY, "-y", "-f", "concat", "-safe", "0", "-i", list_file.name]
+        if audio_path:
+            cmd.extend(["-i", audio_path, "-map", "0:v", "-map", "1:a", *(await audio_output_args(audio_path))])
+        cmd.extend([
+            "-c:v", "copy",
+            "-t", f"{total_duration:.3f}",
+            "-movflags", "+faststart",
+            output_path
+        ])
+
+        returncode, _, stderr = await run_process(cmd, timeout=120)
+        if returncode != 0:
+            print(f"[SEGMENT] ERROR: concat failed: {stderr.decode('utf-8', errors='ignore')[-500:]}")
+            return False
+        return True
+    except TimeoutError:
+        print(f"[SEGMENT] ERROR: concat timeout")
+        return False
+    finally:
+        if os.path.exists(list_file.name):
+            os.unlink(list_file.name)
+
+
+async def render_segmented_video(
+    scenes: List[Dict],
+    timings: List[Tuple[float, float]],
+    background_path: str,
+    audio_path: Optional[str],
+    subtitle_content: Optional[str],
+    output_path: str,
+    total_duration: float,
+    video_width: int,
+    video_height: int,
+    background_index: dict = None,
+    concurrency: int = SEGMENT_RENDER_CONCURRENCY,
+    progress: RenderProgress = None,
+    prefetch: AssetPrefetcher = None
+) -> dict:
+    """
+    Рендерит видео из сегментов сцен, перекодируя только отсутствующие в кэше
+
+    Args:
+        scenes: Сцены с generated_image_url (в порядке показа)
+        timings: (start_time, duration) для каждой сцены
+        background_path: Фоновое видео (или изображение)
+        background_index: Индекс подготовленного фона из библиотеки (None - исходный файл)
+        progress: Куда сообщать прогресс (кадры всех перекодируемых сегментов суммируются)
+        prefetch: Предзагрузка изображений (None - своя, закрывается по окончании)
+        audio_path: Дорожка озвучки (может быть None)
+        subtitle_content: SRT субтитры всего ролика (может быть None)
+        output_path: Куда сохранить итоговое видео
+        total_duration: Длительность итогового видео
+
+    Returns:
+        dict: {"segments": всего, "rendered": перекодировано, "reused": взято из кэша}
+    """
+    own_prefetch = prefetch is None
+    if own_prefetch:
+        prefetch = AssetPrefetcher(video_height)
+    # Сегменты этого рендера не вытесняются другими рендерами до конца склейки
+    pins = SegmentPins()
+
+    try:
+        events = parse_srt(subtitle_content) if subtitle_content else []
+        frames = split_frames(timings, total_duration)
+
+        if background_index:
+            background_id = background_identity(background_index)
+            background_duration = background_index["duration"]
+        else:
+            background_id = _background_identity(background_path)
+            background_duration = 0.0
+            if not is_image(background_path):
+                try:
+                    background_duration = await get_audio_duration(background_path)
+                except Exception as e:
+                    print(f"[SEGMENT_RENDER] Background duration unknown, no offset: {str(e)}")
+
+        # Описание каждого сегмента - из него считается ключ кэша
+        specs = []
+        position = 0
+        for scene, (start_time, _), scene_frames in zip(scenes, timings, frames):
+            duration = scene_frames / FPS
+            # Субтитры режутся по фактическим границам кадров сегмента
+            local_start = position / FPS
+            position += scene_frames
+
+            background_start = background_offset(scene.get("id"), background_duration, duration)
+            if background_index:
+                # Начало сегмента библиотеки - ключевой кадр, декодировать лишнее не нужно
+                background_start = snap_offset(background_index, background_start)
+
+            specs.append({
+                "version": SEGMENT_RENDER_VERSION,
+                "size": [video_width, video_height],
+                "image": scene["generated_image_url"],
+                "frames": scene_frames,
+                "background": background_id,
+                "background_start": background_start,
+                "subtitles": slice_subtitles(events, local_start, local_start + duration),
+            })
+
+        keys = [segment_key(spec) for spec in specs]
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        rendered = 0
+
+        # Ядра делятся между сегментами, которые реально будут кодироваться параллельно.
+        # Найденные сегменты сразу блокируются: между проверкой и склейкой их не вытеснят
+        missing = [i for i, key in enumerate(keys) if not segment_cache.get(key, pins)]
+        parallel = max(1, min(concurrency, len(missing)))
+
+        # Изображения нужны только перекодируемым сегментам: их скачивание уже идёт или стартует сейчас,
+        # остальные отменяются
+        needed = {specs[i]["image"] for i in missing}
+        prefetch.prefetch_images(needed)
+        prefetch.release(needed)
+        load = get_render_load()
+
+        progress = progress or RenderProgress(None)
+        await progress.set_stage("encoding", frames_total=sum(specs[i]["frames"] for i in missing))
+
+        async def ensure_segment(index: int) -> str:
+            nonlocal rendered
+            key, spec = keys[index], specs[index]
+            cached = segment_cache.get(key, pins)
+            if cached:
+                return cached
+
+            # Изображение ждём до занятия слота кодирования: слот не простаивает на скачивании
+            image = await prefetch.image(spec["image"])
+
+            async with semaphore:
+                # Тот же сегмент мог быть отрендерен параллельной задачей
+                cached = segment_cache.get(key, pins)
+                if cached:
+                    return cached
+
+                print(f"[SEGMENT] Rendering segment {index + 1}/{len(specs)} ({spec['frames']} frames)")
+                temp_files = []
+                try:
+                    subtitle_path = None
+                    if spec["subtitles"]:
+                        subtitle_temp = tempfile.NamedTemporaryFile(delete=False, suffix=".ass", mode='w', encoding='utf-8-sig')
+                        subtitle_temp.write(convert_srt_to_ass(spec["subtitles"]))
+                        subtitle_temp.close()
+                        subtitle_path = subtitle_temp.name
+                        temp_files.append(subtitle_path)
+
+                    # Пишем рядом с кэшем, чтобы os.replace был атомарным (одна файловая система)
+                    segment_temp = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4", dir=segment_cache.directory, prefix=".tmp_")
+                    segment_temp.close()
+                    temp_files.append(segment_temp.name)
+
+                    # Подготовленный фон подаётся только нужными сегментами библиотеки
+                    segment_background, background_options = background_path, None
+                    if background_index:
+                        segment_background, background_options = background_input(
+                            background_index, spec["background_start"], spec["frames"] / FPS
+                        )
+                        temp_files.append(segment_background)
+
+                    success = await render_segment(
+                        output_path=segment_temp.name,
+                        background_path=segment_background,
+                        background_start=spec["background_start"],
+                        image=image,
+                        frames=spec["frames"],
+                        video_width=video_width,
+                        video_height=video_height,
+                        subtitle_path=subtitle_path,
+                        background_options=background_options,
+                        background_prepared=background_index is not None,
+                        plan=plan_render(spec["frames"], load=load, parallel=parallel, min_timeout=SEGMENT_MIN_TIMEOUT),
+                        on_progress_line=progress.line_handler(key)
+                    )
+                    if not success:
+                        raise RuntimeError(f"Failed to render segment {index + 1}")
+
+                    rendered += 1
+                    return segment_cache.put(key, segment_temp.name, pins)
+                finally:
+                    for path in temp_files:
+                        if os.path.exists(path):
+                            os.unlink(path)
+
+        tasks = [asyncio.create_task(ensure_segment(i)) for i in range(len(specs))]
+        try:
+            segment_paths = await asyncio.gather(*tasks)
+            print(f"[SEGMENT] {rendered} segments rendered, {len(specs) - rendered} reused from cache")
+
+            await progress.set_stage("muxing")
+
+            if not await concat_segments(segment_paths, audio_path, output_path, total_duration):
+                raise RuntimeError("Failed to assemble segments")
+        except Exception:
+            for task in tasks:
+                task.cancel()
+            # Отменённые задачи должны завершиться до снятия блокировок
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            pins.release()
+
+        segment_cache.prune()
+
+        return {"segments": len(specs), "rendered": rendered, "reused": len(specs) - rendered}
+    finally:
+        pins.release()
+        if own_prefetch:
+            await prefetch.close()
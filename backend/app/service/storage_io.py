@@ -0,0 +1,220 @@
+"""
+Потоковые загрузка и скачивание файлов без буферизации целиком в памяти
+
+Скачивание пишет ответ на диск кусками по мере получения. Загрузка больших файлов
+в Supabase Storage идёт по протоколу TUS (resumable upload) кусками по 6 МБ прямо
+из файла: при обрыве соединения загрузка продолжается с подтверждённого сервером
+смещения. Пиковая память не зависит от размера файла (около одного куска).
+
+Скачанные и загруженные файлы попадают в локальный кэш ассетов (asset_cache):
+повторное скачивание того же URL берёт файл с диска.
+"""
+import asyncio
+import base64
+import gc
+import os
+import tempfile
+from typing import Optional
+import httpx
+from app.config import SUPABASE_URL, SUPABASE_KEY
+from app.db.supa_request import STORAGE_BUCKET, get_db, get_storage_url, upload_to_storage
+from app.service.asset_cache import asset_cache, copy_file
+from app.service.http_client import get_http_client
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Supabase принимает TUS куски строго по 6 МБ (кроме последнего)
+UPLOAD_CHUNK_SIZE = 6 * 1024 * 1024
+UPLOAD_MAX_RETRIES = 3
+
+TUS_VERSION = "1.0.0"
+
+
+async def _cache_store(url: str, path: str):
+    """Кладёт файл в кэш ассетов (ошибка кэша не ломает скачивание/загрузку)"""
+    if asset_cache is None:
+        return
+    try:
+        await asyncio.to_thread(asset_cache.put_file, url, path)
+    except Exception as e:
+        print(f"[STORAGE_IO] Failed to cache {url}: {str(e)}")
+
+
+async def download_to_file(url: str, path: str = None, suffix: str = "", file_name_hint: str = None) -> str:
+    """
+    Скачивает файл по URL прямо на диск, кусками по DOWNLOAD_CHUNK_SIZE
+    (или берёт его из кэша ассетов, если этот URL уже скачивался или загружался)
+
+    Args:
+        url: URL файла (публичный или подписанный)
+        path: Куда сохранить (по умолчанию - новый временный файл)
+        suffix: Расширение временного файла
+        file_name_hint: Имя файла в storage - для скачивания через SDK, если URL недоступен
+
+    Returns:
+        str: Путь к скачанному файлу (удаляет вызывающий код)
+    """
+    if path is None:
+        temp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+        temp.close()
+        path = temp.name
+
+    cached = asset_cache.get(url) if asset_cache else None
+    if cached:
+        try:
+            await asyncio.to_thread(copy_file, cached, path)
+            return path
+        except OSError as e:
+            # blob мог быть вытеснен между get и копированием - качаем заново
+            print(f"[STORAGE_IO] Cached copy of {url} unavailable ({e}), downloading")
+
+    try:
+        async with get_http_client().stream("GET", url, timeout=httpx.Timeout(60.0, connect=10.0)) as response:
+            response.raise_for_status()
+            with open(path, "wb") as f:
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+        await _cache_store(url, path)
+        return path
+
+    except httpx.HTTPError as e:
+        # Если не получилось по URL - пробуем через SDK (файл целиком, только как запасной путь)
+        if file_name_hint:
+            try:
+                db = await get_db()
+                file_data = await db.storage.from_(STORAGE_BUCKET).download(file_name_hint)
+                with open(path, "wb") as f:
+                    f.write(file_data)
+                await _cache_store(url, path)
+                return path
+            except Exception as sdk_error:
+                os.unlink(path)
+                raise Exception(f"Failed to download file: URL method failed ({str(e)}), SDK method failed ({str(sdk_error)})")
+        os.unlink(path)
+        raise Exception(f"Failed to download file from URL: {str(e)}")
+
+    except BaseException:
+        if os.path.exists(path):
+            os.unlink(path)
+        raise
+
+
+def _tus_metadata(**values: str) -> str:
+    return ",".join(
+        f"{key} {base64.b64encode(value.encode('utf-8')).decode('ascii')}" for key, value in values.items()
+    )
+
+
+def _tus_headers() -> dict:
+    return {
+        "Authorization": f"Bearer {SUPABASE_KEY}",
+        "apikey": SUPABASE_KEY,
+        "Tus-Resumable": TUS_VERSION,
+    }
+
+
+async def _read_chunk(path: str, offset: int, size: int) -> bytes:
+    def read():
+        with open(path, "rb") as f:
+            f.seek(offset)
+            return f.read(size)
+    return await asyncio.to_thread(read)
+
+
+async def tus_upload(path: str, file_name: str, content_type: str, bucket: str = STORAGE_BUCKET) -> None:
+    """
+    Загружает файл в Supabase Storage по протоколу TUS кусками по UPLOAD_CHUNK_SIZE
+
+    После сетевой ошибки смещение запрашивается у сервера (HEAD) и загрузка
+    продолжается с него, а не с начала файла
+    """
+    client = get_http_client()
+    endpoint = f"{SUPABASE_URL.rstrip('/')}/storage/v1/upload/resumable"
+    total = os.path.getsize(path)
+
+    response = await client.post(endpoint, headers={
+        **_tus_headers(),
+        "Upload-Length": str(total),
+        "Upload-Metadata": _tus_metadata(
+            bucketName=bucket,
+            objectName=file_name,
+            contentType=content_type,
+            cacheControl="3600",
+        ),
+        "x-upsert": "true",
+    })
+    if response.status_code != 201:
+        raise RuntimeError(f"TUS create failed: {response.status_code} {response.text[:200]}")
+
+    upload_url = response.headers["Location"]
+    offset = 0
+    retries = 0
+
+    while offset < total:
+        chunk = await _read_chunk(path, offset, UPLOAD_CHUNK_SIZE)
+        try:
+            response = await client.patch(upload_url, content=chunk, headers={
+                **_tus_headers(),
+                "Upload-Offset": str(offset),
+                "Content-Type": "application/offset+octet-stream",
+            }, timeout=httpx.Timeout(120.0, connect=10.0))
+            if response.status_code != 204:
+                raise RuntimeError(f"TUS patch failed: {response.status_code} {response.text[:200]}")
+            offset = int(response.headers["Upload-Offset"])
+            retries = 0
+            # Запрос httpx с телом куска живёт в циклических ссылках и без явной
+            # сборки мусора куски копятся в памяти до следующего прохода GC
+            del chunk
+            gc.collect()
+        except (httpx.HTTPError, RuntimeError) as e:
+            retries += 1
+            if retries > UPLOAD_MAX_RETRIES:
+                raise
+            print(f"[STORAGE_IO] Chunk at {offset} failed ({e}), resuming (attempt {retries}/{UPLOAD_MAX_RETRIES})")
+            await asyncio.sleep(retries)
+            # Узнаём, сколько сервер успел принять
+            head = await client.head(upload_url, headers=_tus_headers())
+            if head.status_code == 200 and "Upload-Offset" in head.headers:
+                offset = int(head.headers["Upload-Offset"])
+
+
+async def upload_file(path: str, file_name: str, content_type: str) -> str:
+    """
+    Загружает локальный файл в bucket 'videos' без чтения его целиком в память
+
+    Файлы меньше одного куска загружаются обычным запросом, большие - через TUS
+
+    Returns:
+        str: Публичный URL загруженного файла
+    """
+    size = os.path.getsize(path)
+    if size <= UPLOAD_CHUNK_SIZE:
+        with open(path, "rb") as f:
+            url = await upload_to_storage(file_name, f.read(), content_type)
+    else:
+        print(f"[STORAGE_IO] Resumable upload of {file_name} ({size} bytes)")
+        await tus_upload(path, file_name, content_type)
+        url = await get_storage_url(file_name)
+
+    #Write-through: следующее скачивание этого URL не пойдёт в сеть
+    await _cache_store(url, path)
+    return url
+
+
+async def upload_bytes(data: bytes, file_name: str, content_type: str) -> str:
+    """Загружает небольшой файл из памяти в bucket 'videos' (с записью в кэш ассетов)"""
+    url = await upload_to_storage(file_name, data, content_type)
+    if asset_cache is not None:
+        try:
+            await asyncio.to_thread(asset_cache.put_bytes, url, data)
+        except Exception as e:
+            print(f"[STORAGE_IO] Failed to cache {file_name}: {str(e)}")
+    return url
+
+
+def storage_file_name(url: str) -> Optional[str]:
+    """Имя файла в bucket 'videos' по его публичному/подписанному URL"""
+    marker = f"/{STORAGE_BUCKET}/"
+    if marker not in url:
+        return None
+    return url.split(marker)[-1].split("?")[0]
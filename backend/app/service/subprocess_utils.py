@@ -0,0 +1,65 @@
+"""
+Запуск внешних процессов (ffmpeg/ffprobe) без блокировки event loop
+"""
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+
+async def _read_lines(stream: asyncio.StreamReader, on_line: Callable[[str], Awaitable[None]]):
+    async for raw in stream:
+        await on_line(raw.decode("utf-8", errors="ignore"))
+
+
+async def run_process(
+    cmd: List[str],
+    timeout: float = None,
+    input_data: bytes = None,
+    on_stdout_line: Optional[Callable[[str], Awaitable[None]]] = None
+) -> Tuple[int, bytes, bytes]:
+    """
+    Запускает процесс через asyncio.create_subprocess_exec и ждёт завершения
+
+    Args:
+        cmd: Команда и аргументы
+        timeout: Таймаут в секундах (None - без ограничения)
+        input_data: Данные для stdin (опционально)
+        on_stdout_line: Обработчик строк stdout по мере поступления (например, ffmpeg -progress);
+            в этом режиме stdout не накапливается и возвращается пустым
+
+    Returns:
+        tuple: (returncode, stdout, stderr)
+
+    Raises:
+        TimeoutError: Если процесс не завершился за timeout (процесс убивается)
+    """
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.PIPE if input_data is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+
+    async def communicate() -> Tuple[bytes, bytes]:
+        if on_stdout_line is None:
+            return await process.communicate(input=input_data)
+        if input_data is not None:
+            process.stdin.write(input_data)
+            await process.stdin.drain()
+            process.stdin.close()
+        # stderr читаем параллельно, иначе ffmpeg может заблокироваться на заполненном pipe
+        _, stderr = await asyncio.gather(_read_lines(process.stdout, on_stdout_line), process.stderr.read())
+        await process.wait()
+        return b"", stderr
+
+    try:
+        stdout, stderr = await asyncio.wait_for(communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise TimeoutError(f"Process {cmd[0]} timed out after {timeout}s")
+    except asyncio.CancelledError:
+        # Задачу отменили - не оставляем осиротевший ffmpeg
+        process.kill()
+        raise
+
+    return process.returncode, stdout, stderr
@@ -0,0 +1,204 @@
+"""
+Выравнивание исходного текста сценария по словам, распознанным Whisper
+
+Whisper даёт точные таймкоды слов, но с ошибками распознавания; сценарий даёт
+правильный текст без таймкодов. Токены сценария сопоставляются со словами
+Whisper ленточным (banded) выравниванием Нидлмана-Вунша по нормализованным
+токенам: считаются только клетки в полосе вокруг диагонали, поэтому сложность
+O(n * band), а не O(n * m). Невыровненные токены получают время интерполяцией
+между соседями, после чего у каждой фразы есть точные start/end.
+"""
+import re
+from typing import List, Tuple, Optional
+
+# Минимальная полуширина полосы (в токенах) вокруг диагонали
+BAND_MIN = 15
+# Доля от длины текста, добавляемая к полосе (для сильно расходящихся текстов)
+BAND_RATIO = 0.1
+
+GAP_COST = 1.0
+MISMATCH_COST = 1.0
+PARTIAL_MATCH_COST = 0.4
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Флаги направления при обратном проходе
+_DIAG, _UP, _LEFT = 0, 1, 2
+
+
+def normalize_token(token: str) -> str:
+    return token.lower().replace("ё", "е")
+
+
+def tokenize(text: str) -> List[str]:
+    """Разбивает текст на нормализованные токены (слова/числа без пунктуации)"""
+    return [normalize_token(t) for t in _TOKEN_RE.findall(text or "")]
+
+
+def _substitution_cost(a: str, b: str) -> float:
+    if a == b:
+        return 0.0
+    # Частичное совпадение: разные окончания одного слова ("котик" / "котика")
+    prefix = max(3, min(len(a), len(b)) - 2)
+    if len(a) >= 3 and len(b) >= 3 and a[:prefix] == b[:prefix]:
+        return PARTIAL_MATCH_COST
+    return MISMATCH_COST
+
+
+def align_tokens(script_tokens: List[str], asr_tokens: List[str]) -> List[Optional[int]]:
+    """
+    Ленточное выравнивание двух последовательностей токенов
+
+    Returns:
+        list: Для каждого токена сценария - индекс слова Whisper или None (пропуск)
+    """
+    n, m = len(script_tokens), len(asr_tokens)
+    if n == 0:
+        return []
+    if m == 0:
+        return [None] * n
+
+    band = max(BAND_MIN, int(BAND_RATIO * max(n, m))) + abs(n - m) // 2
+    inf = float("inf")
+
+    def window(i: int) -> Tuple[int, int]:
+        center = round(i * m / n)
+        return max(0, center - band), min(m, center + band)
+
+    # Строка DP хранится только в пределах полосы: (lo, значения, направления)
+    lo_prev, hi_prev = window(0)
+    prev = [j * GAP_COST for j in range(lo_prev, hi_prev + 1)]
+    rows = [(lo_prev, bytes([_LEFT] * (hi_prev - lo_prev + 1)))]
+
+    for i in range(1, n + 1):
+        lo, hi = window(i)
+        cur = [inf] * (hi - lo + 1)
+        moves = bytearray(hi - lo + 1)
+        token = script_tokens[i - 1]
+
+        for j in range(lo, hi + 1):
+            best, move = inf, _UP
+
+            # Диагональ: (i-1, j-1)
+            if j >= 1 and lo_prev <= j - 1 <= hi_prev:
+                cost = prev[j - 1 - lo_prev] + _substitution_cost(token, asr_tokens[j - 1])
+                if cost < best:
+                    best, move = cost, _DIAG
+
+            # Вверх: токен сценария без пары (i-1, j)
+            if lo_prev <= j <= hi_prev:
+                cost = prev[j - lo_prev] + GAP_COST
+                if cost < best:
+                    best, move = cost, _UP
+
+            # Влево: лишнее слово Whisper (i, j-1)
+            if j > lo:
+                cost = cur[j - 1 - lo] + GAP_COST
+                if cost < best:
+                    best, move = cost, _LEFT
+
+            cur[j - lo] = best
+            moves[j - lo] = move
+
+        rows.append((lo, bytes(moves)))
+        prev, lo_prev, hi_prev = cur, lo, hi
+
+    # Обратный проход от (n, m)
+    mapping: List[Optional[int]] = [None] * n
+    i, j = n, m
+    while i > 0 and j >= 0:
+        lo, moves = rows[i]
+        if not (lo <= j < lo + len(moves)):
+            # Вышли за полосу (не должно случаться) - остаток без пар
+            break
+        move = moves[j - lo]
+        if move == _DIAG:
+            # Совпадение или замена: слово произнесено (возможно, распознано иначе) - время верное
+            mapping[i - 1] = j - 1
+            i, j = i - 1, j - 1
+        elif move == _UP:
+            i -= 1
+        else:
+            j -= 1
+
+    return mapping
+
+
+def _interpolate_times(mapping: List[Optional[int]], words: List[Tuple[float, float]], total_end: float) -> List[Tuple[float, float]]:
+    """Время каждого токена сценария; для пропусков - линейная интерполяция между соседями"""
+    n = len(mapping)
+    times: List[Optional[Tuple[float, float]]] = [words[j] if j is not None else None for j in mapping]
+
+    i = 0
+    while i < n:
+        if times[i] is not None:
+            i += 1
+            continue
+
+        # Диапазон подряд идущих пропусков [i, k)
+        k = i
+        while k < n and times[k] is None:
+            k += 1
+
+        left = times[i - 1][1] if i > 0 else (words[0][0] if words else 0.0)
+        right = times[k][0] if k < n else total_end
+        right = max(right, left)
+        step = (right - left) / (k - i)
+
+        for t in range(i, k):
+            times[t] = (left + (t - i) * step, left + (t - i + 1) * step)
+        i = k
+
+    return times
+
+
+def align_phrases(phrases: List[str], words: List[Tuple[str, float, float]]) -> List[Tuple[float, float]]:
+    """
+    Вычисляет точные таймкоды фраз сценария по словам Whisper
+
+    Args:
+        phrases: Фразы исходного текста (в порядке произнесения)
+        words: Слова Whisper: (текст, start, end)
+
+    Returns:
+        list: (start, end) для каждой фразы
+    """
+    phrase_tokens = [tokenize(phrase) for phrase in phrases]
+    script_tokens = [token for tokens in phrase_tokens for token in tokens]
+
+    asr_tokens = []
+    asr_times = []
+    for text, start, end in words:
+        # Whisper иногда склеивает слова с пунктуацией или дефисом - делим на токены
+        tokens = tokenize(text)
+        if not tokens:
+            continue
+        step = (end - start) / len(tokens)
+        for k, token in enumerate(tokens):
+            asr_tokens.append(token)
+            asr_times.append((start + k * step, start + (k + 1) * step))
+
+    total_end = asr_times[-1][1] if asr_times else 0.0
+    mapping = align_tokens(script_tokens, asr_tokens)
+    token_times = _interpolate_times(mapping, asr_times, total_end)
+
+    result = []
+    position = 0
+    previous_end = 0.0
+    for tokens in phrase_tokens:
+        if not tokens:
+            # Фраза без слов (например, "...") - нулевой отрезок в текущей позиции
+            result.append((previous_end, previous_end))
+            continue
+
+        start = token_times[position][0]
+        end = token_times[position + len(tokens) - 1][1]
+        position += len(tokens)
+
+        # Фразы не должны перекрываться и идти назад во времени
+        start = max(start, previous_end)
+        end = max(end, start)
+        result.append((start, end))
+        previous_end = end
+
+    return result
@@ -2,37 +2,28 @@
 Сервис для создания видео из изображений (слайд-шоу) с фоновым видео
 Оптимизирован для работы с ограничением памяти 512 МБ
 """
+import asyncio
 import os
 import tempfile
 import uuid
-import requests
-import subprocess
+import httpx
 import gc
 import json
 from typing import List, Dict
 from PIL import Image
-from app.db.supa_request import supabase
-
-# Определяем путь к ffmpeg/ffprobe
-# Приоритет: системный (Docker) -> imageio-ffmpeg (локальная разработка Windows)
-import shutil
-
-if shutil.which("ffmpeg"):
-    # Docker или Linux с установленным ffmpeg
-    FFMPEG_BINARY = "ffmpeg"
-    FFPROBE_BINARY = "ffprobe"
-    print(f"[VIDEO] Using system ffmpeg/ffprobe")
-else:
-    # Локальная разработка без системного ffmpeg - используем imageio-ffmpeg
-    try:
-        import imageio_ffmpeg
-        FFMPEG_BINARY = imageio_ffmpeg.get_ffmpeg_exe()
-        FFPROBE_BINARY = imageio_ffmpeg.get_ffmpeg_exe().replace('ffmpeg', 'ffprobe')
-        print(f"[VIDEO] Using imageio-ffmpeg binaries: {FFMPEG_BINARY}")
-    except ImportError:
-        FFMPEG_BINARY = "ffmpeg"
-        FFPROBE_BINARY = "ffprobe"
-        print(f"[VIDEO] WARNING: No ffmpeg found, will try system commands")
+from app.config import SEGMENT_RENDER_ENABLED
+from app.db.supa_request import get_db
+from app.service.http_client import get_http_client
+from app.service.asset_cache import asset_cache
+from app.service.media_probe import fingerprint, probe_cache, probe_file, record_probe
+from app.service.storage_io import upload_file, storage_file_name
+from app.service.background_library import BACKGROUND_VIDEOS, get_background_index, background_input, random_offset
+from app.service.render_graph import build_slideshow_graph, split_frames
+from app.service.render_scheduler import plan_render, encoder_args
+from app.service.render_progress import PROGRESS_ARGS, ProgressCallback, RenderProgress
+from app.service.render_prefetch import AssetPrefetcher
+from app.service.subprocess_utils import run_process
+from app.service.ffmpeg_binary import FFMPEG_BINARY, FFPROBE_BINARY
 
 
 def convert_srt_to_ass(srt_content: str) -> str:
@@ -94,7 +85,12 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
     return ass_header + '\n'.join(ass_events)
 
 
-def download_from_supabase_or_url(url: str, file_name_hint: str = None) -> bytes:
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def download_from_supabase_or_url(url: str, file_name_hint: str = None) -> bytes:
     """
     Скачивает файл из Supabase Storage или по прямому URL
 
@@ -105,12 +101,24 @@ def download_from_supabase_or_url(url: str, file_name_hint: str = None) -> bytes
     Returns:
         bytes: Содержимое файла
     """
+    cached = asset_cache.get(url) if asset_cache else None
+    if cached:
+        try:
+            return await asyncio.to_thread(_read_file, cached)
+        except OSError:
+            pass
+
     try:
         # Сначала пробуем скачать по URL
-        response = requests.get(url, timeout=30)
+        response = await get_http_client().get(url, timeout=30)
         response.raise_for_status()
+        if asset_cache:
+            try:
+                await asyncio.to_thread(asset_cache.put_bytes, url, response.content)
+            except Exception as cache_error:
+                print(f"[VIDEO_SERVICE] Failed to cache {url}: {str(cache_error)}")
         return response.content
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         # Если не получилось по URL - пробуем через SDK
         if file_name_hint:
             try:
@@ -119,61 +127,135 @@ def download_from_supabase_or_url(url: str, file_name_hint: str = None) -> bytes
                     file_name_hint = url.split('/videos/')[-1].split('?')[0]
 
                 # Скачиваем через Supabase SDK
-                file_data = supabase.storage.from_("videos").download(file_name_hint)
+                db = await get_db()
+                file_data = await db.storage.from_("videos").download(file_name_hint)
                 return file_data
             except Exception as sdk_error:
                 raise Exception(f"Failed to download file: URL method failed ({str(e)}), SDK method failed ({str(sdk_error)})")
         raise Exception(f"Failed to download file from URL: {str(e)}")
 
 
-# Пути к фоновым видео (абсолютные пути от корня проекта)
-import os as _os
-# __file__ это G:\site\backend\app\service\video_service.py
-# dirname 1 раз: G:\site\backend\app\service
-# dirname 2 раза: G:\site\backend\app
-# dirname 3 раза: G:\site\backend
-_BACKEND_DIR = _os.path.dirname(_os.path.dirname(_os.path.dirname(_os.path.abspath(__file__))))
+async def _ffprobe_audio(audio_path: str) -> dict:
+    cmd = [
+        FFPROBE_BINARY,
+        "-v", "error",
+        "-select_streams", "a:0",
+        "-show_entries", "format=duration:stream=codec_name,sample_rate,channels",
+        "-of", "json",
+        audio_path
+    ]
 
-BACKGROUND_VIDEOS = {
-    "minecraft": _os.path.join(_BACKEND_DIR, "assets", "backgrounds", "minecraft.mp4"),
-    "subway": _os.path.join(_BACKEND_DIR, "assets", "backgrounds", "subway.mp4"),
-    "abstract": _os.path.join(_BACKEND_DIR, "assets", "backgrounds", "abstract.mp4"),
-}
+    returncode, stdout, stderr = await run_process(cmd, timeout=10)
+    if returncode != 0:
+        raise RuntimeError(f"ffprobe failed: {stderr.decode('utf-8', errors='ignore')[-300:]}")
 
+    data = json.loads(stdout)
+    stream = (data.get("streams") or [{}])[0]
+    return {
+        "duration": float(data["format"]["duration"]),
+        "codec": stream.get("codec_name"),
+        "sample_rate": int(stream["sample_rate"]) if stream.get("sample_rate") else None,
+        "channels": stream.get("channels"),
+    }
 
-def get_audio_duration(audio_path: str) -> float:
+
+async def probe_audio(audio_path: str) -> dict:
     """
-    Получает длительность аудио файла через ffprobe
+    Длительность и параметры аудио файла
+
+    MP3 и MP4/M4A читаются по заголовкам в процессе (media_probe), остальное - ffprobe.
+    Результат кэшируется по отпечатку содержимого файла.
+
+    Returns:
+        dict: {"duration", "codec", "sample_rate", "channels", "size"}
+
+    Raises:
+        RuntimeError: Файл не разобран и ffprobe не смог его прочитать
+    """
+    key = fingerprint(audio_path)
+    info = probe_cache.get(key)
+    if info is None:
+        info = probe_file(audio_path)
+        if info is not None:
+            record_probe("native")
+        else:
+            info = await _ffprobe_audio(audio_path)
+            record_probe("ffprobe")
+        probe_cache.put(key, info)
+    return {**info, "size": os.path.getsize(audio_path)}
+
+
+async def get_audio_duration(audio_path: str) -> float:
+    """
+    Получает длительность аудио файла (см. probe_audio)
 
     Args:
         audio_path: Путь к аудио файлу
 
     Returns:
         float: Длительность в секундах
+
+    Raises:
+        RuntimeError: Длительность не определена - запасное значение выбирает вызывающий
     """
-    try:
-        cmd = [
-            FFPROBE_BINARY,
-            "-v", "error",
-            "-show_entries", "format=duration",
-            "-of", "json",
-            audio_path
-        ]
-
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-
-        if result.returncode == 0:
-            data = json.loads(result.stdout)
-            duration = float(data["format"]["duration"])
-            print(f"[AUDIO_DURATION] Detected audio duration: {duration}s")
-            return duration
-        else:
-            print(f"[AUDIO_DURATION] ffprobe failed, using default 30s")
-            return 30.0
+    duration = (await probe_audio(audio_path))["duration"]
+    print(f"[AUDIO_DURATION] Detected audio duration: {duration}s")
+    return duration
 
+
+async def audio_output_args(audio_path: str) -> List[str]:
+    """
+    Кодек звука в выходном mp4: AAC озвучка (m4a из synthesize_speech) копируется без
+    перекодирования, остальное (старые mp3 озвучки) кодируется в AAC
+    """
+    try:
+        codec = (await probe_audio(audio_path))["codec"]
     except Exception as e:
-        print(f"[AUDIO_DURATION] Error getting duration: {str(e)}, using default 30s")
-        return 30.0
+        print(f"[FFMPEG] Could not probe audio codec, re-encoding: {str(e)}")
+        codec = None
+    if codec == "aac":
+        return ["-c:a", "copy"]
+    return ["-c:a", "aac", "-b:a", "128k"]
+
+
+def compute_slide_timings(scenes: List[Dict], valid_scenes: List[Dict], audio_duration: float, tolerance: float = 0.5):
+    """
+    Тайминги слайдов по озвучке сцен (audio_offset / audio_duration из БД)
+
+    Слайд показывается с начала озвучки своей сцены до начала следующего слайда;
+    первый слайд - с нуля, последний - до конца дорожки. Сцены без изображения
+    в слайд-шоу не попадают, их озвучка остаётся на предыдущем слайде. Слайды сцен
+    без озвучки делят время с предыдущим озвученным слайдом (стоящие в начале -
+    с первым): промежуток группы делится поровну.
+
+    Returns:
+        list | None: [(start_time, duration)] для valid_scenes или None, если тайминги
+        отсутствуют или не соответствуют дорожке (озвучку нужно перегенерировать)
+    """
+    voiced = [s for s in scenes if s.get("audio_offset") is not None and s.get("audio_duration")]
+    anchors = [i for i, s in enumerate(valid_scenes) if s.get("audio_offset") is not None]
+    if not voiced or not anchors:
+        return None
+
+    # Сумма клипов должна совпадать с длиной дорожки, иначе тайминги устарели
+    track_end = max(s["audio_offset"] + s["audio_duration"] for s in voiced)
+    if abs(track_end - audio_duration) > tolerance:
+        print(f"[VIDEO_SERVICE] Scene timing ({track_end:.2f}s) doesn't match audio ({audio_duration:.2f}s)")
+        return None
+
+    starts = [valid_scenes[i]["audio_offset"] for i in anchors]
+    if any(b < a for a, b in zip(starts, starts[1:])):
+        return None
+    starts[0] = 0.0
+    ends = starts[1:] + [audio_duration]
+
+    # Группа: озвученный слайд и идущие за ним слайды без озвучки
+    bounds = [0] + anchors[1:] + [len(valid_scenes)]
+    timings = []
+    for first, last, start, end in zip(bounds, bounds[1:], starts, ends):
+        step = (end - start) / (last - first)
+        timings.extend((start + k * step, step) for k in range(last - first))
+    return timings
 
 
 async def create_slideshow_video(
@@ -181,7 +263,8 @@ async def create_slideshow_video(
     voiceover_url: str = None,
     subtitle_content: str = None,
     total_duration: float = 30.0,
-    background_style: str = "minecraft"
+    background_style: str = "minecraft",
+    on_progress: ProgressCallback = None
 ) -> str:
     """
     Создает слайд-шоу видео из изображений сцен с фоновым видео
@@ -189,11 +272,14 @@ async def create_slideshow_video(
     Использует ffmpeg напрямую вместо MoviePy
 
     Args:
-        scenes: Список сцен с generated_image_url
+        scenes: Список сцен (сцены без generated_image_url пропускаются, но их
+            озвучка учитывается в таймингах)
         voiceover_url: URL аудио озвучки (опционально)
         subtitle_content: Содержимое субтитров в формате SRT (опционально)
         total_duration: Общая длительность видео в секундах
         background_style: Стиль фонового видео ('minecraft', 'subway', 'abstract')
+        on_progress: async callback прогресса (stage, percent, fps, eta_seconds),
+            вызывается не чаще RENDER_PROGRESS_INTERVAL
 
     Returns:
         str: Публичный URL загруженного видео
@@ -202,8 +288,16 @@ async def create_slideshow_video(
     print(f"[VIDEO_SERVICE] Scenes: {len(scenes)}, Duration: {total_duration}, Background: {background_style}")
 
     temp_files = []
+    progress = RenderProgress(on_progress)
+
+    # ОПТИМИЗАЦИЯ: Уменьшаем разрешение до 720x1280 (вместо 1080x1920)
+    video_width = 720
+    video_height = 1280
+    prefetch = AssetPrefetcher(video_height)
 
     try:
+        await progress.set_stage("downloading")
+
         # Фильтруем сцены с изображениями
         valid_scenes = [s for s in scenes if s.get("generated_image_url")]
         print(f"[VIDEO_SERVICE] Valid scenes with images: {len(valid_scenes)}")
@@ -211,187 +305,157 @@ async def create_slideshow_video(
         if not valid_scenes:
             raise ValueError("No scenes with generated images found")
 
-        # ПРИМЕЧАНИЕ: Длительность будет пересчитана после загрузки аудио
-        # Это временное значение для логирования
-        duration_per_scene = total_duration / len(valid_scenes)
-        print(f"[VIDEO_SERVICE] Initial duration per scene: {duration_per_scene}s")
-
-        # ОПТИМИЗАЦИЯ: Уменьшаем разрешение до 720x1280 (вместо 1080x1920)
-        video_width = 720
-        video_height = 1280
-
-        # Обрабатываем и сохраняем изображения по одному с агрессивным сжатием
-        processed_images = []
-        for i, scene in enumerate(valid_scenes):
-            print(f"[VIDEO_SERVICE] Processing scene {i+1}/{len(valid_scenes)}")
-            image_url = scene.get("generated_image_url")
-
-            # Скачиваем изображение
-            print(f"[VIDEO_SERVICE] Downloading image for scene {i+1}...")
-            img_content = download_from_supabase_or_url(image_url)
-            print(f"[VIDEO_SERVICE] Downloaded {len(img_content)} bytes")
-
-            # Сохраняем во временный файл
-            temp_img = tempfile.NamedTemporaryFile(delete=False, suffix=".jpg")
-            temp_img.write(img_content)
-            temp_img.close()
-            temp_files.append(temp_img.name)
-
-            # ОПТИМИЗАЦИЯ: Агрессивно сжимаем изображение
-            img = Image.open(temp_img.name)
-
-            # Размещаем картинку в верхней части экрана (50% высоты, чтобы не закрывать субтитры внизу)
-            overlay_height = int(video_height * 0.5)
-            overlay_width = int(overlay_height * img.width / img.height)
-
-            # ОПТИМИЗАЦИЯ: Используем BILINEAR вместо LANCZOS (быстрее и меньше памяти)
-            img_resized = img.resize((overlay_width, overlay_height), Image.Resampling.BILINEAR)
-
-            # Освобождаем память от оригинального изображения
-            img.close()
-            del img
-
-            # Сохраняем с агрессивным сжатием (качество 70 вместо 95)
-            temp_processed = tempfile.NamedTemporaryFile(delete=False, suffix=".jpg")
-            img_resized.save(temp_processed.name, format="JPEG", quality=70, optimize=True)
-            temp_processed.close()
-            temp_files.append(temp_processed.name)
-
-            processed_images.append({
-                "path": temp_processed.name,
-                "width": overlay_width,
-                "height": overlay_height,
-                "start_time": i * duration_per_scene,
-                "duration": duration_per_scene
-            })
-
-            # Освобождаем память
-            img_resized.close()
-            del img_resized
-            gc.collect()  # Явная очистка памяти
-
-            print(f"[VIDEO_SERVICE] Scene {i+1} processed and compressed")
+        # Все изображения и озвучка качаются одновременно, пока готовится фон
+        prefetch.prefetch_images(s["generated_image_url"] for s in valid_scenes)
+        audio_task = None
+        if voiceover_url:
+            # Расширение - как у файла в storage: старые озвучки mp3, новые m4a
+            voiceover_name = storage_file_name(voiceover_url)
+            audio_suffix = os.path.splitext(voiceover_name or "")[1] or ".m4a"
+            audio_task = prefetch.fetch(voiceover_url, suffix=audio_suffix, file_name_hint=voiceover_name)
 
         # Проверяем наличие фонового видео
         background_path = BACKGROUND_VIDEOS.get(background_style)
         print(f"[VIDEO_SERVICE] Background path: {background_path}")
 
+        # Подготовленный фон из библиотеки (720x1280/30fps сегменты), если уже перекодирован
+        background_index = get_background_index(background_style)
+        if background_index:
+            print(f"[VIDEO_SERVICE] Using pre-transcoded background ({len(background_index['segments'])} segments)")
+
         if not background_path or not os.path.exists(background_path):
             print(f"[VIDEO_SERVICE] Background video not found, creating black background")
             # Создаем черный фон
-            background_path = create_solid_color_image(video_width, video_height, (0, 0, 0))
+            background_path = await asyncio.to_thread(create_solid_color_image, video_width, video_height, (0, 0, 0))
             temp_files.append(background_path)
 
         # Скачиваем аудио, если есть
         audio_path = None
         actual_duration = total_duration  # По умолчанию используем переданную длительность
 
-        if voiceover_url:
-            print(f"[VIDEO_SERVICE] Downloading voiceover...")
+        if audio_task:
+            print(f"[VIDEO_SERVICE] Waiting for voiceover...")
             try:
-                audio_content = download_from_supabase_or_url(voiceover_url)
-                audio_temp = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
-                audio_temp.write(audio_content)
-                audio_temp.close()
-                audio_path = audio_temp.name
-                temp_files.append(audio_path)
-                print(f"[VIDEO_SERVICE] Voiceover downloaded: {len(audio_content)} bytes")
-
-                # ВАЖНО: Получаем реальную длительность аудио
-                actual_duration = get_audio_duration(audio_path)
-                print(f"[VIDEO_SERVICE] Using audio duration: {actual_duration}s (was {total_duration}s)")
-
-                # ПЕРЕСЧИТЫВАЕМ длительность для каждой сцены
-                if actual_duration != total_duration:
-                    new_duration_per_scene = actual_duration / len(valid_scenes)
-                    print(f"[VIDEO_SERVICE] Recalculating scene durations: {new_duration_per_scene}s per scene")
-
-                    for i, img_info in enumerate(processed_images):
-                        img_info["start_time"] = i * new_duration_per_scene
-                        img_info["duration"] = new_duration_per_scene
-                        print(f"[VIDEO_SERVICE] Scene {i+1}: start={img_info['start_time']:.2f}s, duration={img_info['duration']:.2f}s")
-
-                # Освобождаем память
-                del audio_content
-                gc.collect()
+                # Скачивается потоково прямо на диск (файл удалит prefetch.close)
+                audio_path = await audio_task
+                print(f"[VIDEO_SERVICE] Voiceover downloaded: {os.path.getsize(audio_path)} bytes")
             except Exception as e:
                 print(f"[VIDEO_SERVICE] Warning: Could not download voiceover: {str(e)}")
                 audio_path = None
 
-        # Сохраняем субтитры во временный файл если есть
-        subtitle_path = None
-        if subtitle_content:
-            print(f"[VIDEO_SERVICE] Converting SRT to ASS for better UTF-8 support...")
-            # Конвертируем SRT в ASS для лучшей поддержки кириллицы
-            ass_content = convert_srt_to_ass(subtitle_content)
-
-            print(f"[VIDEO_SERVICE] Saving ASS subtitles to temp file...")
-            # ВАЖНО: Используем utf-8-sig для добавления BOM
-            subtitle_temp = tempfile.NamedTemporaryFile(delete=False, suffix=".ass", mode='w', encoding='utf-8-sig')
-            subtitle_temp.write(ass_content)
-            subtitle_temp.close()
-            subtitle_path = subtitle_temp.name
-            temp_files.append(subtitle_path)
-            print(f"[VIDEO_SERVICE] ASS subtitles saved to: {subtitle_path}")
-
-        # КЛЮЧЕВАЯ ОПТИМИЗАЦИЯ: Используем ffmpeg напрямую
+        if audio_path:
+            # ВАЖНО: Получаем реальную длительность аудио
+            try:
+                actual_duration = await get_audio_duration(audio_path)
+                print(f"[VIDEO_SERVICE] Using audio duration: {actual_duration}s (was {total_duration}s)")
+            except Exception as e:
+                print(f"[VIDEO_SERVICE] Warning: Could not measure voiceover, keeping {total_duration}s: {str(e)}")
+
+        # Длительность каждой сцены: по offset'ам озвучки сцен,
+        # а если их нет или они не соответствуют дорожке - равномерно
+        slide_timings = compute_slide_timings(scenes, valid_scenes, actual_duration) if audio_path else None
+        if slide_timings:
+            print(f"[VIDEO_SERVICE] Using per-scene voiceover timing")
+        else:
+            duration_per_scene = actual_duration / len(valid_scenes)
+            print(f"[VIDEO_SERVICE] Duration per scene: {duration_per_scene}s")
+            slide_timings = [(i * duration_per_scene, duration_per_scene) for i in range(len(valid_scenes))]
+
+        for i, (start_time, duration) in enumerate(slide_timings):
+            print(f"[VIDEO_SERVICE] Scene {i+1}: start={start_time:.2f}s, duration={duration:.2f}s")
+
         output_temp = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
         output_temp.close()
         temp_files.append(output_temp.name)
 
-        print(f"[VIDEO_SERVICE] Building video with ffmpeg...")
         print(f"[VIDEO_SERVICE] Final video duration: {actual_duration}s")
-        success = build_video_with_ffmpeg(
-            background_path=background_path,
-            images=processed_images,
-            audio_path=audio_path,
-            output_path=output_temp.name,
-            video_width=video_width,
-            video_height=video_height,
-            total_duration=actual_duration,  # Используем реальную длительность!
-            subtitle_path=subtitle_path
-        )
 
-        if not success:
-            raise Exception("FFmpeg video building failed")
+        if SEGMENT_RENDER_ENABLED:
+            # Инкрементальный рендер: перекодируются только сцены, которых нет в кэше сегментов
+            from app.service.segment_render import render_segmented_video
+
+            print(f"[VIDEO_SERVICE] Building video from cached scene segments...")
+            stats = await render_segmented_video(
+                prefetch=prefetch,
+                scenes=valid_scenes,
+                timings=slide_timings,
+                background_path=background_path,
+                audio_path=audio_path,
+                subtitle_content=subtitle_content,
+                output_path=output_temp.name,
+                total_duration=actual_duration,
+                video_width=video_width,
+                video_height=video_height,
+                background_index=background_index,
+                progress=progress
+            )
+            print(f"[VIDEO_SERVICE] Segments: {stats}")
+        else:
+            # Изображения уже качаются; сжатие (PIL) - в пуле потоков по мере готовности
+            prepared = await asyncio.gather(*(prefetch.image(scene["generated_image_url"]) for scene in valid_scenes))
+            processed_images = [
+                {**image, "start_time": start_time, "duration": duration}
+                for image, (start_time, duration) in zip(prepared, slide_timings)
+            ]
+            print(f"[VIDEO_SERVICE] {len(processed_images)} images prepared: {prefetch.stats}")
+
+            # Сохраняем субтитры во временный файл если есть
+            subtitle_path = None
+            if subtitle_content:
+                print(f"[VIDEO_SERVICE] Converting SRT to ASS for better UTF-8 support...")
+                # Конвертируем SRT в ASS для лучшей поддержки кириллицы
+                ass_content = convert_srt_to_ass(subtitle_content)
+
+                print(f"[VIDEO_SERVICE] Saving ASS subtitles to temp file...")
+                # ВАЖНО: Используем utf-8-sig для добавления BOM
+                subtitle_temp = tempfile.NamedTemporaryFile(delete=False, suffix=".ass", mode='w', encoding='utf-8-sig')
+                subtitle_temp.write(ass_content)
+                subtitle_temp.close()
+                subtitle_path = subtitle_temp.name
+                temp_files.append(subtitle_path)
+                print(f"[VIDEO_SERVICE] ASS subtitles saved to: {subtitle_path}")
+
+            # Подготовленный фон: случайная точка старта, на вход только нужные сегменты
+            background_options = None
+            if background_index:
+                start = random_offset(background_index, actual_duration)
+                print(f"[VIDEO_SERVICE] Background starts at {start:.1f}s")
+                background_path, background_options = background_input(background_index, start, actual_duration)
+                temp_files.append(background_path)
+
+            # КЛЮЧЕВАЯ ОПТИМИЗАЦИЯ: Используем ffmpeg напрямую
+            print(f"[VIDEO_SERVICE] Building video with ffmpeg...")
+            success = await build_video_with_ffmpeg(
+                background_path=background_path,
+                images=processed_images,
+                audio_path=audio_path,
+                output_path=output_temp.name,
+                video_width=video_width,
+                video_height=video_height,
+                total_duration=actual_duration,  # Используем реальную длительность!
+                subtitle_path=subtitle_path,
+                background_options=background_options,
+                progress=progress
+            )
+
+            if not success:
+                raise Exception("FFmpeg video building failed")
 
         print(f"[VIDEO_SERVICE] Video export complete!")
 
         # Загружаем в Supabase Storage
+        await progress.set_stage("uploading")
         file_name = f"video_{uuid.uuid4()}.mp4"
         print(f"[VIDEO_SERVICE] Uploading video to Supabase: {file_name}")
 
-        with open(output_temp.name, "rb") as f:
-            file_data = f.read()
-        print(f"[VIDEO_SERVICE] Read {len(file_data)} bytes from exported video")
-
-        # Используем upsert для перезаписи файла
-        print(f"[VIDEO_SERVICE] Uploading to Supabase Storage...")
-        res = supabase.storage.from_("videos").upload(
-            path=file_name,
-            file=file_data,
-            file_options={"content-type": "video/mp4", "upsert": "true"}
-        )
-        print(f"[VIDEO_SERVICE] Upload complete!")
+        print(f"[VIDEO_SERVICE] Uploading {os.path.getsize(output_temp.name)} bytes to Supabase Storage...")
+        public_url = await upload_file(output_temp.name, file_name, "video/mp4")
+        print(f"[VIDEO_SERVICE] Upload complete! URL: {public_url}")
 
-        # Освобождаем память от файла
-        del file_data
-        gc.collect()
+        await progress.set_stage("done")
+        print(f"[VIDEO_SERVICE] Stage timings: {progress.timings}, prefetch: {prefetch.stats}")
 
-        # Получаем публичный URL
-        try:
-            public_url = supabase.storage.from_("videos").get_public_url(file_name)
-            print(f"[VIDEO_SERVICE] Got public URL: {public_url}")
-            return public_url
-        except Exception as e:
-            # Fallback: создаем signed URL на 1 год
-            print(f"[VIDEO_SERVICE] get_public_url failed ({str(e)}), falling back to signed URL")
-            signed_url = supabase.storage.from_("videos").create_signed_url(
-                file_name,
-                expires_in=31536000  # 1 год в секундах
-            )
-            print(f"[VIDEO_SERVICE] Got signed URL: {signed_url['signedURL']}")
-            return signed_url['signedURL']
+        return public_url
 
     except Exception as e:
         print(f"[VIDEO_SERVICE] ERROR during video creation: {str(e)}")
@@ -401,6 +465,7 @@ async def create_slideshow_video(
 
     finally:
         # Очищаем все временные файлы
+        await prefetch.close()
         print(f"[VIDEO_SERVICE] Cleaning up {len(temp_files)} temporary files...")
         for temp_file in temp_files:
             if os.path.exists(temp_file):
@@ -412,7 +477,7 @@ async def create_slideshow_video(
         print(f"[VIDEO_SERVICE] Cleanup complete")
 
 
-def build_video_with_ffmpeg(
+async def build_video_with_ffmpeg(
     background_path: str,
     images: List[Dict],
     audio_path: str,
@@ -420,7 +485,10 @@ def build_video_with_ffmpeg(
     video_width: int,
     video_height: int,
     total_duration: float,
-    subtitle_path: str = None
+    subtitle_path: str = None,
+    background_options: List[str] = None,
+    plan: dict = None,
+    progress: RenderProgress = None
 ) -> bool:
     """
     Собирает видео используя ffmpeg напрямую (экономит память)
@@ -435,6 +503,10 @@ def build_video_with_ffmpeg(
         video_height: Высота финального видео
         total_duration: Общая длительность
         subtitle_path: Путь к файлу субтитров .srt (может быть None)
+        background_options: Опции входа подготовленного фона из библиотеки
+            (background_path - concat список сегментов 720x1280/30fps)
+        plan: Потоки/preset/CRF/таймаут (по умолчанию - render_scheduler.plan_render по загрузке)
+        progress: Куда сообщать прогресс кодирования (разбирается из ffmpeg -progress)
 
     Returns:
         bool: True если успешно, False иначе
@@ -442,145 +514,80 @@ def build_video_with_ffmpeg(
     try:
         print(f"[FFMPEG] Building video with {len(images)} images")
 
-        # Строим filter_complex для наложения изображений
-        filter_parts = []
-
-        # Базовый фон - обрезаем до нужной длительности и масштабируем
-        # stream_loop уже зациклил видео на входе, здесь просто обрезаем и масштабируем
-        filter_parts.append(f"[0:v]trim=duration={total_duration},setpts=PTS-STARTPTS,scale={video_width}:{video_height}:force_original_aspect_ratio=decrease,pad={video_width}:{video_height}:(ow-iw)/2:(oh-ih)/2[bg_raw]")
-
-        # Добавляем субтитры НА ФОН (если есть), ДО наложения слайд-шоу
-        if subtitle_path:
-            # Экранируем путь для ffmpeg (специфично для Windows и Linux)
-            # 1. Заменяем обратные слэши на прямые (Windows -> POSIX)
-            # 2. Экранируем двоеточие после буквы диска (C: -> C\:)
-            # 3. Экранируем специальные символы для filter_complex
-            escaped_subtitle_path = subtitle_path.replace('\\', '/')
-            # Для Windows путей экранируем двоеточие после буквы диска
-            import re
-            escaped_subtitle_path = re.sub(r'^([A-Za-z]):', r'\1\\:', escaped_subtitle_path)
-            # Экранируем одиночные кавычки и другие спецсимволы для ffmpeg
-            escaped_subtitle_path = escaped_subtitle_path.replace("'", r"'\\\''")
-
-            # Субтитры в стиле TikTok/YouTube Shorts:
-            # - ASS формат с UTF-8-sig BOM для корректной кириллицы
-            # - Impact шрифт (установлен в Docker контейнере)
-            # - FontSize=18 для лучшей читаемости
-            # - Белый текст с чёрной обводкой (Outline=3)
-            # - Центрирование по низу (Alignment=2)
-            # - MarginV=40 (субтитры внизу, под слайдшоу)
-            # - MarginL/MarginR=20 (отступы по бокам)
-            # ВАЖНО: Используем ass фильтр вместо subtitles для лучшей поддержки кодировок
-            subtitle_on_bg = f"[bg_raw]ass='{escaped_subtitle_path}'[bg]"
-            filter_parts.append(subtitle_on_bg)
-        else:
-            # Если нет субтитров - просто переименовываем label
-            filter_parts.append(f"[bg_raw]null[bg]")
-
-        # Добавляем каждое изображение с zoom эффектом
-        current_base = "bg"
-        for i, img_info in enumerate(images):
-            img_input_idx = i + 1  # Индексы входов: 0 - фон, 1+ - изображения
-
-            # Позиция Y - размещаем в верхней части экрана
-            # Оставляем ~50% внизу для фона и субтитров
-            y_pos = int(video_height * 0.05)  # Начинаем с 5% от верха (очень близко к верху)
-
-            # Позиция X (центрируем по горизонтали)
-            x_pos = (video_width - img_info["width"]) // 2
-
-            # Создаем overlay с временными рамками и ZOOM эффектом
-            start_time = img_info["start_time"]
-            end_time = start_time + img_info["duration"]
-            duration = img_info["duration"]
-
-            # Ken Burns эффект (активный zoom): от 1.0 до 1.25 масштаба
-            # zoompan параметры:
-            # z - масштаб: 1.0 + (on/продолжительность) * 0.25 = плавный zoom от 1.0 до 1.25
-            # d - длительность в кадрах
-            # s - размер выходного кадра
-            # fps - кадровая частота (30 FPS теперь)
-            total_frames = int(duration * 30)  # 30 FPS вместо 24
-            zoom_filter = f"[{img_input_idx}:v]scale={img_info['width']}:{img_info['height']},zoompan=z='min(1.0+on/{total_frames}*0.25,1.25)':d={total_frames}:s={img_info['width']}x{img_info['height']}:fps=30[img{i}]"
-            filter_parts.append(zoom_filter)
-
-            if i < len(images) - 1:
-                # Промежуточный результат
-                output_label = f"tmp{i}"
-                filter_parts.append(
-                    f"[{current_base}][img{i}]overlay={x_pos}:{y_pos}:enable='between(t,{start_time},{end_time})'[{output_label}]"
-                )
-                current_base = output_label
-            else:
-                # Последний overlay - всегда выходной label
-                filter_parts.append(
-                    f"[{current_base}][img{i}]overlay={x_pos}:{y_pos}:enable='between(t,{start_time},{end_time})'[outv]"
-                )
-
-        filter_complex = ";".join(filter_parts)
+        # Граф: дорожка слайдов (zoompan каждого изображения -> concat) накладывается
+        # на фон одним overlay, стоимость не растёт с количеством сцен
+        frames = split_frames([(img["start_time"], img["duration"]) for img in images], total_duration)
+        graph = build_slideshow_graph(
+            background_path=background_path,
+            images=images,
+            frames=frames,
+            video_width=video_width,
+            video_height=video_height,
+            subtitle_path=subtitle_path,
+            duration=total_duration,
+            background_options=background_options,
+            background_prepared=background_options is not None
+        )
+
+        filter_complex = graph.filter_complex()
         print(f"[FFMPEG] Filter complex length: {len(filter_complex)} chars")
         print(f"[FFMPEG] Filter preview: {filter_complex[:300]}...")  # Показываем первые 300 символов
 
         # Строим команду ffmpeg
-        cmd = [FFMPEG_BINARY, "-y"]  # -y для перезаписи
+        cmd = [FFMPEG_BINARY, "-y", *PROGRESS_ARGS]  # -y для перезаписи, прогресс - в stdout
 
         # Входы: фон + все изображения + аудио (ВСЕ ВХОДЫ ДОЛЖНЫ БЫТЬ ДО ФИЛЬТРОВ!)
-        # ВАЖНО: stream_loop -1 для бесконечного зацикливания фонового видео
-        cmd.extend(["-stream_loop", "-1", "-i", background_path])
-        for img_info in images:
-            cmd.extend(["-i", img_info["path"]])
+        cmd.extend(graph.input_args())
 
         # Добавляем аудио input если есть (ПЕРЕД filter_complex!)
         audio_input_index = None
         if audio_path:
-            audio_input_index = len(images) + 1  # Индекс аудио = фон(0) + изображения(N) + 1
+            audio_input_index = len(graph.inputs)  # Индекс аудио = фон(0) + изображения(N)
             cmd.extend(["-i", audio_path])
 
         # Фильтр (ПОСЛЕ всех входов)
         cmd.extend(["-filter_complex", filter_complex])
 
         # Маппинг видео
-        cmd.extend(["-map", "[outv]"])
+        cmd.extend(["-map", "[outv]", "-frames:v", str(sum(frames))])
 
         # Маппинг аудио если есть
         if audio_input_index is not None:
             cmd.extend(["-map", f"{audio_input_index}:a"])
-            cmd.extend(["-c:a", "aac", "-b:a", "128k"])
+            cmd.extend(await audio_output_args(audio_path))
 
-        # ОПТИМИЗАЦИИ для экономии памяти и CPU:
+        # Потоки, preset/CRF и таймаут - по железу и загрузке очереди рендера
+        if plan is None:
+            plan = plan_render(sum(frames))
+        print(f"[FFMPEG] Encoder plan: {plan}")
+
+        cmd.extend(encoder_args(plan))
         cmd.extend([
-            "-c:v", "libx264",           # Видео кодек
-            "-preset", "ultrafast",       # КРИТИЧНО: ultrafast вместо medium (экономит CPU и память)
-            "-crf", "28",                 # Более высокое сжатие (23 по умолчанию, 28 = меньше размер)
             "-movflags", "+faststart",    # Для веб-стриминга
             "-pix_fmt", "yuv420p",        # Совместимость
             "-r", "30",                   # FPS - увеличено до 30 для плавности
             "-shortest",                  # ВАЖНО: останавливаем когда заканчивается КРАТЧАЙШИЙ вход (предотвращает обрезку)
-            "-threads", "2",              # КРИТИЧНО: ограничиваем потоки до 2 (меньше памяти)
             "-max_muxing_queue_size", "1024",  # Уменьшаем буфер
             output_path
         ])
 
         print(f"[FFMPEG] Running command: {' '.join(cmd[:10])}... (truncated)")
 
-        # Запускаем ffmpeg
-        result = subprocess.run(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=300  # 5 минут таймаут
-        )
+        # Запускаем ffmpeg (асинхронно, event loop не блокируется), читая прогресс по ходу
+        progress = progress or RenderProgress(None)
+        await progress.set_stage("encoding", frames_total=sum(frames))
+        returncode, _, stderr = await run_process(cmd, timeout=plan["timeout"], on_stdout_line=progress.line_handler())
 
-        if result.returncode != 0:
-            error_output = result.stderr.decode('utf-8', errors='ignore')
+        if returncode != 0:
+            error_output = stderr.decode('utf-8', errors='ignore')
             print(f"[FFMPEG] ERROR: {error_output[-500:]}")  # Последние 500 символов ошибки
             return False
 
         print(f"[FFMPEG] Video built successfully!")
         return True
 
-    except subprocess.TimeoutExpired:
-        print(f"[FFMPEG] ERROR: Process timeout (> 5 minutes)")
+    except TimeoutError:
+        print(f"[FFMPEG] ERROR: Process timeout (> {plan['timeout']}s)")
         return False
     except Exception as e:
         print(f"[FFMPEG] ERROR: {str(e)}")
@@ -589,6 +596,45 @@ def build_video_with_ffmpeg(
         return False
 
 
+def prepare_overlay_image(source_path: str, output_path: str, video_height: int) -> tuple:
+    """
+    Масштабирует изображение сцены под overlay и агрессивно сжимает его
+    (синхронная CPU работа - вызывать в пуле потоков, см. render_prefetch)
+
+    Args:
+        source_path: Путь к исходному изображению
+        output_path: Путь для сохранения JPEG
+        video_height: Высота финального видео
+
+    Returns:
+        tuple: (ширина, высота) обработанного изображения
+    """
+    # ОПТИМИЗАЦИЯ: Агрессивно сжимаем изображение
+    img = Image.open(source_path)
+
+    # Размещаем картинку в верхней части экрана (50% высоты, чтобы не закрывать субтитры внизу)
+    overlay_height = int(video_height * 0.5)
+    # Чётная ширина: yuv420 не поддерживает нечётные размеры (иначе pad в графе падает, например, на 9:16)
+    overlay_width = max(2, int(overlay_height * img.width / img.height) // 2 * 2)
+
+    # ОПТИМИЗАЦИЯ: Используем BILINEAR вместо LANCZOS (быстрее и меньше памяти)
+    img_resized = img.resize((overlay_width, overlay_height), Image.Resampling.BILINEAR)
+
+    # Освобождаем память от оригинального изображения
+    img.close()
+    del img
+
+    # Сохраняем с агрессивным сжатием (качество 70 вместо 95)
+    img_resized.save(output_path, format="JPEG", quality=70, optimize=True)
+
+    # Освобождаем память
+    img_resized.close()
+    del img_resized
+    gc.collect()  # Явная очистка памяти
+
+    return overlay_width, overlay_height
+
+
 def create_solid_color_image(width: int, height: int, color: tuple) -> str:
     """
     Создает изображение сплошного цвета и возвращает путь к временному файлу
@@ -0,0 +1,86 @@
+"""
+Менеджер модели faster-whisper
+
+Модель загружается лениво один раз на процесс и остаётся в памяти.
+Все распознавания выполняются в одном выделенном потоке: запросы встают
+в очередь executor'а, модель не грузится повторно и не используется
+из нескольких потоков одновременно (пиковая память = одна модель + один запрос).
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+from app.config import WHISPER_MODEL_SIZE, WHISPER_COMPUTE_TYPE, WHISPER_CPU_THREADS
+
+_model = None
+_model_lock = threading.Lock()
+
+# Один поток = очередь запросов к модели
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="whisper")
+
+
+def is_whisper_available() -> bool:
+    try:
+        import faster_whisper  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def get_whisper_model():
+    """
+    Возвращает загруженную модель (загружает при первом вызове)
+
+    Raises:
+        ImportError: Если faster-whisper не установлен
+    """
+    global _model
+
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from faster_whisper import WhisperModel
+
+                started = time.monotonic()
+                # CPU mode для экономии памяти; tiny ~40MB, base ~75MB
+                _model = WhisperModel(
+                    WHISPER_MODEL_SIZE,
+                    device="cpu",
+                    compute_type=WHISPER_COMPUTE_TYPE,
+                    cpu_threads=WHISPER_CPU_THREADS,
+                )
+                print(f"[WHISPER] Model '{WHISPER_MODEL_SIZE}' loaded in {time.monotonic() - started:.1f}s")
+    return _model
+
+
+def _transcribe_sync(audio_path: str, options: dict) -> Tuple[list, object]:
+    model = get_whisper_model()
+    segments, info = model.transcribe(audio_path, **options)
+    # transcribe возвращает ленивый генератор - распознавание происходит при итерации,
+    # поэтому материализуем его здесь, в потоке модели
+    return list(segments), info
+
+
+async def transcribe_audio(audio_path: str, **options) -> Tuple[list, object]:
+    """
+    Распознаёт аудио в потоке модели, не блокируя event loop
+
+    Returns:
+        tuple: (список сегментов, info)
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, _transcribe_sync, audio_path, options)
+
+
+async def preload_whisper_model():
+    """Загружает модель заранее (при старте процесса), если faster-whisper установлен"""
+    if not is_whisper_available():
+        print(f"[WHISPER] faster-whisper not installed, skipping preload")
+        return
+
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(_executor, get_whisper_model)
+    except Exception as e:
+        print(f"[WHISPER] Preload failed: {str(e)}")
@@ -1,12 +1,29 @@
+import asyncio
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import Response
 from app.api.v1.routes import router as api_router
+from app.service.http_client import close_http_client
+from app.service.whisper_model import preload_whisper_model
+from app.config import WHISPER_PRELOAD
 
 app = FastAPI(title="Script Generator")
 
 
+@app.on_event("startup")
+async def startup_event():
+    # Загружаем Whisper заранее в фоне, чтобы первый /generate-voiceover не ждал модель
+    if WHISPER_PRELOAD:
+        asyncio.create_task(preload_whisper_model())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Закрываем общий пул HTTP соединений
+    await close_http_client()
+
+
 class CustomCORSMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
         print(f"[CORS] ===== MIDDLEWARE CALLED =====")
@@ -43,7 +60,8 @@ class CustomCORSMiddleware(BaseHTTPMiddleware):
                 response.headers["Access-Control-Allow-Credentials"] = "true"
                 response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS, PATCH"
                 response.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization, Accept, Origin, User-Agent"
-                response.headers["Access-Control-Expose-Headers"] = "*"
+                # "*" не работает вместе с credentials - заголовки перечисляются явно
+                response.headers["Access-Control-Expose-Headers"] = "X-Next-Cursor"
                 response.headers["Access-Control-Max-Age"] = "3600"
                 response.headers["Content-Length"] = "0"
                 response.headers["Vary"] = "Origin"
@@ -55,7 +73,7 @@ class CustomCORSMiddleware(BaseHTTPMiddleware):
             response = await call_next(request)
             response.headers["Access-Control-Allow-Origin"] = origin
             response.headers["Access-Control-Allow-Credentials"] = "true"
-            response.headers["Access-Control-Expose-Headers"] = "*"
+            response.headers["Access-Control-Expose-Headers"] = "X-Next-Cursor"
             response.headers["Vary"] = "Origin"
             print(f"[CORS] Regular response status: {response.status_code}")
             return response
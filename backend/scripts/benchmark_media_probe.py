@@ -0,0 +1,88 @@
+"""
+Бенчмарк измерения аудио: чтение заголовков в процессе (media_probe) против запуска ffprobe
+
+Генерирует синтетическую озвучку (sine) в форматах, которые производит пайплайн,
+и для каждого файла сравнивает время и длительность: probe_file и ffprobe.
+
+Использование:
+    python scripts/benchmark_media_probe.py
+    python scripts/benchmark_media_probe.py --duration 90 --runs 50
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Добавляем корневую папку в путь для импорта
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app.service.media_probe import probe_file
+
+# Формат -> аргументы кодирования ffmpeg
+FORMATS = {
+    "mp3 cbr (Xing/Info)": (".mp3", ["-c:a", "libmp3lame", "-b:a", "32k", "-ar", "24000", "-ac", "1"]),
+    "mp3 cbr (no Xing)": (".mp3", ["-c:a", "libmp3lame", "-b:a", "32k", "-ar", "24000", "-ac", "1", "-write_xing", "0"]),
+    "mp3 vbr": (".mp3", ["-c:a", "libmp3lame", "-q:a", "4"]),
+    "m4a aac": (".m4a", ["-c:a", "aac", "-b:a", "96k"]),
+}
+
+
+def make_audio(directory: str, name: str, suffix: str, codec_args: list, duration: float) -> str:
+    path = os.path.join(directory, name.replace(" ", "_").replace("/", "_").strip("()") + suffix)
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+        *codec_args, path
+    ], check=True)
+    return path
+
+
+def ffprobe_duration(path: str) -> float:
+    result = subprocess.run([
+        "ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path
+    ], check=True, capture_output=True)
+    return float(result.stdout)
+
+
+def measure(probe, path: str, runs: int):
+    """Среднее время одного вызова (мс) и результат"""
+    started = time.perf_counter()
+    for _ in range(runs):
+        result = probe(path)
+    return (time.perf_counter() - started) / runs * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=60.0, help="Длительность аудио, секунды")
+    parser.add_argument("--runs", type=int, default=20, help="Повторов на файл")
+    args = parser.parse_args()
+
+    has_ffprobe = shutil.which("ffprobe") is not None
+    if not has_ffprobe:
+        print("ffprobe not found - only media_probe is measured")
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"Duration: {args.duration:.0f}s, runs: {args.runs}")
+        print(f"{'format':>20} | {'native, ms':>10} | {'duration':>9} | {'ffprobe, ms':>11} | {'duration':>9}")
+        for name, (suffix, codec_args) in FORMATS.items():
+            path = make_audio(directory, name, suffix, codec_args, args.duration)
+            native_ms, info = measure(probe_file, path, args.runs)
+            native_duration = f"{info['duration']:9.3f}" if info else f"{'-':>9}"
+
+            if has_ffprobe:
+                ffprobe_ms, duration = measure(ffprobe_duration, path, max(1, args.runs // 4))
+                ffprobe_cols = f"{ffprobe_ms:11.2f} | {duration:9.3f}"
+            else:
+                ffprobe_cols = f"{'-':>11} | {'-':>9}"
+            print(f"{name:>20} | {native_ms:10.3f} | {native_duration} | {ffprobe_cols}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Бенчмарк графа рендера: время рендера в зависимости от количества сцен
+
+Рендерит ролик фиксированной длительности с 5..30 сценами на синтетических данных
+(фон - testsrc2, изображения - сплошные цвета) и сравнивает текущий граф
+(concat слайдов + один overlay) со старой цепочкой overlay'ев (по одному на сцену).
+
+Использование:
+    python scripts/benchmark_render_graph.py
+    python scripts/benchmark_render_graph.py --duration 30 --scenes 5 10 20 30 --no-chained
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Добавляем корневую папку в путь для импорта
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from PIL import Image
+from app.service.render_graph import FPS, build_slideshow_graph, split_frames
+
+VIDEO_WIDTH = 720
+VIDEO_HEIGHT = 1280
+IMAGE_WIDTH = 480
+IMAGE_HEIGHT = 640
+
+ENCODE_ARGS = [
+    "-c:v", "libx264", "-preset", "ultrafast", "-crf", "28",
+    "-pix_fmt", "yuv420p", "-r", str(FPS), "-threads", "2",
+]
+
+
+def make_background(directory: str, duration: float) -> str:
+    path = os.path.join(directory, "background.mp4")
+    subprocess.run([
+        "ffmpeg", "-y", "-v", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size=1280x720:rate={FPS}:duration={duration}",
+        *ENCODE_ARGS, path
+    ], check=True)
+    return path
+
+
+def make_images(directory: str, count: int) -> list:
+    images = []
+    for i in range(count):
+        path = os.path.join(directory, f"scene_{i}.jpg")
+        color = ((i * 53) % 256, (i * 97) % 256, (i * 151) % 256)
+        Image.new("RGB", (IMAGE_WIDTH, IMAGE_HEIGHT), color).save(path, quality=70)
+        images.append({"path": path, "width": IMAGE_WIDTH, "height": IMAGE_HEIGHT})
+    return images
+
+
+def graph_command(background: str, images: list, duration: float, output: str) -> list:
+    """Текущий граф: дорожка слайдов накладывается одним overlay"""
+    per_scene = duration / len(images)
+    frames = split_frames([(i * per_scene, per_scene) for i in range(len(images))], duration)
+    graph = build_slideshow_graph(background, images, frames, VIDEO_WIDTH, VIDEO_HEIGHT, duration=duration)
+    return [
+        "ffmpeg", "-y", "-v", "error", *graph.input_args(),
+        "-filter_complex", graph.filter_complex(),
+        "-map", "[outv]", "-frames:v", str(sum(frames)), *ENCODE_ARGS, output
+    ]
+
+
+def chained_command(background: str, images: list, duration: float, output: str) -> list:
+    """Старый граф: overlay на каждую сцену с enable='between(t, ...)'"""
+    per_scene = duration / len(images)
+    total_frames = int(per_scene * FPS)
+    filters = [
+        f"[0:v]trim=duration={duration},setpts=PTS-STARTPTS,"
+        f"scale={VIDEO_WIDTH}:{VIDEO_HEIGHT}:force_original_aspect_ratio=decrease,"
+        f"pad={VIDEO_WIDTH}:{VIDEO_HEIGHT}:(ow-iw)/2:(oh-ih)/2[bg]"
+    ]
+    current = "bg"
+    x_pos, y_pos = (VIDEO_WIDTH - IMAGE_WIDTH) // 2, int(VIDEO_HEIGHT * 0.05)
+    for i in range(len(images)):
+        start, end = i * per_scene, (i + 1) * per_scene
+        filters.append(
+            f"[{i + 1}:v]scale={IMAGE_WIDTH}:{IMAGE_HEIGHT},zoompan=z='min(1.0+on/{total_frames}*0.25,1.25)'"
+            f":d={total_frames}:s={IMAGE_WIDTH}x{IMAGE_HEIGHT}:fps={FPS}[img{i}]"
+        )
+        label = "outv" if i == len(images) - 1 else f"tmp{i}"
+        filters.append(f"[{current}][img{i}]overlay={x_pos}:{y_pos}:enable='between(t,{start},{end})'[{label}]")
+        current = label
+
+    cmd = ["ffmpeg", "-y", "-v", "error", "-stream_loop", "-1", "-i", background]
+    for image in images:
+        cmd.extend(["-i", image["path"]])
+    return cmd + ["-filter_complex", ";".join(filters), "-map", "[outv]", "-t", str(duration), *ENCODE_ARGS, output]
+
+
+def run(cmd: list) -> float:
+    started = time.perf_counter()
+    subprocess.run(cmd, check=True)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=60.0, help="Длительность ролика, секунды")
+    parser.add_argument("--scenes", type=int, nargs="+", default=[5, 10, 20, 30])
+    parser.add_argument("--no-chained", action="store_true", help="Не запускать старый граф для сравнения")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        background = make_background(directory, 20.0)
+        output = os.path.join(directory, "out.mp4")
+
+        print(f"Duration: {args.duration:.0f}s, {VIDEO_WIDTH}x{VIDEO_HEIGHT}@{FPS}")
+        print(f"{'scenes':>6} | {'graph, s':>9} | {'chained, s':>10}")
+        for count in args.scenes:
+            images = make_images(directory, count)
+            graph_time = run(graph_command(background, images, args.duration, output))
+            chained_time = None if args.no_chained else run(chained_command(background, images, args.duration, output))
+            chained = f"{chained_time:10.2f}" if chained_time is not None else f"{'-':>10}"
+            print(f"{count:>6} | {graph_time:9.2f} | {chained}")
+
+
+if __name__ == "__main__":
+    main()
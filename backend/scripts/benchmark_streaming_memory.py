@@ -0,0 +1,176 @@
+"""
+Бенчмарк памяти: потоковые скачивание/загрузка против чтения файла целиком
+
+Поднимает локальный HTTP сервер (раздача файла + минимальная реализация TUS)
+и для каждого размера файла запускает отдельный процесс, который скачивает или
+загружает файл одним из способов. Печатает пиковый RSS процесса (ru_maxrss):
+у буферизованных способов он растёт вместе с размером файла, у потоковых - нет.
+
+Использование:
+    python scripts/benchmark_streaming_memory.py
+    python scripts/benchmark_streaming_memory.py --sizes 10 50 200
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Добавляем корневую папку в путь для импорта
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+MODES = ["download-buffered", "download-stream", "upload-buffered", "upload-tus"]
+
+
+class Handler(BaseHTTPRequestHandler):
+    """GET /file - раздача файла, POST/PATCH/HEAD .../resumable - TUS (тело читается и отбрасывается)"""
+
+    # keep-alive, как у настоящего storage: иначе каждый кусок открывает новое соединение
+    protocol_version = "HTTP/1.1"
+    source_path = None
+    uploads = {}
+
+    def log_message(self, *args):
+        pass
+
+    def _discard_body(self) -> int:
+        remaining = int(self.headers.get("Content-Length", 0))
+        while remaining > 0:
+            remaining -= len(self.rfile.read(min(remaining, 1024 * 1024)))
+        return int(self.headers.get("Content-Length", 0))
+
+    def do_GET(self):
+        size = os.path.getsize(self.source_path)
+        self.send_response(200)
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+        with open(self.source_path, "rb") as f:
+            while True:
+                chunk = f.read(1024 * 1024)
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+
+    def do_POST(self):
+        self._discard_body()
+        if self.path.endswith("/upload/resumable"):
+            upload_id = uuid.uuid4().hex
+            self.uploads[upload_id] = 0
+            self.send_response(201)
+            self.send_header("Location", f"http://{self.headers['Host']}/upload/{upload_id}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        else:
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    def do_PATCH(self):
+        upload_id = self.path.rsplit("/", 1)[-1]
+        self.uploads[upload_id] += self._discard_body()
+        self.send_response(204)
+        self.send_header("Upload-Offset", str(self.uploads[upload_id]))
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_HEAD(self):
+        upload_id = self.path.rsplit("/", 1)[-1]
+        self.send_response(200)
+        self.send_header("Upload-Offset", str(self.uploads.get(upload_id, 0)))
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+def make_file(path: str, size_mb: int):
+    block = os.urandom(1024 * 1024)
+    with open(path, "wb") as f:
+        for _ in range(size_mb):
+            f.write(block)
+
+
+async def run_child(mode: str, base_url: str, path: str):
+    import httpx
+    from app.service.storage_io import download_to_file, tus_upload
+
+    if mode == "download-buffered":
+        async with httpx.AsyncClient(timeout=120) as client:
+            response = await client.get(f"{base_url}/file")
+            with open(path + ".out", "wb") as f:
+                f.write(response.content)
+    elif mode == "download-stream":
+        await download_to_file(f"{base_url}/file", path + ".out")
+    elif mode == "upload-buffered":
+        with open(path, "rb") as f:
+            data = f.read()
+        async with httpx.AsyncClient(timeout=120) as client:
+            await client.post(f"{base_url}/object", content=data)
+    elif mode == "upload-tus":
+        await tus_upload(path, "benchmark.bin", "application/octet-stream")
+
+    if os.path.exists(path + ".out"):
+        os.unlink(path + ".out")
+
+
+def child_main(mode: str, base_url: str, path: str):
+    # Память после импортов - база, от которой считается прирост
+    import httpx  # noqa: F401
+    import app.service.storage_io  # noqa: F401
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    asyncio.run(run_child(mode, base_url, path))
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss в КБ (Linux)
+    print(f"{peak / 1024:.1f} {(peak - baseline) / 1024:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200], help="Размеры файлов, МБ")
+    parser.add_argument("--child", nargs=3, metavar=("MODE", "URL", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child_main(*args.child)
+        return
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    env = dict(os.environ, SUPABASE_URL=base_url, SUPABASE_KEY=os.environ.get("SUPABASE_KEY", "benchmark"))
+
+    print("Peak RSS, MB (growth over baseline after imports)")
+    print(f"{'size':>6} | " + " | ".join(f"{mode:>18}" for mode in MODES))
+    with tempfile.TemporaryDirectory() as directory:
+        for size_mb in args.sizes:
+            path = os.path.join(directory, f"source_{size_mb}.bin")
+            make_file(path, size_mb)
+            Handler.source_path = path
+
+            cells = []
+            for mode in MODES:
+                result = subprocess.run(
+                    [sys.executable, __file__, "--child", mode, base_url, path],
+                    env=env, capture_output=True, text=True
+                )
+                if result.returncode != 0:
+                    print(result.stderr[-1000:], file=sys.stderr)
+                    cells.append(f"{'error':>18}")
+                    continue
+                peak, growth = result.stdout.strip().splitlines()[-1].split()
+                cells.append(f"{peak:>9} (+{growth:>6})")
+            print(f"{size_mb:>4}MB | " + " | ".join(cells))
+            os.unlink(path)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
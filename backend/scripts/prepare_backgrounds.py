@@ -0,0 +1,27 @@
+"""
+Скрипт для подготовки библиотеки фоновых видео (перекодирование в сегменты 720x1280/30fps).
+
+Запускается при сборке Docker образа; воркер также подготавливает недостающие фоны при старте.
+
+Использование:
+    python scripts/prepare_backgrounds.py
+    python scripts/prepare_backgrounds.py --force
+"""
+
+import sys
+from pathlib import Path
+
+# Добавляем корневую папку в путь для импорта
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app.service.background_library import prepare_all_backgrounds
+
+
+if __name__ == "__main__":
+    results = prepare_all_backgrounds(force="--force" in sys.argv)
+    for style, index in results.items():
+        if index:
+            print(f"✓ {style}: {len(index['segments'])} segments, {index['duration']:.1f}s")
+        else:
+            print(f"- {style}: not prepared")
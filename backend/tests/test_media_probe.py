@@ -0,0 +1,128 @@
+"""
+Чтение длительности аудио из заголовков (media_probe.probe_file)
+
+Короткие MP3/M4A генерируются ffmpeg (lavfi sine) в тех же вариантах, что производит
+пайплайн; без ffmpeg эти тесты пропускаются. Синтетические MP3 фреймы проверяются всегда.
+
+Запуск (из backend/):
+    python -m unittest discover tests
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.service.ffmpeg_binary import FFMPEG_BINARY
+from app.service.media_probe import fingerprint, probe_file
+
+DURATION = 2.0
+# Задержка кодера и дополнение последнего фрейма: MP3 - до 1152 сэмплов, AAC - 1024
+TOLERANCE = 0.1
+
+# Вариант -> (расширение, аргументы кодирования, ожидаемые codec/sample_rate/channels)
+FORMATS = {
+    "mp3_cbr_xing": (".mp3", ["-c:a", "libmp3lame", "-b:a", "32k", "-ar", "24000", "-ac", "1"], ("mp3", 24000, 1)),
+    "mp3_cbr_no_xing": (
+        ".mp3", ["-c:a", "libmp3lame", "-b:a", "32k", "-ar", "24000", "-ac", "1", "-write_xing", "0"], ("mp3", 24000, 1)
+    ),
+    "mp3_vbr_stereo": (".mp3", ["-c:a", "libmp3lame", "-q:a", "4", "-ar", "44100", "-ac", "2"], ("mp3", 44100, 2)),
+    "m4a_aac": (".m4a", ["-c:a", "aac", "-b:a", "64k", "-ar", "24000", "-ac", "1"], ("aac", 24000, 1)),
+    "m4a_faststart": (
+        ".m4a", ["-c:a", "aac", "-b:a", "64k", "-ar", "24000", "-ac", "1", "-movflags", "+faststart"], ("aac", 24000, 1)
+    ),
+}
+
+
+def _ffmpeg_available() -> bool:
+    try:
+        return subprocess.run([FFMPEG_BINARY, "-version"], capture_output=True).returncode == 0
+    except OSError:
+        return False
+
+
+def _mp3_frames(count: int) -> bytes:
+    """MPEG-1 Layer III, 128 кбит/с, 44100 Гц, стерео, без padding: 417 байт на фрейм"""
+    header = bytes([0xFF, 0xFB, 0x90, 0x00])
+    return (header + bytes(417 - len(header))) * count
+
+
+class ProbeGeneratedFilesTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        if not _ffmpeg_available():
+            raise unittest.SkipTest("ffmpeg not available")
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.files = {}
+        for name, (suffix, codec_args, _) in FORMATS.items():
+            path = os.path.join(cls.directory.name, name + suffix)
+            subprocess.run([
+                FFMPEG_BINARY, "-y", "-v", "error",
+                "-f", "lavfi", "-i", f"sine=frequency=440:duration={DURATION}",
+                *codec_args, path
+            ], check=True)
+            cls.files[name] = path
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def test_duration_and_stream_parameters(self):
+        for name, (_, _, (codec, sample_rate, channels)) in FORMATS.items():
+            with self.subTest(format=name):
+                info = probe_file(self.files[name])
+                self.assertIsNotNone(info)
+                self.assertAlmostEqual(info["duration"], DURATION, delta=TOLERANCE)
+                self.assertEqual(info["codec"], codec)
+                self.assertEqual(info["sample_rate"], sample_rate)
+                self.assertEqual(info["channels"], channels)
+
+    def test_fingerprint_follows_content(self):
+        first, second = self.files["mp3_cbr_xing"], self.files["m4a_aac"]
+        copy = os.path.join(self.directory.name, "copy.mp3")
+        with open(first, "rb") as src, open(copy, "wb") as dst:
+            dst.write(src.read())
+
+        self.assertEqual(fingerprint(first), fingerprint(copy))
+        self.assertNotEqual(fingerprint(first), fingerprint(second))
+
+
+class ProbeSyntheticFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name: str, data: bytes) -> str:
+        path = os.path.join(self.directory.name, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_cbr_mp3_without_xing(self):
+        path = self.write("frames.mp3", _mp3_frames(100))
+
+        info = probe_file(path)
+
+        self.assertAlmostEqual(info["duration"], 100 * 1152 / 44100, delta=0.01)
+        self.assertEqual((info["codec"], info["sample_rate"], info["channels"]), ("mp3", 44100, 2))
+
+    def test_id3v2_tag_is_skipped(self):
+        tag = b"ID3" + bytes([4, 0, 0, 0, 0, 0, 100]) + bytes(100)
+        path = self.write("tagged.mp3", tag + _mp3_frames(50))
+
+        info = probe_file(path)
+
+        self.assertAlmostEqual(info["duration"], 50 * 1152 / 44100, delta=0.01)
+
+    def test_unknown_format_needs_ffprobe(self):
+        self.assertIsNone(probe_file(self.write("audio.wav", b"RIFF" + bytes(64))))
+
+    def test_truncated_mp4_is_not_an_error(self):
+        self.assertIsNone(probe_file(self.write("broken.m4a", b"\x00\x00\x00\x18ftypM4A " + bytes(8))))
+
+
+if __name__ == "__main__":
+    unittest.main()
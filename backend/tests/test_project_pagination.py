@@ -0,0 +1,150 @@
+"""
+Курсорная пагинация списка проектов: кодирование курсора и условие следующей страницы
+
+Supabase клиент подменяется фейком, который применяет .or_() фильтр к строкам в памяти
+так же, как PostgREST: created_at < X или (created_at = X и id < Y).
+
+Запуск (из backend/):
+    python -m unittest discover tests
+"""
+import os
+import re
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+os.environ.setdefault("SUPABASE_URL", "https://test.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="storyteller-tests-"))
+os.environ["READ_CACHE_ENABLED"] = "false"
+
+from app.db import supa_request
+
+KEYSET_FILTER = re.compile(
+    r'^created_at\.lt\."(?P<created_at>[^"]+)",and\(created_at\.eq\."(?P=created_at)",id\.lt\."(?P<id>[^"]+)"\)$'
+)
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeQuery:
+    def __init__(self, db):
+        self.db = db
+        self.columns = None
+        self.after = None
+        self.row_limit = None
+
+    def select(self, columns, **kwargs):
+        self.columns = [column.strip() for column in columns.split(",")]
+        return self
+
+    def eq(self, column, value):
+        return self
+
+    def or_(self, filters):
+        self.db.filters.append(filters)
+        match = KEYSET_FILTER.match(filters)
+        if match is None:
+            raise AssertionError(f"Unexpected filter: {filters}")
+        self.after = (match["created_at"], match["id"])
+        return self
+
+    def order(self, *args, **kwargs):
+        return self
+
+    def limit(self, count):
+        self.row_limit = count
+        return self
+
+    async def execute(self):
+        rows = sorted(self.db.projects, key=lambda p: (p["created_at"], p["id"]), reverse=True)
+        if self.after:
+            created_at, project_id = self.after
+            rows = [
+                p for p in rows
+                if p["created_at"] < created_at or (p["created_at"] == created_at and p["id"] < project_id)
+            ]
+        rows = rows[:self.row_limit]
+        return FakeResponse([{column: p.get(column) for column in self.columns} for p in rows])
+
+
+class FakeDb:
+    def __init__(self, projects):
+        self.projects = projects
+        self.filters = []
+
+    def table(self, name):
+        return FakeQuery(self)
+
+
+class ProjectCursorTest(unittest.TestCase):
+    def test_round_trip(self):
+        project = {"created_at": "2025-03-01T10:00:00.123456+00:00", "id": "d3b07384-d9a0-4c9b-8f1a-2f0c1e9b7a11"}
+
+        cursor = supa_request.encode_project_cursor(project)
+
+        self.assertNotIn("=", cursor)
+        self.assertEqual(supa_request.decode_project_cursor(cursor), (project["created_at"], project["id"]))
+
+    def test_corrupted_cursor_is_value_error(self):
+        for cursor in ("not-base64!", "bm90IGpzb24", supa_request.encode_project_cursor({"created_at": 1, "id": "x"})):
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(ValueError):
+                    supa_request.decode_project_cursor(cursor)
+
+
+class ProjectPagesTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        # Пять проектов с одним created_at: порядок внутри группы задаёт id
+        projects = [
+            {"id": f"p{index:02d}", "created_at": "2025-03-01T10:00:00+00:00", "title": f"Same time {index}"}
+            for index in range(5)
+        ] + [
+            {"id": f"q{index:02d}", "created_at": f"2025-02-{index + 1:02d}T10:00:00+00:00", "title": f"Day {index}"}
+            for index in range(7)
+        ]
+        self.db = FakeDb(projects)
+        patch = mock.patch.object(supa_request, "get_db", mock.AsyncMock(return_value=self.db))
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    async def test_pages_cover_every_project_once(self):
+        seen = []
+        cursor = None
+        while True:
+            page, cursor = await supa_request.get_projects_page("user-1", 2, cursor, ["title"])
+            self.assertLessEqual(len(page), 2)
+            seen.extend(project["id"] for project in page)
+            if cursor is None:
+                break
+
+        self.assertEqual(len(seen), len(self.db.projects))
+        self.assertEqual(len(set(seen)), len(seen))
+        # Внутри одного created_at - по убыванию id, без пропусков на границе страниц
+        self.assertEqual(seen[:5], ["p04", "p03", "p02", "p01", "p00"])
+
+    async def test_tie_break_filter(self):
+        page, cursor = await supa_request.get_projects_page("user-1", 3)
+        await supa_request.get_projects_page("user-1", 3, cursor)
+
+        self.assertEqual(
+            self.db.filters,
+            ['created_at.lt."2025-03-01T10:00:00+00:00",and(created_at.eq."2025-03-01T10:00:00+00:00",id.lt."p02")']
+        )
+
+    async def test_last_page_has_no_cursor(self):
+        page, cursor = await supa_request.get_projects_page("user-1", 12)
+
+        self.assertEqual(len(page), 12)
+        self.assertIsNone(cursor)
+
+
+if __name__ == "__main__":
+    unittest.main()
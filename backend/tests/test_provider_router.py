@@ -0,0 +1,123 @@
+"""
+Порядок провайдеров изображений и circuit breaker (provider_router)
+
+Время breaker'а подменяется: time.monotonic модуля возвращает self.now.
+
+Запуск (из backend/):
+    python -m unittest discover tests
+"""
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.service import provider_router
+from app.service.provider_router import (
+    PROVIDER_FAILURE_THRESHOLD,
+    PROVIDER_MAX_OPEN_SECONDS,
+    PROVIDER_OPEN_SECONDS,
+    STATE_CLOSED,
+    STATE_HALF_OPEN,
+    STATE_OPEN,
+    ProviderRouter,
+)
+
+# Та же форма и таймауты, что у IMAGE_APIS (image_script)
+APIS = [
+    {"name": "fast", "timeout": 30},
+    {"name": "turbo", "timeout": 45},
+    {"name": "flux", "timeout": 60},
+    {"name": "replicate", "timeout": 45},
+]
+
+
+def names(apis):
+    return [api["name"] for api in apis]
+
+
+class ProviderRouterTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patch = mock.patch.object(provider_router.time, "monotonic", lambda: self.now)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.router = ProviderRouter(APIS)
+
+    def health(self, name):
+        return self.router.health[name]
+
+    def test_configured_order_without_stats(self):
+        self.assertEqual(names(self.router.ranked()), ["fast", "turbo", "flux", "replicate"])
+
+    def test_measured_latency_reorders(self):
+        for _ in range(5):
+            self.health("flux").record_success(2.0)
+            self.health("fast").record_success(20.0)
+
+        self.assertEqual(names(self.router.ranked()), ["flux", "fast", "turbo", "replicate"])
+
+    def test_failures_raise_expected_latency(self):
+        self.health("fast").record_success(5.0)
+        self.health("fast").record_failure(5.0)
+        healthy = self.health("turbo")
+        healthy.record_success(5.0)
+        healthy.record_success(5.0)
+
+        self.assertGreater(self.health("fast").expected_latency(), healthy.expected_latency())
+        self.assertEqual(names(self.router.ranked())[:2], ["turbo", "fast"])
+
+    def test_consecutive_failures_open_circuit(self):
+        health = self.health("fast")
+        for _ in range(PROVIDER_FAILURE_THRESHOLD - 1):
+            health.record_failure(1.0)
+        self.assertEqual(health.state, STATE_CLOSED)
+
+        health.record_failure(1.0)
+
+        self.assertEqual(health.state, STATE_OPEN)
+        self.assertFalse(health.allow_request())
+        # Открытый провайдер уходит в конец списка
+        self.assertEqual(names(self.router.ranked())[-1], "fast")
+
+    def test_half_open_allows_single_probe(self):
+        health = self.health("fast")
+        health.record_failure(1.0, fatal=True, cooldown=10)
+
+        self.now += 11
+        self.assertTrue(health.allow_request())
+        self.assertEqual(health.state, STATE_HALF_OPEN)
+        self.assertFalse(health.allow_request())
+
+        health.record_success(1.0)
+        self.assertEqual(health.state, STATE_CLOSED)
+        self.assertEqual(health.cooldown, PROVIDER_OPEN_SECONDS)
+
+    def test_failed_probe_doubles_cooldown(self):
+        health = self.health("fast")
+        health.record_failure(1.0, fatal=True, cooldown=10)
+        self.now += 11
+        health.allow_request()
+
+        health.record_failure(1.0)
+
+        self.assertEqual(health.state, STATE_OPEN)
+        self.assertEqual(health.cooldown, min(20, PROVIDER_MAX_OPEN_SECONDS))
+        self.now += 15
+        self.assertFalse(health.allow_request())
+
+    def test_released_probe_can_be_retried(self):
+        health = self.health("fast")
+        health.record_failure(1.0, fatal=True, cooldown=10)
+        self.now += 11
+        self.assertTrue(health.allow_request())
+
+        # Пробный запрос отменён: ни успеха, ни ошибки
+        health.release_probe()
+
+        self.assertTrue(health.allow_request())
+
+
+if __name__ == "__main__":
+    unittest.main()
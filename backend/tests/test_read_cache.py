@@ -0,0 +1,65 @@
+"""
+Read-through кэш: значение, загрузка которого пересеклась с инвалидацией, не кэшируется
+
+Запуск (из backend/):
+    python -m unittest discover tests
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+os.environ.setdefault("SUPABASE_URL", "https://test.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="storyteller-tests-"))
+
+from app.db import read_cache
+
+
+class ReadAfterWriteTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        if not read_cache.READ_CACHE_ENABLED:
+            self.skipTest("READ_CACHE_ENABLED=false")
+        read_cache._memory.clear()
+        self.key = f"project:{id(self)}"
+
+    async def test_invalidation_during_load_is_not_cached(self):
+        loading = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow_loader():
+            loading.set()
+            await release.wait()
+            return {"id": self.key, "title": "before write"}
+
+        read = asyncio.create_task(read_cache.cached_read(self.key, slow_loader, lambda value: [self.key]))
+        await loading.wait()
+        # Запись и её инвалидация завершаются, пока чтение ещё загружает старое значение
+        await read_cache.invalidate(self.key)
+        release.set()
+        self.assertEqual((await read)["title"], "before write")
+
+        async def fresh_loader():
+            return {"id": self.key, "title": "after write"}
+
+        value = await read_cache.cached_read(self.key, fresh_loader, lambda value: [self.key])
+        self.assertEqual(value["title"], "after write")
+
+    async def test_load_without_invalidation_is_cached(self):
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            return {"id": self.key}
+
+        await read_cache.cached_read(self.key, loader, lambda value: [self.key])
+        await read_cache.cached_read(self.key, loader, lambda value: [self.key])
+        self.assertEqual(len(calls), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
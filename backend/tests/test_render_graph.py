@@ -0,0 +1,144 @@
+"""
+Построение filter_complex слайд-шоу (render_graph)
+
+Граф проверяется по строкам фильтров, а если есть ffmpeg - ещё и рендером нескольких
+кадров на маленьких сгенерированных входах (ffmpeg сам проверит синтаксис графа).
+
+Запуск (из backend/):
+    python -m unittest discover tests
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.service.ffmpeg_binary import FFMPEG_BINARY
+from app.service.render_graph import FPS, build_slideshow_graph, escape_filter_path, split_frames
+
+WIDTH, HEIGHT = 180, 320
+
+
+def _images(count: int):
+    return [{"path": f"/tmp/slide{i}.jpg", "width": 160, "height": 120 + 10 * i} for i in range(count)]
+
+
+def _ffmpeg_available() -> bool:
+    try:
+        return subprocess.run([FFMPEG_BINARY, "-version"], capture_output=True).returncode == 0
+    except OSError:
+        return False
+
+
+class SplitFramesTest(unittest.TestCase):
+    def test_total_matches_duration(self):
+        frames = split_frames([(0.0, 1.01), (1.01, 2.02), (3.03, 0.5)], 3.53)
+
+        self.assertEqual(sum(frames), round(3.53 * FPS))
+
+    def test_slides_are_rounded_independently(self):
+        before = split_frames([(0.0, 2.0), (2.0, 3.0), (5.0, 1.0)], 6.0)
+        # Первая сцена стала длиннее: длина второй сцены не меняется
+        after = split_frames([(0.0, 2.51), (2.51, 3.0), (5.51, 1.0)], 6.51)
+
+        self.assertEqual(before[1], after[1])
+        self.assertEqual(after[0], round(2.51 * FPS))
+
+    def test_every_slide_has_a_frame(self):
+        self.assertEqual(split_frames([(0.0, 0.001), (0.001, 0.0)], 0.001), [1, 1])
+
+
+class BuildSlideshowGraphTest(unittest.TestCase):
+    def test_single_overlay_for_any_number_of_slides(self):
+        for count in (1, 3, 12):
+            with self.subTest(slides=count):
+                graph = build_slideshow_graph("/tmp/bg.mp4", _images(count), [30] * count, WIDTH, HEIGHT)
+                filters = graph.filter_complex()
+
+                self.assertEqual(filters.count("overlay="), 1)
+                self.assertEqual(filters.count("zoompan="), count)
+                self.assertEqual(len(graph.inputs), count + 1)
+                self.assertTrue(filters.endswith("[outv]"))
+                if count > 1:
+                    self.assertIn(f"concat=n={count}:v=1:a=0[slides]", filters)
+                else:
+                    self.assertNotIn("concat=", filters)
+
+    def test_slides_share_one_canvas(self):
+        graph = build_slideshow_graph("/tmp/bg.mp4", _images(3), [10, 20, 30], WIDTH, HEIGHT)
+
+        slides = [chain for chain in graph.filters if "zoompan=" in chain]
+        self.assertTrue(all("pad=160:140:" in chain for chain in slides))
+        self.assertIn(":d=20:", slides[1])
+        # Слайды по центру по горизонтали, в верхней части кадра
+        self.assertIn(f"overlay={(WIDTH - 160) // 2}:{int(HEIGHT * 0.05)}:eof_action=pass", graph.filters[-1])
+
+    def test_background_inputs(self):
+        video = build_slideshow_graph("/tmp/bg.mp4", _images(1), [30], WIDTH, HEIGHT, background_start=12.5)
+        image = build_slideshow_graph("/tmp/bg.png", _images(1), [30], WIDTH, HEIGHT)
+        library = build_slideshow_graph(
+            "/tmp/list.txt", _images(1), [30], WIDTH, HEIGHT,
+            background_options=["-f", "concat", "-safe", "0"], background_prepared=True, duration=1.0
+        )
+
+        self.assertEqual(video.inputs[0], ["-ss", "12.500", "-stream_loop", "-1", "-i", "/tmp/bg.mp4"])
+        self.assertEqual(image.inputs[0], ["-loop", "1", "-i", "/tmp/bg.png"])
+        self.assertEqual(library.inputs[0], ["-f", "concat", "-safe", "0", "-i", "/tmp/list.txt"])
+        # Подготовленный фон уже нужного размера и fps
+        self.assertIn("scale=", video.filters[0])
+        self.assertEqual(library.filters[0], "[0:v]trim=duration=1.0,setpts=PTS-STARTPTS[bg_raw]")
+
+    def test_subtitles_are_drawn_on_background(self):
+        graph = build_slideshow_graph("/tmp/bg.mp4", _images(2), [30, 30], WIDTH, HEIGHT, subtitle_path="/tmp/subs.ass")
+
+        self.assertEqual(graph.filters[1], "[bg_raw]ass='/tmp/subs.ass'[bg]")
+        self.assertEqual(
+            build_slideshow_graph("/tmp/bg.mp4", _images(1), [30], WIDTH, HEIGHT).filters[1], "[bg_raw]null[bg]"
+        )
+
+    def test_escape_filter_path(self):
+        self.assertEqual(escape_filter_path("C:\\Temp\\subs.ass"), "C\\:/Temp/subs.ass")
+        self.assertEqual(escape_filter_path("/tmp/it's.ass"), "/tmp/it'\\\\\\''s.ass")
+
+
+class RenderGraphWithFfmpegTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        if not _ffmpeg_available():
+            raise unittest.SkipTest("ffmpeg not available")
+
+    def test_graph_renders(self):
+        with tempfile.TemporaryDirectory() as directory:
+            background = os.path.join(directory, "bg.mp4")
+            subprocess.run([
+                FFMPEG_BINARY, "-y", "-v", "error", "-f", "lavfi",
+                "-i", f"testsrc=size={WIDTH}x{HEIGHT}:rate={FPS}:duration=1", background
+            ], check=True)
+            images = []
+            for i, size in enumerate(("160x120", "120x160")):
+                path = os.path.join(directory, f"slide{i}.png")
+                subprocess.run([
+                    FFMPEG_BINARY, "-y", "-v", "error", "-f", "lavfi", "-i", f"color=c=red:size={size}",
+                    "-frames:v", "1", path
+                ], check=True)
+                width, height = map(int, size.split("x"))
+                images.append({"path": path, "width": width, "height": height})
+
+            frames = split_frames([(0.0, 0.5), (0.5, 0.5)], 1.0)
+            graph = build_slideshow_graph(background, images, frames, WIDTH, HEIGHT)
+            output = os.path.join(directory, "out.mp4")
+            result = subprocess.run([
+                FFMPEG_BINARY, "-y", "-v", "error", *graph.input_args(),
+                "-filter_complex", graph.filter_complex(), "-map", "[outv]",
+                "-frames:v", str(sum(frames)), output
+            ], capture_output=True)
+
+            self.assertEqual(result.returncode, 0, result.stderr.decode("utf-8", errors="ignore")[-500:])
+            self.assertGreater(os.path.getsize(output), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+"""
+Пакетная запись сцен: любое число сцен - один upsert
+
+Supabase клиент подменяется фейком, который считает вызовы .upsert().execute().
+
+Запуск (из backend/):
+    python -m unittest discover tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+os.environ.setdefault("SUPABASE_URL", "https://test.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="storyteller-tests-"))
+os.environ["READ_CACHE_ENABLED"] = "false"
+
+from app.db import supa_request
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeQuery:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.operation = None
+        self.payload = None
+        self.filters = {}
+
+    def select(self, columns, **kwargs):
+        self.operation = "select"
+        self.payload = columns
+        return self
+
+    def upsert(self, rows, **kwargs):
+        self.operation = "upsert"
+        self.payload = rows
+        return self
+
+    def eq(self, column, value):
+        self.filters[column] = value
+        return self
+
+    def in_(self, column, values):
+        self.filters[column] = set(values)
+        return self
+
+    def order(self, *args, **kwargs):
+        return self
+
+    async def execute(self):
+        self.db.calls.append((self.operation, self.payload))
+        if self.operation == "upsert":
+            for row in self.payload:
+                self.db.scenes[row["id"]].update(row)
+            return FakeResponse(self.payload)
+
+        rows = sorted(self.db.scenes.values(), key=lambda scene: scene["scene_number"])
+        if "id" in self.filters:
+            rows = [scene for scene in rows if scene["id"] in self.filters["id"]]
+        return FakeResponse([dict(scene) for scene in rows])
+
+
+class FakeDb:
+    def __init__(self, scene_count):
+        self.calls = []
+        self.scenes = {
+            f"scene-{number}": {
+                "id": f"scene-{number}",
+                "project_id": "project-1",
+                "scene_number": number,
+                "voice_over": f"text {number}",
+                "image_prompt": f"prompt {number}",
+            }
+            for number in range(1, scene_count + 1)
+        }
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def upserts(self):
+        return [payload for operation, payload in self.calls if operation == "upsert"]
+
+
+class SceneBatchTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.db = FakeDb(30)
+        patches = [
+            mock.patch.object(supa_request, "get_db", mock.AsyncMock(return_value=self.db)),
+            mock.patch.object(supa_request, "invalidate", mock.AsyncMock()),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    async def test_uniform_batch_is_one_upsert(self):
+        updates = [{"scene_number": number, "voice_over": f"new {number}"} for number in range(1, 31)]
+
+        await supa_request.update_scenes_batch("project-1", updates)
+
+        self.assertEqual(len(self.db.upserts()), 1)
+        self.assertEqual(len(self.db.upserts()[0]), 30)
+        self.assertEqual(self.db.scenes["scene-30"]["voice_over"], "new 30")
+
+    async def test_mixed_fields_are_one_upsert_without_overwriting(self):
+        updates = [
+            {"scene_number": number, "voice_over": f"new {number}"} if number % 2
+            else {"scene_number": number, "image_prompt": f"new prompt {number}"}
+            for number in range(1, 31)
+        ]
+
+        await supa_request.update_scenes_batch("project-1", updates)
+
+        upserts = self.db.upserts()
+        self.assertEqual(len(upserts), 1)
+        self.assertEqual(len(upserts[0]), 30)
+        # Все строки одного upsert с одинаковым набором колонок
+        self.assertEqual(len({tuple(sorted(row)) for row in upserts[0]}), 1)
+        # Поля, которые строка не меняла, сохранили текущие значения
+        self.assertEqual(self.db.scenes["scene-1"]["image_prompt"], "prompt 1")
+        self.assertEqual(self.db.scenes["scene-2"]["voice_over"], "text 2")
+        self.assertEqual(self.db.scenes["scene-2"]["image_prompt"], "new prompt 2")
+
+    async def test_reorder_is_one_upsert(self):
+        scene_ids = [f"scene-{number}" for number in range(30, 0, -1)]
+
+        await supa_request.reorder_scenes("project-1", scene_ids)
+
+        self.assertEqual(len(self.db.upserts()), 1)
+        self.assertEqual(self.db.scenes["scene-30"]["scene_number"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+"""
+Субтитры сегментов (parse_srt / slice_subtitles) и блокировки кэша сегментов
+
+Запуск (из backend/):
+    python -m unittest discover tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+os.environ.setdefault("SUPABASE_URL", "https://test.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="storyteller-tests-"))
+
+from app.service.segment_render import SegmentCache, SegmentPins, fcntl, parse_srt, slice_subtitles
+
+SRT = "\ufeff" + """1
+00:00:00,000 --> 00:00:02,500
+Кот шёл по лесу
+
+2
+00:00:02,500 --> 00:00:05,000
+и нашёл
+старый дом
+
+3
+00:00:05.000 --> 00:00:07,25
+Сова молчала
+"""
+
+
+class ParseSrtTest(unittest.TestCase):
+    def test_events(self):
+        self.assertEqual(parse_srt(SRT), [
+            (0.0, 2.5, "Кот шёл по лесу"),
+            (2.5, 5.0, "и нашёл старый дом"),
+            (5.0, 7.25, "Сова молчала"),
+        ])
+
+    def test_malformed_blocks_are_skipped(self):
+        content = "1\nnot a timing\ntext\n\n2\n00:00:01,000 --> 00:00:02,000\nok\n\n3\n00:00:03,000\n"
+
+        self.assertEqual(parse_srt(content), [(1.0, 2.0, "ok")])
+
+    def test_empty(self):
+        self.assertEqual(parse_srt(""), [])
+        self.assertEqual(parse_srt(None), [])
+
+
+class SliceSubtitlesTest(unittest.TestCase):
+    def setUp(self):
+        self.events = parse_srt(SRT)
+
+    def test_times_are_relative_to_segment(self):
+        sliced = slice_subtitles(self.events, 2.5, 5.0)
+
+        self.assertEqual(parse_srt(sliced), [(0.0, 2.5, "и нашёл старый дом")])
+        self.assertTrue(sliced.startswith("1\n"))
+
+    def test_boundary_event_is_clipped_into_both_segments(self):
+        first = parse_srt(slice_subtitles(self.events, 0.0, 4.0))
+        second = parse_srt(slice_subtitles(self.events, 4.0, 7.25))
+
+        self.assertEqual(first, [(0.0, 2.5, "Кот шёл по лесу"), (2.5, 4.0, "и нашёл старый дом")])
+        self.assertEqual(second, [(0.0, 1.0, "и нашёл старый дом"), (1.0, 3.25, "Сова молчала")])
+
+    def test_events_touching_segment_edges_are_excluded(self):
+        self.assertEqual(parse_srt(slice_subtitles(self.events, 7.25, 10.0)), [])
+        self.assertEqual([text for _, _, text in parse_srt(slice_subtitles(self.events, 2.5, 5.0))],
+                         ["и нашёл старый дом"])
+
+    def test_numbering_restarts_per_segment(self):
+        sliced = slice_subtitles(self.events, 1.0, 6.0)
+
+        numbers = [block.split("\n")[0] for block in sliced.strip().split("\n\n")]
+        self.assertEqual(numbers, ["1", "2", "3"])
+
+
+@unittest.skipIf(fcntl is None, "segment pins need fcntl")
+class SegmentPinsTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = SegmentCache(directory.name, max_bytes=0)
+        for key in ("a", "b"):
+            with open(self.cache.path(key), "wb") as f:
+                f.write(b"segment")
+
+    def test_prune_keeps_pinned_segments(self):
+        pins = SegmentPins()
+        self.addCleanup(pins.release)
+
+        self.assertEqual(self.cache.get("a", pins), self.cache.path("a"))
+        self.cache.prune()
+
+        self.assertTrue(os.path.exists(self.cache.path("a")))
+        self.assertFalse(os.path.exists(self.cache.path("b")))
+
+    def test_released_segments_can_be_pruned(self):
+        pins = SegmentPins()
+        self.cache.get("a", pins)
+        pins.release()
+
+        self.cache.prune()
+
+        self.assertIsNone(self.cache.get("a"))
+
+    def test_missing_segment_is_not_pinned(self):
+        pins = SegmentPins()
+        self.addCleanup(pins.release)
+
+        self.assertIsNone(self.cache.get("missing", pins))
+
+
+if __name__ == "__main__":
+    unittest.main()
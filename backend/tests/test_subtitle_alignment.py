@@ -0,0 +1,141 @@
+"""
+Выравнивание текста сценария по словам Whisper (subtitle_alignment)
+
+Ленточное выравнивание сверяется с полным Нидлманом-Вуншем (тот же штраф за пропуски
+и замены, без полосы), таймкоды фраз - с равномерной раскладкой, которая была раньше.
+
+Запуск (из backend/):
+    python -m unittest discover tests
+"""
+import random
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.service.subtitle_alignment import (
+    GAP_COST,
+    align_phrases,
+    align_tokens,
+    tokenize,
+    _substitution_cost,
+)
+
+VOCABULARY = (
+    "кот шёл по лесу и нашёл старый дом в котором жила сова она знала "
+    "все тайны леса но никому их не рассказывала до этого дня"
+).split()
+
+
+def full_alignment_cost(a, b):
+    """Стоимость оптимального выравнивания по всей матрице O(n * m)"""
+    prev = [j * GAP_COST for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        cur = [i * GAP_COST] + [0.0] * len(b)
+        for j in range(1, len(b) + 1):
+            cur[j] = min(
+                prev[j - 1] + _substitution_cost(a[i - 1], b[j - 1]),
+                prev[j] + GAP_COST,
+                cur[j - 1] + GAP_COST,
+            )
+        prev = cur
+    return prev[-1]
+
+
+def mapping_cost(a, b, mapping):
+    """Стоимость выравнивания, заданного отображением токенов сценария на слова Whisper"""
+    pairs = [(i, j) for i, j in enumerate(mapping) if j is not None]
+    substitutions = sum(_substitution_cost(a[i], b[j]) for i, j in pairs)
+    return substitutions + (len(a) - len(pairs) + len(b) - len(pairs)) * GAP_COST
+
+
+def recognize(tokens, rng, error_rate=0.15):
+    """Имитация распознавания: пропуски, вставки и замены слов"""
+    result = []
+    for token in tokens:
+        roll = rng.random()
+        if roll < error_rate / 3:
+            continue
+        if roll < error_rate * 2 / 3:
+            result.append(rng.choice(VOCABULARY))
+        elif roll < error_rate:
+            result.extend([token, rng.choice(VOCABULARY)])
+        else:
+            result.append(token)
+    return result
+
+
+class AlignTokensTest(unittest.TestCase):
+    def test_banded_matches_full_alignment(self):
+        rng = random.Random(7)
+        for length in (5, 40, 200):
+            for _ in range(5):
+                script = tokenize(" ".join(rng.choice(VOCABULARY) for _ in range(length)))
+                asr = tokenize(" ".join(recognize(script, rng)))
+                with self.subTest(length=length):
+                    mapping = align_tokens(script, asr)
+                    self.assertEqual(len(mapping), len(script))
+                    self.assertAlmostEqual(mapping_cost(script, asr, mapping), full_alignment_cost(script, asr))
+
+    def test_mapping_is_monotonic(self):
+        rng = random.Random(11)
+        script = [rng.choice(VOCABULARY) for _ in range(300)]
+        asr = recognize(script, rng, error_rate=0.3)
+
+        matched = [j for j in align_tokens(script, asr) if j is not None]
+
+        self.assertEqual(matched, sorted(set(matched)))
+
+    def test_empty_inputs(self):
+        self.assertEqual(align_tokens([], ["кот"]), [])
+        self.assertEqual(align_tokens(["кот", "шёл"], []), [None, None])
+
+    def test_word_forms_are_partial_matches(self):
+        self.assertEqual(align_tokens(["котика", "нашли"], ["котик", "нашли"]), [0, 1])
+
+
+class AlignPhrasesTest(unittest.TestCase):
+    def test_phrases_follow_speech_not_uniform_split(self):
+        # Вторая фраза начинается после долгой паузы: равномерная раскладка по числу фраз
+        # (прежний способ) поставила бы её на 4.5 с, а слово произнесено на 7.0 с
+        phrases = ["Кот шёл по лесу.", "Сова молчала."]
+        words = [
+            ("Кот", 0.0, 0.4), ("шел", 0.4, 0.8), ("по", 0.8, 1.0), ("лесу.", 1.0, 1.6),
+            ("Сова", 7.0, 7.5), ("молчала", 7.5, 9.0),
+        ]
+
+        (first_start, first_end), (second_start, second_end) = align_phrases(phrases, words)
+        uniform_second_start = 9.0 / len(phrases)
+
+        self.assertAlmostEqual(first_start, 0.0)
+        self.assertAlmostEqual(first_end, 1.6)
+        self.assertAlmostEqual(second_start, 7.0)
+        self.assertAlmostEqual(second_end, 9.0)
+        self.assertGreater(abs(second_start - uniform_second_start), 2.0)
+
+    def test_misrecognized_words_keep_their_time(self):
+        phrases = ["Сова знала тайны", "леса"]
+        words = [("Сава", 0.0, 0.5), ("знало", 0.5, 1.0), ("тайну", 1.0, 1.5), ("леса", 2.0, 2.5)]
+
+        timings = align_phrases(phrases, words)
+
+        self.assertEqual(timings, [(0.0, 1.5), (2.0, 2.5)])
+
+    def test_phrases_never_overlap(self):
+        rng = random.Random(3)
+        script = [rng.choice(VOCABULARY) for _ in range(120)]
+        phrases = [" ".join(script[i:i + 6]) for i in range(0, len(script), 6)]
+        asr = recognize(script, rng, error_rate=0.3)
+        words = [(token, k * 0.3, k * 0.3 + 0.25) for k, token in enumerate(asr)]
+
+        timings = align_phrases(phrases, words)
+
+        self.assertEqual(len(timings), len(phrases))
+        for (start, end), (next_start, _) in zip(timings, timings[1:]):
+            self.assertLessEqual(start, end)
+            self.assertLessEqual(end, next_start)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+"""
+Пул воркеров для фоновых задач (рендер видео, генерация изображений)
+
+Запускается отдельно от API:
+    python worker.py
+
+Главный процесс запускает RENDER_WORKERS процессов для рендера (по одному рендеру
+на процесс; по умолчанию столько, сколько позволяют ядра и память - см. render_scheduler) и IMAGE_WORKERS процессов для генерации
+изображений, следит за ними и перезапускает упавшие. Задачи упавших процессов
+возвращаются в очередь по истечении аренды (JOB_LEASE_SECONDS).
+"""
+import asyncio
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import traceback
+
+from app.config import RENDER_WORKERS, IMAGE_WORKERS, JOB_LEASE_SECONDS
+from app.service.job_queue import (
+    JOB_RENDER_VIDEO,
+    JOB_GENERATE_IMAGES,
+    claim_job,
+    complete_job,
+    fail_job,
+    heartbeat_job,
+    requeue_stale_jobs,
+)
+
+POLL_INTERVAL = 1.0
+HEARTBEAT_INTERVAL = max(JOB_LEASE_SECONDS // 3, 1)
+
+
+def _heartbeat_thread(job_id: str, worker_id: str, stop: threading.Event):
+    """
+    Продлевает аренду задачи из отдельного потока: heartbeat не зависит от того,
+    занят ли event loop обработчиком (блокирующий код в задаче не приводит
+    к возврату задачи в очередь и повторному выполнению другим воркером)
+    """
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        try:
+            heartbeat_job(job_id, worker_id)
+        except Exception as e:
+            print(f"[WORKER] Heartbeat failed for job {job_id}: {str(e)}")
+
+
+async def _worker_loop(worker_id: str, kinds: list):
+    # Импортируем обработчики внутри процесса воркера (тяжелые зависимости: PIL, whisper и т.д.)
+    from app.service.job_handlers import JOB_HANDLERS
+
+    print(f"[WORKER {worker_id}] Started, kinds: {kinds}")
+
+    while True:
+        job = await asyncio.to_thread(claim_job, worker_id, kinds)
+        if not job:
+            await asyncio.sleep(POLL_INTERVAL)
+            continue
+
+        print(f"[WORKER {worker_id}] Claimed job {job['id']} ({job['kind']}) for project {job['project_id']}")
+        heartbeat_stop = threading.Event()
+        threading.Thread(
+            target=_heartbeat_thread, args=(job["id"], worker_id, heartbeat_stop), name=f"heartbeat-{job['id']}", daemon=True
+        ).start()
+
+        try:
+            handler = JOB_HANDLERS[job["kind"]]
+            await handler(job)
+            if await asyncio.to_thread(complete_job, job["id"], worker_id):
+                print(f"[WORKER {worker_id}] ✓ Job {job['id']} completed")
+            else:
+                print(f"[WORKER {worker_id}] Job {job['id']} finished after its lease was lost, result not recorded")
+        except Exception as e:
+            print(f"[WORKER {worker_id}] ✗ Job {job['id']} failed: {str(e)}")
+            traceback.print_exc()
+            if not await asyncio.to_thread(fail_job, job["id"], worker_id, str(e)):
+                print(f"[WORKER {worker_id}] Job {job['id']} failed after its lease was lost, error not recorded")
+        finally:
+            heartbeat_stop.set()
+
+
+def _run_worker(worker_id: str, kinds: list):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Останавливает главный процесс
+    asyncio.run(_worker_loop(worker_id, kinds))
+
+
+def _handle_sigterm(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main():
+    ctx = multiprocessing.get_context("spawn")
+    signal.signal(signal.SIGTERM, _handle_sigterm)
+
+    # Задачи, оставшиеся в статусе 'running' после перезапуска, возвращаем в очередь
+    requeue_stale_jobs(lease_seconds=0)
+
+    from app.service.render_scheduler import detect_cpu_count, detect_memory_bytes, max_concurrent_renders
+    render_workers = RENDER_WORKERS or max_concurrent_renders()
+    memory = detect_memory_bytes()
+    print(f"[WORKER] Hardware: {detect_cpu_count()} cores, "
+          f"{memory // 1024 ** 2 if memory else '?'} MB memory -> {render_workers} render workers")
+
+    specs = {}
+    for i in range(render_workers):
+        specs[f"render-{i}"] = [JOB_RENDER_VIDEO]
+    for i in range(IMAGE_WORKERS):
+        specs[f"images-{i}"] = [JOB_GENERATE_IMAGES]
+
+    processes = {}
+
+    def start(name: str):
+        worker_id = f"{name}@{os.getpid()}"
+        process = ctx.Process(target=_run_worker, args=(worker_id, specs[name]), name=name, daemon=True)
+        process.start()
+        processes[name] = process
+
+    for name in specs:
+        start(name)
+
+    print(f"[WORKER] Pool started: {render_workers} render, {IMAGE_WORKERS} image workers")
+
+    try:
+        while True:
+            time.sleep(5)
+            requeue_stale_jobs()
+            for name, process in list(processes.items()):
+                if not process.is_alive():
+                    print(f"[WORKER] Process {name} exited with code {process.exitcode}, restarting")
+                    start(name)
+    except KeyboardInterrupt:
+        print(f"[WORKER] Shutting down...")
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,6 @@
+// Размер страницы списка проектов (не больше PROJECTS_MAX_PAGE_SIZE бэкенда)
+const PROJECTS_PAGE_LIMIT = 100
+
 export const useApi = () => {
   const config = useRuntimeConfig()
   const supabase = useSupabaseClient() 
@@ -8,7 +11,8 @@ export const useApi = () => {
     return { Authorization: `Bearer ${session.access_token}` }
   }
 
-  const apiFetch = async (endpoint, options = {}) => {
+  // raw: true - вернуть ответ целиком (нужны заголовки), а не только тело
+  const apiFetch = async (endpoint, { raw = false, ...options } = {}) => {
     const headers = await getAuthHeader()
     let baseUrl = config.public.apiBase
     
@@ -22,7 +26,8 @@ export const useApi = () => {
     const finalEndpoint = endpoint.startsWith('/') ? endpoint : `/${endpoint}`
     const fullUrl = baseUrl + finalEndpoint
     
-    const response = await $fetch(fullUrl, {
+    const fetcher = raw ? $fetch.raw : $fetch
+    const response = await fetcher(fullUrl, {
       ...options,
       headers: {
         ...headers,
@@ -62,7 +67,17 @@ export const useApi = () => {
   const getUserProjects = async () => {
     try {
       console.log('[useApi] Calling getUserProjects')
-      const result = await apiFetch('/projects')
+      // Список отдаётся страницами: курсор следующей - в заголовке X-Next-Cursor
+      const result = []
+      let cursor = null
+      do {
+        const response = await apiFetch('/projects', {
+          raw: true,
+          query: cursor ? { limit: PROJECTS_PAGE_LIMIT, cursor } : { limit: PROJECTS_PAGE_LIMIT }
+        })
+        result.push(...(response._data || []))
+        cursor = response.headers.get('X-Next-Cursor')
+      } while (cursor)
       console.log('[useApi] getUserProjects result:', result)
       return result
     } catch (error) {